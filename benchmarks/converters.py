@@ -0,0 +1,113 @@
+"""
+Compares the rows per second of the per-cell dispatch RowParser used to
+do with the compiled converters built by loadIRS.build_mappings.
+
+Usage:
+
+    $ python benchmarks/converters.py [path/to/FullDataFile.txt] [--repeat N]
+"""
+import os
+import sys
+import time
+import argparse
+from decimal import Decimal
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from django.conf import settings  # noqa: E402
+
+settings.configure(USE_TZ=True, INSTALLED_APPS=('irs',))
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from irs.archive import read_archive  # noqa: E402
+from irs.management.commands.loadIRS import (  # noqa: E402
+    Command, MAPPING_NAMES, NULL_TERMS, clear_caches)
+
+
+def legacy_clean_cell(cell, cell_type):
+    """
+    The per-cell cleaning RowParser did before converters were compiled.
+    """
+    try:
+        cell = cell.encode('ascii', 'ignore').decode()
+        if cell_type == 'D':
+            naive_dt = datetime.strptime(cell, '%Y%m%d')
+            cell = timezone.make_aware(naive_dt)
+        elif cell_type == 'I':
+            cell = int(cell)
+        elif cell_type == 'N':
+            cell = Decimal(cell)
+        else:
+            cell = cell.upper()
+            if len(cell) > 50:
+                cell = cell[0:50]
+            if not cell or cell in NULL_TERMS:
+                cell = None
+    except:  # noqa: E722
+        cell = None
+    return cell
+
+
+def legacy_parse(rows, mappings):
+    for row in rows:
+        fields = mappings[MAPPING_NAMES[row[0]]]
+        parsed_row = {}
+        for i, cell in enumerate(row[0:len(fields)]):
+            field_name, field_type = fields[str(i)]
+            parsed_row[field_name] = legacy_clean_cell(cell, field_type)
+
+
+def compiled_parse(rows, converters):
+    # Start each pass with empty conversion caches
+    clear_caches()
+    for row in rows:
+        converters[row[0]](row)
+
+
+def measure(label, func, rows, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    rate = len(rows) * repeat / elapsed
+    print('{:<10} {:>12,.0f} rows/s'.format(label, rate))
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'path',
+        nargs='?',
+        default=os.path.join(ROOT, 'irs', 'tests', 'TestDataFile.txt'))
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    command = Command()
+    command.build_mappings()
+    rows = [
+        row for row in read_archive(args.path)
+        if row and row[0] in MAPPING_NAMES]
+    print('{:,} rows x {}'.format(len(rows), args.repeat))
+
+    before = measure(
+        'before',
+        lambda: legacy_parse(rows, command.mappings),
+        rows,
+        args.repeat)
+    after = measure(
+        'after',
+        lambda: compiled_parse(rows, command.converters),
+        rows,
+        args.repeat)
+    print('speedup    {:>12.2f}x'.format(after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,168 @@
+import hashlib
+import operator
+import functools
 from django.contrib import admin
-from irs.models import F8872, Contribution, Expenditure, Committee
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from irs.models import (
+    F8872, Contribution, Expenditure, Committee, PlaceTotal, SearchQuerySet)
+from irs.pagination import EstimatedCountPaginator
+
+# Seconds that the choices of filters and date hierarchies are cached for
+ADMIN_CACHE_SECONDS = 60 * 60
+
+
+def get_cache_key(*parts):
+    return 'irs:admin:{}'.format(hashlib.md5(
+        ':'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+
+class FullTextSearchMixin:
+    """
+    Searches the full-text index kept by loadIRS instead of running
+    icontains over every one of the search fields, which can't use an
+    index. A search of only digits looks up an EIN or form id number.
+    """
+    exact_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit() and self.exact_search_fields:
+            return queryset.filter(functools.reduce(operator.or_, (
+                Q(**{field: search_term})
+                for field in self.exact_search_fields))), False
+        return queryset.search(search_term), False
+
+
+class CachedDatesQuerySet(SearchQuerySet):
+    """
+    The rows of a changelist, with the date range and the dates read by
+    its date hierarchy cached, since finding them scans every row that
+    matches the filters.
+    """
+
+    def get_cached(self, name, func, *args):
+        try:
+            key = get_cache_key(name, self.query, *args)
+        except EmptyResultSet:
+            return func()
+        return cache.get_or_set(key, func, ADMIN_CACHE_SECONDS)
+
+    def aggregate(self, *args, **kwargs):
+        return self.get_cached(
+            'aggregate',
+            lambda: super(CachedDatesQuerySet, self).aggregate(
+                *args, **kwargs),
+            args,
+            sorted(kwargs.items()))
+
+    def dates(self, field_name, kind, order='ASC'):
+        return self.get_cached(
+            'dates',
+            lambda: list(super(CachedDatesQuerySet, self).dates(
+                field_name, kind, order)),
+            field_name,
+            kind,
+            order)
+
+
+class PerformanceChangeList(ChangeList):
+    """
+    A changelist that only reads the columns it lists, and whose date
+    hierarchy is cached.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PerformanceChangeList, self).__init__(*args, **kwargs)
+        # The rows of the page have been fetched by now, so this is
+        # only read by the date hierarchy
+        self.queryset = CachedDatesQuerySet(
+            model=self.model,
+            query=self.queryset.query.chain(),
+            using=self.queryset.db)
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super(PerformanceChangeList, self).get_queryset(
+            request, exclude_parameters)
+        return queryset.only(*self.model_admin.get_list_columns(request))
+
+
+class CachedValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    """
+    Offers the values of a field, like AllValuesFieldListFilter, but
+    caches them rather than finding the distinct values of the whole
+    table on every page.
+    """
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        super(CachedValuesFieldListFilter, self).__init__(
+            field, request, params, model, model_admin, field_path)
+        self.lookup_choices = cache.get_or_set(
+            get_cache_key('choices', model._meta.label_lower, field_path),
+            self.get_lookup_choices,
+            ADMIN_CACHE_SECONDS)
+
+    def get_lookup_choices(self):
+        return list(self.lookup_choices)
+
+
+class PlaceTotalStateFilter(CachedValuesFieldListFilter):
+    """
+    Offers the states in the place totals, which are already grouped by
+    state, falling back to the states in the table before the totals
+    have been built. Only filings that weren't amended are counted in
+    the totals.
+    """
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.count_field = '{}_count'.format(model._meta.model_name)
+        super(PlaceTotalStateFilter, self).__init__(
+            field, request, params, model, model_admin, field_path)
+
+    def get_lookup_choices(self):
+        states = list(PlaceTotal.objects.filter(**{
+            self.count_field + '__gt': 0}).values_list(
+            'state', flat=True).distinct().order_by('state'))
+        return states or super(
+            PlaceTotalStateFilter, self).get_lookup_choices()
+
+
+class PerformanceModeMixin:
+    """
+    Keeps the changelists of tables with millions of rows fast. The
+    number of rows is estimated rather than counted, only the listed
+    columns are read, and the date hierarchy and the choices of filters
+    are cached or read from the summary tables. The number of rows for
+    each choice of a filter isn't shown, since each takes a scan.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_changelist(self, request, **kwargs):
+        return PerformanceChangeList
+
+    def get_list_columns(self, request):
+        """
+        Returns the fields read for each row of the changelist.
+        """
+        fields = set(f.name for f in self.model._meta.concrete_fields)
+        return [self.model._meta.pk.name] + [
+            name for name in self.get_list_display(request)
+            if name in fields]
 
 
 @admin.register(Committee)
-class CommitteeAdmin(admin.ModelAdmin):
+class CommitteeAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('EIN', 'name')
     search_fields = ('EIN', 'name')
+    exact_search_fields = ('EIN',)
     readonly_fields = ('EIN',)
 
 
@@ -45,12 +202,16 @@ class F8872Admin(admin.ModelAdmin):
 
 
 @admin.register(Contribution)
-class ContributionAdmin(admin.ModelAdmin):
+class ContributionAdmin(PerformanceModeMixin, FullTextSearchMixin,
+                        admin.ModelAdmin):
     list_display = ('contributor_name', 'contribution_amount', 'contribution_date',
                     'organization_name', 'contributor_address_state')
-    list_filter = ('contribution_date', 'contributor_address_state', 'entity_type')
+    list_filter = ('contribution_date',
+                   ('contributor_address_state', PlaceTotalStateFilter),
+                   ('entity_type', CachedValuesFieldListFilter))
     search_fields = ('contributor_name', 'contributor_first_name', 'contributor_last_name',
                     'contributor_corporation_name', 'organization_name', 'EIN')
+    exact_search_fields = ('EIN', 'form_id_number')
     readonly_fields = ('schedule_a_id', 'form_id_number', 'record_type')
     date_hierarchy = 'contribution_date'
     raw_id_fields = ('filing', 'committee')
@@ -78,11 +239,14 @@ class ContributionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Expenditure)
-class ExpenditureAdmin(admin.ModelAdmin):
+class ExpenditureAdmin(PerformanceModeMixin, FullTextSearchMixin,
+                        admin.ModelAdmin):
     list_display = ('recipient_name', 'expenditure_amount', 'expenditure_date',
                     'expenditure_purpose', 'organization_name')
-    list_filter = ('expenditure_date', 'recipient_address_state')
+    list_filter = ('expenditure_date',
+                   ('recipient_address_state', PlaceTotalStateFilter))
     search_fields = ('recipient_name', 'expenditure_purpose', 'organization_name', 'EIN')
+    exact_search_fields = ('EIN', 'form_id_number')
     readonly_fields = ('schedule_b_id', 'form_id_number', 'record_type')
     date_hierarchy = 'expenditure_date'
     raw_id_fields = ('filing', 'committee')
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class IrsConfig(AppConfig):
+    name = 'irs'
+    verbose_name = 'IRS filings'
+    default_auto_field = 'django.db.models.BigAutoField'
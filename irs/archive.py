@@ -0,0 +1,486 @@
+import io
+import os
+import csv
+import gzip
+import mmap
+import zlib
+import queue
+import struct
+import hashlib
+import zipfile
+import threading
+import requests
+
+try:
+    # The standard library has zstd from Python 3.14
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+# The raw archive is a pipe-delimited text file in this encoding
+ENCODING = 'ISO-8859-1'
+
+# Rough size, in bytes, of the chunks the archive is split into for
+# parallel parsing
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Size, in bytes, of the blocks a memory-mapped archive is split into
+# lines at a time
+MMAP_BLOCK_SIZE = 1024 * 1024
+
+# Size, in bytes, of the chunks the archive is downloaded in
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Header at the start of each file in a zip archive
+ZIP_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+ZIP_LOCAL_SIGNATURE = 0x04034b50
+
+# The first bytes of each kind of compressed archive that can be read
+MAGIC_NUMBERS = {
+    b'PK\x03\x04': 'zip',
+    b'\x1f\x8b': 'gzip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+
+
+def get_form_id(row):
+    """
+    Returns the filing id a raw row belongs to, or None
+    if the row isn't part of a filing.
+    """
+    try:
+        form_type = row[0]
+        if form_type == '2':
+            return row[2]
+        elif form_type in ('A', 'B'):
+            return row[1]
+    except IndexError:
+        pass
+    return None
+
+
+def get_compression(path):
+    """
+    Returns how the archive at `path` is compressed, going by its first
+    few bytes, or None if it's plain text.
+    """
+    with open(path, 'rb') as f:
+        start = f.read(4)
+    for magic, compression in MAGIC_NUMBERS.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def open_archive(path):
+    """
+    Opens the archive for reading bytes, decompressing it as it's read
+    if it's a zip, gzip or zstd file. Zip files are read from the
+    first file in them, which is how the IRS ships the archive.
+    """
+    compression = get_compression(path)
+    if compression == 'zip':
+        zipped = zipfile.ZipFile(path)
+        return zipped.open(zipped.namelist()[0])
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if zstd is None:
+            raise ValueError(
+                'Reading zstd archives needs the zstandard package')
+        return io.BufferedReader(zstd.open(path, 'rb'))
+    return open(path, 'rb')
+
+
+def find_record_start(mm, position, target):
+    """
+    Returns the start of the first row at or after `target`, reading
+    forward from `position`, which is the start of a row. Rows can
+    span several lines inside quoted fields, so lines with quotes in
+    them are read with csv, and the rest are skipped a line at a time.
+    """
+    size = len(mm)
+    while position < target:
+        newline = mm.find(b'\n', target - 1)
+        candidate = size if newline == -1 else newline + 1
+        quote = mm.find(b'"', position, candidate)
+        if quote == -1:
+            return candidate
+        # No quotes come before this line, so it starts a row
+        position = mm.rfind(b'\n', position, quote) + 1 or position
+        mm.seek(position)
+        reader = csv.reader(iter_mmap_lines(mm, size), delimiter='|')
+        if next(reader, None) is None:
+            return size
+        position = mm.tell()
+    return position
+
+
+def split_archive(path, count):
+    """
+    Splits the archive into roughly `count` byte ranges that start
+    and end on row boundaries, which are line boundaries outside
+    quoted fields.
+    """
+    size = os.stat(path).st_size
+    count = max(1, min(count, size))
+    if count == 1:
+        return [(0, size)]
+    offsets = [0]
+    with open(path, 'rb') as raw_file, mmap.mmap(
+            raw_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i in range(1, count):
+            target = size * i // count
+            if target <= offsets[-1]:
+                continue
+            offset = find_record_start(mm, offsets[-1], target)
+            if offset > offsets[-1] and offset < size:
+                offsets.append(offset)
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def split_line(line):
+    """
+    Splits a line at carriage returns that aren't followed by a
+    newline, which end a row too when the archive is read as text
+    with newline='', as csv expects.
+    """
+    if b'\r' in line:
+        return line.splitlines(True)
+    return (line,)
+
+
+def read_archive(path, start=0, end=None):
+    """
+    Yields each row of the raw pipe-delimited archive, optionally
+    limited to the rows that start within a byte range from
+    `split_archive`. A row with a quoted field that goes on past the
+    end of the range is read to its end.
+    """
+    position = start
+
+    def iter_lines():
+        nonlocal position
+        with open_archive(path) as raw_file:
+            if start:
+                raw_file.seek(start)
+            for line in raw_file:
+                for part in split_line(line):
+                    position += len(part)
+                    yield part.decode(ENCODING)
+
+    # csv only reads the lines of the row it returns, so the position
+    # is always at the start of the next one
+    reader = csv.reader(iter_lines(), delimiter='|')
+    while end is None or position < end:
+        row = next(reader, None)
+        if row is None:
+            break
+        yield row
+
+
+def iter_mmap_lines(mm, end):
+    """
+    Yields decoded lines from the current position of a memory map
+    until one starts at or after `end`. Lines end at stray carriage
+    returns too, and the position is left after the last line read.
+    """
+    while mm.tell() < end:
+        line = mm.readline()
+        if not line:
+            break
+        parts = split_line(line)
+        if len(parts) > 1:
+            mm.seek(mm.tell() - len(line) + len(parts[0]))
+        yield parts[0].decode(ENCODING)
+
+
+def read_lines_mmap(mm, position, stop, end, widths, only):
+    """
+    Reads rows line by line from `position` until a row starts at or
+    after `stop`, letting csv deal with lines that have quotes or
+    carriage returns in them, which may be quoted fields that go on
+    for several lines, up to `end`. Returns the rows and the position
+    after them.
+    """
+    rows = []
+    mm.seek(position)
+    while position < stop:
+        line = mm.readline()
+        if not line:
+            break
+        if b'"' in line or b'\r' in line.rstrip(b'\r\n'):
+            mm.seek(position)
+            reader = csv.reader(iter_mmap_lines(mm, end), delimiter='|')
+            row = next(reader, None)
+            position = mm.tell()
+            if row is None:
+                break
+        else:
+            position = mm.tell()
+            line = line.rstrip(b'\r\n')
+            row = line.decode(ENCODING).split('|') if line else []
+        if widths is not None:
+            width = widths.get(row[0] if row else None)
+            if width is None:
+                continue
+            del row[width:]
+        if only is not None and get_form_id(row) not in only:
+            continue
+        rows.append(row)
+    return rows, position
+
+
+def read_archive_mmap(path, start=0, end=None, widths=None, only=None,
+                      block_size=MMAP_BLOCK_SIZE):
+    """
+    Yields the same rows as `read_archive`, but memory-maps the archive
+    and splits it into lines and fields a block at a time instead of
+    running every byte through csv. Blocks with quotes or stray
+    carriage returns in them are read line by line with csv's rules.
+
+    If `widths` maps form types to the number of columns their mapping
+    uses, rows of other types are skipped, and only the mapped columns
+    of the others are split into fields. If `only` is given, rows of
+    other filings are skipped.
+    """
+    with open(path, 'rb') as raw_file, mmap.mmap(
+            raw_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        if end is None:
+            end = size
+        position = start
+        while position < end:
+            # Blocks end at the end of a line
+            stop = min(position + block_size, end)
+            newline = mm.find(b'\n', stop - 1)
+            stop = size if newline == -1 else newline + 1
+            block = mm[position:stop]
+
+            if b'"' in block or b'\r' in block:
+                rows, position = read_lines_mmap(
+                    mm, position, min(stop, end), size, widths, only)
+                for row in rows:
+                    yield row
+                continue
+            position = stop
+
+            lines = block.decode(ENCODING).split('\n')
+            if block.endswith(b'\n'):
+                lines.pop()
+            for line in lines:
+                if widths is None:
+                    row = line.split('|') if line else []
+                else:
+                    width = widths.get(line.partition('|')[0])
+                    if width is None:
+                        continue
+                    # Columns past the mapped ones aren't split apart
+                    row = line.split('|', width)
+                    del row[width:]
+                if only is not None and get_form_id(row) not in only:
+                    continue
+                yield row
+
+
+def hash_row(row):
+    """
+    Returns a digest of a raw row as an integer.
+    """
+    digest = hashlib.sha1('|'.join(row).encode('utf-8')).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def fingerprint_rows(rows, hashes=None):
+    """
+    Adds up the digests of the rows of every filing. Since addition
+    doesn't depend on order, fingerprints of different parts of the
+    archive can be computed separately and combined with
+    `combine_fingerprints`.
+    """
+    if hashes is None:
+        hashes = {}
+    for row in rows:
+        form_id = get_form_id(row)
+        if form_id is None:
+            continue
+        hashes[form_id] = (hashes.get(form_id, 0) + hash_row(row)) % 2 ** 160
+    return hashes
+
+
+def combine_fingerprints(hashes, other):
+    """
+    Merges the fingerprint sums in `other` into `hashes`.
+    """
+    for form_id, value in other.items():
+        hashes[form_id] = (hashes.get(form_id, 0) + value) % 2 ** 160
+    return hashes
+
+
+def format_fingerprint(value):
+    """
+    Converts a fingerprint sum into the hex string stored on filings.
+    """
+    return '{:040x}'.format(value)
+
+
+def download_chunks(url, chunk_size=DOWNLOAD_CHUNK_SIZE, stats=None):
+    """
+    Yields the body of a URL in chunks as it is downloaded, adding up
+    their size in the `bytes_read` key of `stats` if it's given.
+    """
+    r = requests.get(url, stream=True)
+    r.raise_for_status()
+    with r:
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                if stats is not None:
+                    stats['bytes_read'] = (
+                        stats.get('bytes_read', 0) + len(chunk))
+                yield chunk
+
+
+class ThreadedIterator:
+    """
+    Consumes an iterator in a background thread, keeping up to
+    `maxsize` items ready for the caller. Exceptions raised in the
+    thread are raised again by the caller.
+    """
+
+    def __init__(self, iterable, maxsize=64):
+        self.queue = queue.Queue(maxsize)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run,
+            args=(iterable,),
+            daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(self, iterable):
+        try:
+            for item in iterable:
+                if not self.put((True, item)):
+                    return
+        except BaseException as e:
+            self.put((False, e))
+            return
+        self.put((False, None))
+
+    def __iter__(self):
+        try:
+            while True:
+                ok, item = self.queue.get()
+                if ok:
+                    yield item
+                elif item is None:
+                    return
+                else:
+                    raise item
+        finally:
+            self.stopped.set()
+
+
+class ChunkReader:
+    """
+    Reads bytes from an iterator of chunks.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data, self.buffer = self.buffer[0:size], self.buffer[size:]
+        return data
+
+    def read_chunk(self):
+        if self.buffer:
+            data, self.buffer = self.buffer, b''
+            return data
+        return next(self.chunks, b'')
+
+
+def unzip_stream(chunks):
+    """
+    Decompresses the first file of a zip archive as its chunks arrive,
+    without waiting for the central directory at the end of it.
+    """
+    reader = ChunkReader(chunks)
+    header = reader.read(ZIP_LOCAL_HEADER.size)
+    if len(header) < ZIP_LOCAL_HEADER.size:
+        raise ValueError('The archive is not a zip file')
+    (signature, version, flags, method, mod_time, mod_date, crc,
+     compressed_size, size, name_length, extra_length) = (
+        ZIP_LOCAL_HEADER.unpack(header))
+    if signature != ZIP_LOCAL_SIGNATURE:
+        raise ValueError('The archive is not a zip file')
+    reader.read(name_length + extra_length)
+
+    if method == zipfile.ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        while not decompressor.eof:
+            chunk = reader.read_chunk()
+            if not chunk:
+                raise ValueError('The zip archive is truncated')
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+    elif method == zipfile.ZIP_STORED and not flags & 0x08:
+        remaining = compressed_size
+        while remaining:
+            chunk = reader.read_chunk()
+            if not chunk:
+                raise ValueError('The zip archive is truncated')
+            chunk = chunk[0:remaining]
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        raise ValueError(
+            'Unsupported zip compression method {}'.format(method))
+
+
+def iter_stream_lines(chunks):
+    """
+    Splits chunks of bytes into decoded lines, which end at stray
+    carriage returns too.
+    """
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            for part in split_line(line + b'\n'):
+                yield part.decode(ENCODING)
+    if pending:
+        for part in split_line(pending):
+            yield part.decode(ENCODING)
+
+
+def read_stream(url, stats=None):
+    """
+    Yields each row of a zipped archive while it is downloaded from
+    `url`. The download runs in a background thread, so network I/O
+    overlaps decompression, parsing and database writes.
+    """
+    chunks = ThreadedIterator(download_chunks(url, stats=stats))
+    lines = iter_stream_lines(unzip_stream(chunks))
+    for row in csv.reader(lines, delimiter='|'):
+        yield row
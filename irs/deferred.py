@@ -0,0 +1,59 @@
+import pickle
+import tempfile
+
+# Number of deferred rows kept in memory before they're written to disk
+BUFFER_SIZE = 10000
+
+
+class DeferredRows:
+    """
+    Holds rows that can't be saved until later in the load, in the
+    order they were added. Up to `buffer_size` of them are kept in
+    memory, and the rest are pickled to a temporary file, so memory
+    use stays flat however many there are.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE, dir=None):
+        self.buffer_size = buffer_size
+        self.dir = dir
+        self.rows = []
+        self.file = None
+        self.spilled = 0
+
+    def __len__(self):
+        return self.spilled + len(self.rows)
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.buffer_size:
+            self.spill()
+
+    def spill(self):
+        """
+        Writes the rows in memory to the temporary file.
+        """
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(dir=self.dir)
+        pickle.dump(self.rows, self.file, pickle.HIGHEST_PROTOCOL)
+        self.spilled += len(self.rows)
+        self.rows = []
+
+    def __iter__(self):
+        if self.file is not None:
+            self.file.seek(0)
+            while True:
+                try:
+                    rows = pickle.load(self.file)
+                except EOFError:
+                    break
+                for row in rows:
+                    yield row
+        for row in self.rows:
+            yield row
+
+    def clear(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.spilled = 0
+        self.rows = []
@@ -0,0 +1,60 @@
+import logging
+from contextlib import contextmanager
+from django.db import connection, NotSupportedError
+from irs.staging import MODELS
+
+logger = logging.getLogger(__name__)
+
+
+def drop_indexes(models=MODELS):
+    """
+    Drops the indexes declared in each model's Meta.indexes. Primary
+    keys, unique constraints and foreign key indexes are left alone.
+    Returns the indexes that were dropped.
+    """
+    dropped = []
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+                dropped.append((model, index))
+    return dropped
+
+
+def build_indexes(indexes):
+    """
+    Builds indexes dropped by `drop_indexes`.
+    """
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.add_index(model, index)
+
+
+@contextmanager
+def deferred_indexes(report=None, models=MODELS):
+    """
+    Drops the secondary indexes of the irs tables for the duration of
+    the block and builds them again at the end, which is much faster
+    than keeping them up to date while millions of rows are inserted.
+    The rebuild is timed as a stage of the `report`, if one is given.
+
+    Does nothing if the schema can't be changed here, like inside a
+    transaction on SQLite.
+    """
+    try:
+        dropped = drop_indexes(models)
+    except NotSupportedError as e:
+        logger.debug('Keeping indexes during load: {}'.format(e))
+        yield
+        return
+
+    logger.info('Dropped {} indexes for the load'.format(len(dropped)))
+    try:
+        yield
+    finally:
+        logger.info('Rebuilding indexes')
+        if report is None:
+            build_indexes(dropped)
+        else:
+            with report.stage('indexes'):
+                build_indexes(dropped)
@@ -0,0 +1,43 @@
+from django.db.models import Max
+
+
+class KeyMap:
+    """
+    Hands out the integer keys of filings or committees by their
+    source identifier, the form id number or the EIN. Keys that are
+    already in the database are kept, and new ones follow on from the
+    highest of them. Keys are given out by the loader rather than by
+    the database, so contributions and expenditures can refer to
+    their filing and committee as soon as they're parsed.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.last = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, value):
+        return value in self.keys
+
+    def __getitem__(self, value):
+        key = self.keys.get(value)
+        if key is None:
+            self.last += 1
+            key = self.keys[value] = self.last
+        return key
+
+    def get(self, value, default=None):
+        return self.keys.get(value, default)
+
+    def load(self, model, field):
+        """
+        Reads the keys of every row of a model, by the given field.
+        """
+        self.keys = dict(model.objects.values_list(field, 'pk').order_by())
+        self.last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    def clear(self):
+        self.keys = {}
+        self.last = 0
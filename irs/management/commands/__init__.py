@@ -1,7 +1,8 @@
 import os
-from datetime import datetime
+import json
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 
 
 class IRSCommand(BaseCommand):
@@ -27,4 +28,24 @@ class IRSCommand(BaseCommand):
             os.makedirs(self.data_dir)
 
         # Start the clock
-        self.start_datetime = datetime.now()
+        self.start_datetime = timezone.now()
+
+    def get_state_path(self):
+        return os.path.join(self.data_dir, 'archive.json')
+
+    def read_state(self):
+        """
+        Returns what we know about the last archive that was
+        downloaded and loaded.
+        """
+        path = self.get_state_path()
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def write_state(self, state):
+        path = self.get_state_path()
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,174 @@
+import os
+import time
+import logging
+from django.db import connection
+from irs.indexes import deferred_indexes
+from irs.management.commands import IRSCommand
+from irs.management.commands.generateIRS import Command as GenerateCommand
+from irs.management.commands.loadIRS import Command as LoadCommand
+from irs.report import peak_rss
+from irs.staging import StagingTables
+from irs.tuning import tuned_for_load
+from irs.writers import get_writer
+
+logger = logging.getLogger(__name__)
+
+
+class BenchmarkLoad(LoadCommand):
+    """
+    loadIRS, keeping track of how long it spends writing batches.
+    With writer threads, this adds up the time spent in each of them.
+    """
+    write_seconds = 0
+
+    def write_batch(self, *args, **kwargs):
+        start = time.perf_counter()
+        super(BenchmarkLoad, self).write_batch(*args, **kwargs)
+        self.write_seconds += time.perf_counter() - start
+
+
+class Command(IRSCommand):
+    help = "Measure how fast the loader parses and saves an archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            dest='rows',
+            default=100000,
+            help='Roughly how many rows of synthetic data to load',
+        )
+        parser.add_argument(
+            '--path',
+            dest='path',
+            default=None,
+            help='Load this archive instead of a synthetic one',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=1,
+            help='Number of processes to parse the archive with',
+        )
+        parser.add_argument(
+            '--writers',
+            type=int,
+            dest='writers',
+            default=0,
+            help='Number of threads to save batches with',
+        )
+        parser.add_argument(
+            '--reader',
+            dest='reader',
+            choices=['csv', 'mmap'],
+            default='csv',
+            help='How to read the archive',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            dest='seed',
+            default=0,
+            help='Seed for the synthetic archive',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            dest='keep',
+            default=False,
+            help='Keep the synthetic archive when the benchmark is done',
+        )
+
+    def handle(self, *args, **options):
+        super(Command, self).handle(*args, **options)
+
+        path = options['path']
+        if path is None:
+            path = os.path.join(self.data_dir, 'BenchmarkDataFile.txt')
+            GenerateCommand().generate(
+                path,
+                options['rows'],
+                seed=options['seed'])
+
+        try:
+            self.results = []
+            self.benchmark(
+                path,
+                max(1, options['workers']),
+                options['reader'],
+                max(0, options['writers']))
+        finally:
+            if not options['path'] and not options['keep']:
+                os.remove(path)
+
+        self.stdout.write(
+            '{} rows from {} on {} with {} worker(s), {} writer '
+            'thread(s) and the {} reader'.format(
+                self.results[0][1],
+                path,
+                connection.vendor,
+                max(1, options['workers']),
+                max(0, options['writers']),
+                options['reader']))
+        self.stdout.write('{:<12} {:>10} {:>10} {:>12} {:>12}'.format(
+            'stage', 'rows', 'seconds', 'rows/s', 'peak RSS MB'))
+        for stage, rows, seconds, rss in self.results:
+            self.stdout.write('{:<12} {:>10} {:>10.2f} {:>12} {:>12}'.format(
+                stage,
+                rows,
+                seconds,
+                '{:.0f}'.format(rows / seconds) if rows and seconds else '-',
+                '{:.1f}'.format(rss / 2 ** 20) if rss else '-'))
+
+    def record(self, stage, rows, start):
+        self.results.append(
+            (stage, rows, time.perf_counter() - start, peak_rss()))
+
+    def benchmark(self, path, workers, reader, writers):
+        """
+        Parses the archive, then loads it into staging tables, which
+        are dropped at the end so the live tables are never touched.
+        """
+        load = BenchmarkLoad()
+        load.url = None
+        load.final_path = path
+        load.workers = workers
+        load.reader = reader
+        load.writers = min(writers, 1) if (
+            connection.vendor == 'sqlite') else writers
+        load.check_archive()
+        load.build_mappings()
+        load.reset_state()
+        load.writer = get_writer()
+
+        logger.info('Parsing archive')
+        start = time.perf_counter()
+        rows = sum(1 for parsed in load.parse_archive())
+        self.record('parse', rows, start)
+
+        staging = StagingTables()
+        staging.create()
+        try:
+            with staging.use(), tuned_for_load():
+                load.reset_state()
+                start = time.perf_counter()
+                load.fingerprints = load.fingerprint_archive()
+                self.record('fingerprint', rows, start)
+
+                logger.info('Loading archive')
+                start = time.perf_counter()
+                with deferred_indexes():
+                    load.load_archive()
+                saved = sum(load.counts.values())
+                self.record('load', saved, start)
+                # Only the time spent in save_batch
+                self.results.append(
+                    ('insert', saved, load.write_seconds, peak_rss()))
+
+                logger.info('Resolving amendments')
+                start = time.perf_counter()
+                load.resolve_amendments()
+                self.record('amendments', load.counts['filings'], start)
+        finally:
+            staging.drop()
@@ -1,8 +1,10 @@
 import os
+import glob
 import shutil
-import zipfile
 import logging
 import requests
+from django.core.management.base import CommandError
+from irs.archive import open_archive
 from irs.management.commands import IRSCommand
 
 logger = logging.getLogger(__name__)
@@ -26,6 +28,41 @@ class Command(IRSCommand):
             default=False,
             help='More logging messages',
         )
+        parser.add_argument(
+            '--url',
+            dest='url',
+            default=self.url,
+            help='Where to download the archive from',
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            dest='retries',
+            default=3,
+            help='How many times to resume an interrupted download',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Download the archive even if it has not changed',
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            dest='keep',
+            default=4,
+            help='How many dated archives to keep',
+        )
+        parser.add_argument(
+            '--extract',
+            action='store_true',
+            dest='extract',
+            default=False,
+            help='Also extract the archive to a text file, which can be '
+                 'parsed by several processes or memory-mapped',
+        )
 
     def handle(self, *args, **options):
         super(Command, self).handle(*args, **options)
@@ -43,30 +80,128 @@ class Command(IRSCommand):
                 datefmt='%I:%M:%S',
                 level=logging.INFO)
 
-        # Where to download the raw zipped archive
-        self.zip_path = os.path.join(
+        self.url = options['url']
+        self.retries = options['retries']
+        self.force = options['force']
+        self.keep = max(1, options['keep'])
+        self.extract = options['extract']
+
+        # Where to keep the zipped archives, one for each day
+        self.archive_dir = os.path.join(
             self.data_dir,
-            'zipped_archive.zip')
-        # Where to extract the archive
-        self.extract_path = os.path.join(
-            self.data_dir)
-        # Where to store the data file
+            'archives')
+        if not os.path.exists(self.archive_dir):
+            os.makedirs(self.archive_dir)
+        self.zip_path = os.path.join(
+            self.archive_dir,
+            'fullData-{:%Y%m%d}.zip'.format(self.start_datetime))
+        # Where to keep a download that was interrupted
+        self.part_path = os.path.join(
+            self.archive_dir,
+            'fullData.zip.part')
+        # Where to store the extracted data file
         self.final_path = os.path.join(
             self.data_dir,
             'FullDataFile.txt')
 
         logger.info('Downloading latest archive')
-        self.download()
-        self.unzip()
+        self.changed = self.download()
+        if not self.changed:
+            logger.info('The archive has not changed since the last download')
+            return
+        if self.extract:
+            self.unzip()
         self.clean()
 
+    def get_headers(self, state):
+        """
+        Returns the headers that resume a partial download, or make the
+        request conditional on the archive having changed.
+        """
+        headers = {}
+        partial = state.get('partial')
+        if partial and os.path.exists(self.part_path):
+            headers['Range'] = 'bytes={}-'.format(
+                os.path.getsize(self.part_path))
+            # Only resume if the archive is still the same one
+            validator = partial.get('etag') or partial.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+        elif os.path.exists(state.get('path') or '') and not self.force:
+            if state.get('etag'):
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified'):
+                headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
     def download(self):
         """
-        Download the archive from the IRS website.
+        Download the archive from the IRS website. Returns False if the
+        archive hasn't changed since the last download.
         """
-        url = 'http://forms.irs.gov/app/pod/dataDownload/fullData'
-        r = requests.get(url, stream=True)
-        with open(self.zip_path, 'wb') as f:
+        state = self.read_state()
+        for attempt in range(self.retries + 1):
+            headers = self.get_headers(state)
+            logger.debug('Requesting archive with {}'.format(headers))
+            try:
+                r = requests.get(
+                    self.url,
+                    headers=headers,
+                    stream=True,
+                    timeout=60)
+                with r:
+                    if r.status_code == 304:
+                        return False
+                    if r.status_code == 416:
+                        # The partial download is no good, start over
+                        state.pop('partial', None)
+                        continue
+                    r.raise_for_status()
+                    self.save_response(r, state)
+            except requests.RequestException as e:
+                logger.warning('Download interrupted: {}'.format(e))
+                continue
+
+            partial = state['partial']
+            size = os.path.getsize(self.part_path)
+            if partial['content_length'] not in (None, size):
+                logger.warning('Download incomplete at {} of {} bytes'.format(
+                    size, partial['content_length']))
+                continue
+
+            os.replace(self.part_path, self.zip_path)
+            state.pop('partial')
+            state.update(partial)
+            state['archive'] = self.zip_path
+            # What loadIRS reads by default
+            state['path'] = self.final_path if self.extract else self.zip_path
+            state['loaded'] = False
+            self.write_state(state)
+            return True
+
+        raise CommandError('Could not download the archive from {}'.format(
+            self.url))
+
+    def save_response(self, r, state):
+        """
+        Writes the body of a response to the partial download,
+        appending to it if the server resumed the download.
+        """
+        if r.status_code == 206:
+            mode = 'ab'
+            # Content-Range looks like "bytes 100-199/200"
+            total = r.headers.get('Content-Range', '').rpartition('/')[2]
+        else:
+            mode = 'wb'
+            total = r.headers.get('Content-Length', '')
+        state['partial'] = {
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'content_length': int(total) if total.isdigit() else None,
+        }
+        self.write_state(state)
+
+        with open(self.part_path, mode) as f:
             # This is a big file, so we download in chunks
             for chunk in r.iter_content(chunk_size=30720):
                 logger.debug('Downloading...')
@@ -75,26 +210,21 @@ class Command(IRSCommand):
 
     def unzip(self):
         """
-        Unzip the archive.
+        Extracts the data file from the archive, skipping the
+        many-layered directory structure it's stored in.
         """
         logger.info('Unzipping archive')
-        with zipfile.ZipFile(self.zip_path, 'r') as zipped_archive:
-            data_file = zipped_archive.namelist()[0]
-            zipped_archive.extract(data_file, self.extract_path)
+        with open_archive(self.zip_path) as data_file:
+            with open(self.final_path + '.tmp', 'wb') as f:
+                shutil.copyfileobj(data_file, f)
+        os.replace(self.final_path + '.tmp', self.final_path)
 
     def clean(self):
         """
-        Get the .txt file from within the many-layered
-        directory structure, then delete the directories.
+        Deletes all but the latest few dated archives.
         """
-        logger.info('Cleaning up archive')
-        shutil.move(
-            os.path.join(
-                self.data_dir,
-                'var/IRS/data/scripts/pofd/download/FullDataFile.txt'
-            ),
-            self.final_path
-        )
-
-        shutil.rmtree(os.path.join(self.data_dir, 'var'))
-        os.remove(self.zip_path)
+        archives = sorted(glob.glob(
+            os.path.join(self.archive_dir, 'fullData-*.zip')))
+        for path in archives[:-self.keep]:
+            logger.info('Removing old archive {}'.format(path))
+            os.remove(path)
@@ -0,0 +1,68 @@
+import os
+import logging
+from irs.management.commands import IRSCommand
+from irs.management.commands.loadIRS import Command as LoadCommand
+from irs.synthetic import SyntheticArchive
+
+logger = logging.getLogger(__name__)
+
+
+class Command(IRSCommand):
+    help = "Write a synthetic IRS archive of any size for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            dest='rows',
+            default=100000,
+            help='Roughly how many rows to write',
+        )
+        parser.add_argument(
+            '--output',
+            dest='output',
+            default=None,
+            help='Where to write the archive. Defaults to '
+                 'data/SyntheticDataFile.txt',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            dest='seed',
+            default=0,
+            help='Seed for the random number generator',
+        )
+        parser.add_argument(
+            '--amendment-rate',
+            type=float,
+            dest='amendment_rate',
+            default=0.05,
+            help='Share of filings that amend an earlier filing',
+        )
+
+    def handle(self, *args, **options):
+        super(Command, self).handle(*args, **options)
+
+        path = options['output'] or os.path.join(
+            self.data_dir,
+            'SyntheticDataFile.txt')
+        counts = self.generate(
+            path,
+            options['rows'],
+            seed=options['seed'],
+            amendment_rate=options['amendment_rate'])
+        self.stdout.write('Wrote {} filings, {} contributions and {} '
+                          'expenditures to {}'.format(
+                              counts['2'], counts['A'], counts['B'], path))
+
+    def generate(self, path, rows, **kwargs):
+        """
+        Writes a synthetic archive to `path` with the field layouts
+        loadIRS uses, and returns the number of rows of each type.
+        """
+        load = LoadCommand()
+        load.build_mappings()
+        archive = SyntheticArchive(load.mappings, **kwargs)
+        logger.info('Writing synthetic archive to {}'.format(path))
+        with open(path, 'wb') as f:
+            return archive.write(f, rows)
@@ -1,11 +1,38 @@
 import os
 import csv
+import time
+import bisect
+import cProfile
 import logging
-from decimal import Decimal
+import functools
+import itertools
+import contextlib
+import collections
+import multiprocessing
+from decimal import Decimal, InvalidOperation
 from datetime import datetime
+import django
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
+from irs.archive import (
+    CHUNK_SIZE, get_compression, get_form_id, split_archive, read_archive,
+    read_archive_mmap, read_stream,
+    fingerprint_rows, combine_fingerprints, format_fingerprint)
+from irs.deferred import DeferredRows
+from irs.indexes import deferred_indexes
+from irs.keys import KeyMap
 from irs.management.commands import IRSCommand
 from irs.models import F8872, Contribution, Expenditure, Committee
+from irs.report import LoadReport
+from irs.search import get_search_index
+from irs.staging import MODELS, StagingTables
+from irs.summaries import refresh_summaries
+from irs.tuning import tune_connection, tuned_for_load
+from irs.writers import ParsedRow, WriterThreads, get_writer
 
 logger = logging.getLogger(__name__)
 
@@ -19,16 +46,294 @@ NULL_TERMS = [
     'NOT APLICABLE',
     'N A',
     'N-A']
+NULL_TERM_SET = frozenset(NULL_TERMS)
 
-# Global lists of contribution and expenditure objects that we'll use
-# for our bulk create
+# Global lists of filing, contribution and expenditure objects that we'll
+# save in batches
+FILINGS = []
 CONTRIBUTIONS = []
 EXPENDITURES = []
 
+# Number of pending objects at which we write a batch to the database
+BATCH_SIZE = 5000
+
 # Running list of filing ids so we don't add contributions or expenditures
 # without an associated filing
 PARSED_FILING_IDS = set()
 
+# Integer keys of filings by form id number and of committees by EIN,
+# handed out as filings are parsed so that their rows can refer to them
+FILING_KEYS = KeyMap()
+COMMITTEE_KEYS = KeyMap()
+
+# Filing ids seen more than once, whose batches have to be written in
+# order when several threads are writing
+REPEATED_FILING_IDS = set()
+
+# Contributions and expenditures that came before their filing in
+# the archive, which are saved once all of it has been read
+DEFERRED_ROWS = DeferredRows()
+
+# Number of contributions and expenditures skipped because their
+# filing wasn't in the archive at all
+ORPHANS = collections.Counter()
+
+# Number of non-empty cells of each field type that couldn't be
+# converted and were saved as null
+CONVERSION_ERRORS = collections.Counter()
+
+# Which mapping is used to parse each type of row
+MAPPING_NAMES = {
+    '2': 'F8872',
+    'A': 'sa',
+    'B': 'sb'}
+
+# What each type of schedule row is counted as
+SCHEDULE_NAMES = {
+    'A': 'contributions',
+    'B': 'expenditures'}
+
+# The archive path, mappings and filing ids used by each parsing process
+WORKER_STATE = {}
+
+# Number of distinct raw values whose conversion is remembered
+# for each type of field
+CACHE_SIZE = 65536
+
+# Memoised cleaning functions, by field type and time zone
+CACHES = {}
+
+CELL_TYPE_NAMES = {
+    'D': 'date',
+    'I': 'integer',
+    'N': 'decimal',
+    'C': 'text'}
+
+
+def to_ascii(cell):
+    """
+    Gets rid of non-ASCII characters.
+    """
+    return cell.encode('ascii', 'ignore').decode()
+
+
+def clean_date(cell, tz=None):
+    """
+    Parses a YYYYMMDD date into a timezone-aware datetime.
+    """
+    cell = to_ascii(cell)
+    try:
+        if len(cell) == 8 and cell.isdigit():
+            naive_dt = datetime(
+                int(cell[0:4]),
+                int(cell[4:6]),
+                int(cell[6:8]))
+        else:
+            naive_dt = datetime.strptime(cell, '%Y%m%d')
+        return timezone.make_aware(naive_dt, tz)
+    except (ValueError, OverflowError):
+        if cell:
+            CONVERSION_ERRORS['D'] += 1
+        return None
+
+
+def clean_integer(cell):
+    try:
+        return int(to_ascii(cell))
+    except ValueError:
+        if cell:
+            CONVERSION_ERRORS['I'] += 1
+        return None
+
+
+def clean_decimal(cell):
+    try:
+        return Decimal(to_ascii(cell))
+    except InvalidOperation:
+        if cell:
+            CONVERSION_ERRORS['N'] += 1
+        return None
+
+
+def clean_text(cell):
+    """
+    Upper-cases and truncates text, turning empty cells and
+    null terms into None.
+    """
+    cell = to_ascii(cell).upper()[0:50]
+    if not cell or cell in NULL_TERM_SET:
+        return None
+    return cell
+
+
+# How each type of field in the mappings is cleaned
+CLEANERS = {
+    'D': clean_date,
+    'I': clean_integer,
+    'N': clean_decimal,
+    'C': clean_text}
+
+
+def clean_cell(cell, cell_type):
+    """
+    Uses the type of field (from the mapping) to
+    determine how to clean and format the cell.
+    """
+    return CLEANERS.get(cell_type, clean_text)(cell)
+
+
+def get_cleaner(cell_type, tz):
+    """
+    Returns a cleaning function for a type of field that remembers
+    the conversions of recent raw values. The raw archive repeats
+    the same dates, states, cities and names over and over, and
+    repeated values also end up sharing a single cleaned object.
+    """
+    if cell_type not in CLEANERS:
+        cell_type = 'C'
+    key = (cell_type, tz)
+    if key not in CACHES:
+        if cell_type == 'D':
+            func = functools.partial(clean_date, tz=tz)
+        else:
+            func = CLEANERS[cell_type]
+        CACHES[key] = functools.lru_cache(maxsize=CACHE_SIZE)(func)
+    return CACHES[key]
+
+
+def clear_caches():
+    for cleaner in CACHES.values():
+        cleaner.cache_clear()
+
+
+def cache_stats():
+    """
+    Returns the number of cache hits and misses for each type of field.
+    Since conversions are cached, CONVERSION_ERRORS counts distinct
+    values that failed to convert rather than every cell.
+    """
+    stats = {}
+    for (cell_type, tz), cleaner in CACHES.items():
+        info = cleaner.cache_info()
+        hits, misses = stats.get(cell_type, (0, 0))
+        stats[cell_type] = (hits + info.hits, misses + info.misses)
+    return stats
+
+
+def compile_mapping(mapping):
+    """
+    Turns a mapping of field positions to field names and types into
+    a converter that cleans a raw row in one pass, returning a tuple
+    of values in mapping order. The cleaning function for each
+    position is looked up once here rather than for every cell.
+    """
+    tz = timezone.get_current_timezone()
+    cleaners = tuple(
+        get_cleaner(mapping[str(i)][1], tz)
+        for i in range(len(mapping)))
+
+    def convert(row):
+        return tuple([clean(cell) for clean, cell in zip(cleaners, row)])
+    return convert
+
+
+def compile_mappings(mappings):
+    """
+    Compiles a converter for each type of row.
+    """
+    return dict(
+        (form_type, compile_mapping(mappings[name]))
+        for form_type, name in MAPPING_NAMES.items())
+
+
+def get_widths(mappings):
+    """
+    Returns the number of columns the mapping of each type of row uses.
+    """
+    return dict(
+        (form_type, len(mappings[name]))
+        for form_type, name in MAPPING_NAMES.items())
+
+
+def read_rows(path, reader='csv', start=0, end=None, widths=None,
+              only=None):
+    """
+    Reads the raw rows of the archive, or of a byte range of it, with
+    either reader. The mmap reader uses `widths` and `only` to skip
+    rows and columns before they're decoded, while parse_rows leaves
+    them out of rows read with csv.
+    """
+    if reader == 'mmap':
+        return read_archive_mmap(path, start, end, widths, only)
+    return read_archive(path, start, end)
+
+
+def parse_rows(rows, converters, only=None):
+    """
+    Cleans filing, contribution and expenditure rows, yielding the
+    form type and a tuple of cleaned values in mapping order for
+    each one. If `only` is given, rows belonging to other filings
+    are skipped.
+    """
+    for row in rows:
+        if not row or row[0] not in converters:
+            continue
+        if only is not None and get_form_id(row) not in only:
+            continue
+        yield row[0], converters[row[0]](row)
+
+
+def init_worker(path, mappings, only, reader='csv'):
+    """
+    Sets up a parsing process.
+    """
+    if not settings.configured:
+        django.setup()
+    WORKER_STATE['path'] = path
+    WORKER_STATE['converters'] = compile_mappings(mappings)
+    WORKER_STATE['widths'] = get_widths(mappings)
+    WORKER_STATE['only'] = only
+    WORKER_STATE['reader'] = reader
+
+
+def parse_chunk(byte_range):
+    """
+    Parses one byte range of the archive in a worker process.
+    """
+    start, end = byte_range
+    rows = read_rows(
+        WORKER_STATE['path'],
+        WORKER_STATE['reader'],
+        start,
+        end,
+        WORKER_STATE['widths'],
+        WORKER_STATE['only'])
+    parsed_rows = list(parse_rows(
+        rows,
+        WORKER_STATE['converters'],
+        WORKER_STATE['only']))
+    return os.getpid(), cache_stats(), dict(CONVERSION_ERRORS), parsed_rows
+
+
+def fingerprint_chunk(byte_range):
+    """
+    Fingerprints the filings in one byte range of the archive
+    in a worker process.
+    """
+    start, end = byte_range
+    return fingerprint_rows(read_rows(
+        WORKER_STATE['path'],
+        WORKER_STATE['reader'],
+        start,
+        end))
+
+
+def get_field_names(mapping):
+    """
+    Returns the names of the fields of a mapping, in mapping order.
+    """
+    return tuple(mapping[str(i)][0] for i in range(len(mapping)))
+
 
 class RowParser:
     """
@@ -37,13 +342,17 @@ class RowParser:
     row to the database.
     """
 
-    def __init__(self, form_type, mapping, row):
+    def __init__(self, form_type, mapping, row, values=None, fields=None):
         self.form_type = form_type
         self.mapping = mapping
         self.row = row
-        self.parsed_row = {}
+        self.fields = fields or get_field_names(mapping)
 
-        self.parse_row()
+        # Rows may already have been cleaned by a parsing process
+        if values is None:
+            self.values = self.parse_row()
+        else:
+            self.values = values
         self.create_object()
 
     def clean_cell(self, cell, cell_type):
@@ -51,86 +360,63 @@ class RowParser:
         Uses the type of field (from the mapping) to
         determine how to clean and format the cell.
         """
-        try:
-            # Get rid of non-ASCII characters
-            cell = cell.encode('ascii', 'ignore').decode()
-            if cell_type == 'D':
-                # Parse datetime and make it timezone-aware
-                naive_dt = datetime.strptime(cell, '%Y%m%d')
-                cell = timezone.make_aware(naive_dt)
-            elif cell_type == 'I':
-                cell = int(cell)
-            elif cell_type == 'N':
-                cell = Decimal(cell)
-            else:
-                cell = cell.upper()
-
-                if len(cell) > 50:
-                    cell = cell[0:50]
-
-                if not cell or cell in NULL_TERMS:
-                    cell = None
-
-        except:
-            cell = None
-
-        return cell
+        return clean_cell(cell, cell_type)
 
     def parse_row(self):
         """
-        Parses a row, cell-by-cell, returning a dict of field names
-        to the cleaned field values.
+        Parses a row, cell-by-cell, returning a tuple of the cleaned
+        field values in mapping order.
         """
         fields = self.mapping
-        for i, cell in enumerate(self.row[0:len(fields)]):
-            field_name, field_type = fields[str(i)]
-            parsed_cell = self.clean_cell(cell, field_type)
-            self.parsed_row[field_name] = parsed_cell
-
-    def create_object(self):
-        if self.form_type == 'A':
-            contribution = Contribution(**self.parsed_row)
+        return tuple(
+            self.clean_cell(cell, fields[str(i)][1])
+            for i, cell in enumerate(self.row[0:len(fields)]))
 
-            # If there's no filing in the database for this contribution
-            if contribution.form_id_number not in PARSED_FILING_IDS:
-                # Skip this contribution
-                return
-
-            contribution.filing_id = contribution.form_id_number
-            contribution.committee_id = contribution.EIN
+    def get_value(self, name):
+        return self.values[self.fields.index(name)]
 
-            CONTRIBUTIONS.append(contribution)
-        elif self.form_type == 'B':
-            expenditure = Expenditure(**self.parsed_row)
+    def create_object(self):
+        if self.form_type in ('A', 'B'):
+            form_id_number = self.get_value('form_id_number')
 
-            # If there's no filing in the database for this expenditure
-            if expenditure.form_id_number not in PARSED_FILING_IDS:
-                # Skip this expenditure
+            # If its filing hasn't been read yet, it may come later
+            if form_id_number not in PARSED_FILING_IDS:
+                DEFERRED_ROWS.append((self.form_type, self.values))
                 return
 
-            expenditure.filing_id = expenditure.form_id_number
-            expenditure.committee_id = expenditure.EIN
-
-            EXPENDITURES.append(expenditure)
+            # Kept as cleaned, since COPY doesn't need model instances
+            row = ParsedRow(
+                self.fields,
+                self.values,
+                form_id_number,
+                FILING_KEYS[form_id_number],
+                COMMITTEE_KEYS[self.get_value('EIN')])
+            if self.form_type == 'A':
+                CONTRIBUTIONS.append(row)
+            else:
+                EXPENDITURES.append(row)
 
         elif self.form_type == '2':
-            filing = F8872(**self.parsed_row)
+            filing = F8872(**dict(zip(self.fields, self.values)))
+            if filing.form_id_number in PARSED_FILING_IDS:
+                REPEATED_FILING_IDS.add(filing.form_id_number)
             PARSED_FILING_IDS.add(filing.form_id_number)
+            filing.id = FILING_KEYS[filing.form_id_number]
+            filing.committee_id = COMMITTEE_KEYS[filing.EIN]
             logger.debug('Parsing filing {}'.format(filing.form_id_number))
-            committee, created = Committee.objects.get_or_create(
-                EIN=filing.EIN)
-            if created:
-                committee.name = filing.organization_name
-                committee.save()
-            filing.committee = committee
-
-            filing.save()
+            FILINGS.append(filing)
 
 
 class Command(IRSCommand):
 
     help = "Load an IRS archive into the database"
 
+    max_batch_size = BATCH_SIZE
+    writers = 0
+    report = None
+    reader = 'csv'
+    compression = None
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--test',
@@ -146,6 +432,82 @@ class Command(IRSCommand):
             default=False,
             help='More logging messages',
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help='Only insert, replace or delete filings that changed '
+                 'since the last load instead of flushing the database',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=1,
+            help='Number of processes used to parse the archive',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            dest='batch_size',
+            default=BATCH_SIZE,
+            help='Roughly how many rows to save in each transaction',
+        )
+        parser.add_argument(
+            '--writers',
+            type=int,
+            dest='writers',
+            default=0,
+            help='Number of threads that save batches while the archive '
+                 'is parsed. With 0, batches are saved between rows. '
+                 'SQLite only uses one',
+        )
+        parser.add_argument(
+            '--url',
+            dest='url',
+            default=None,
+            help='Stream a zipped archive from this URL instead of '
+                 'loading a file that was already downloaded',
+        )
+        parser.add_argument(
+            '--path',
+            dest='path',
+            default=None,
+            help='Load this archive, which may be zipped or compressed '
+                 'with gzip or zstd, instead of the latest download',
+        )
+        parser.add_argument(
+            '--swap',
+            action='store_true',
+            dest='swap',
+            default=False,
+            help='Load into staging tables and swap them with the live '
+                 'tables at the end, so readers never see a partial load',
+        )
+        parser.add_argument(
+            '--reader',
+            dest='reader',
+            choices=['csv', 'mmap'],
+            default='csv',
+            help='How to read the archive. mmap memory-maps it and '
+                 'splits it into fields without csv, which is faster',
+        )
+        parser.add_argument(
+            '--report',
+            dest='report',
+            default=None,
+            help='Where to write the JSON report of the load. Defaults '
+                 'to a timestamped file in data/reports',
+        )
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            dest='profile',
+            default=False,
+            help='Profile the load and save the stats next to the '
+                 'report. Parsing processes are not profiled',
+        )
 
     def handle(self, *args, **options):
         super(Command, self).handle(*args, **options)
@@ -163,8 +525,25 @@ class Command(IRSCommand):
                 datefmt='%I:%M:%S',
                 level=logging.INFO)
 
+        self.url = options['url']
+        if self.url and (options['incremental'] or options['workers'] > 1):
+            raise CommandError(
+                'An archive streamed from a URL can only be loaded '
+                'in full by a single process')
+        if self.url and options['reader'] != 'csv':
+            raise CommandError(
+                'An archive streamed from a URL is always read with csv')
+        if options['swap'] and options['incremental']:
+            raise CommandError(
+                'Staging tables are only used to load the archive in full')
+
         # Path to downloaded file
-        if options['test']:
+        if self.url:
+            logger.info('Streaming archive from {}'.format(self.url))
+            self.final_path = None
+        elif options['path']:
+            self.final_path = options['path']
+        elif options['test']:
             logger.info('Using test data file')
             self.final_path = os.path.join(
                 os.path.dirname(
@@ -173,71 +552,738 @@ class Command(IRSCommand):
                 'tests',
                 'TestDataFile.txt')
         else:
-            self.final_path = os.path.join(
+            # The archive downloadIRS saved last
+            self.final_path = self.read_state().get('path') or os.path.join(
                 self.data_dir,
                 'FullDataFile.txt')
 
         # Check that this file actually has data in it
-        if os.stat(self.final_path).st_size == 0:
+        if self.final_path and os.stat(self.final_path).st_size == 0:
             raise Exception('The file to be loaded is empty!')
 
+        self.workers = max(1, options['workers'])
+        self.reader = options['reader']
+        self.check_archive()
+        self.max_batch_size = max(1, options['batch_size'])
+        self.writers = max(0, options['writers'])
+        if self.writers > 1 and connection.vendor == 'sqlite':
+            # SQLite only lets one connection write at a time
+            self.writers = 1
+        self.build_mappings()
+        self.reset_state()
+        self.load_keys()
+
+        # Use COPY on PostgreSQL and the ORM everywhere else
+        self.writer = get_writer()
+        logger.debug('Writing with {}'.format(
+            self.writer.__class__.__name__))
+
+        self.report = LoadReport(self.start_datetime)
+        report_path = options['report'] or os.path.join(
+            self.data_dir,
+            'reports',
+            'load-{:%Y%m%d-%H%M%S}.json'.format(self.start_datetime))
+        profile = cProfile.Profile() if options['profile'] else None
+
+        try:
+            if profile:
+                profile.enable()
+            with tuned_for_load():
+                if options['incremental']:
+                    self.load_incremental()
+                elif options['swap']:
+                    self.load_staging()
+                else:
+                    with self.report.stage('flush'):
+                        self.flush()
+                    self.load_full()
+                    self.update_summaries()
+                    self.update_search()
+            self.log_summary()
+        except BaseException as e:
+            self.report.info['error'] = repr(e)
+            raise
+        finally:
+            if profile:
+                profile.disable()
+                profile_path = os.path.splitext(report_path)[0] + '.prof'
+                profile.dump_stats(profile_path)
+                logger.info('Wrote profile to {}'.format(profile_path))
+            self.write_report(report_path, options)
+
+    def check_archive(self):
+        """
+        Makes sure the archive can be read the way that was asked for.
+        Compressed archives can't be split into byte ranges or memory
+        mapped, so they're read from start to end by one process.
+        """
+        self.compression = None
+        if self.final_path:
+            self.compression = get_compression(self.final_path)
+        if self.compression is None:
+            return
+        logger.info('Reading {} archive {}'.format(
+            self.compression, self.final_path))
+        if self.workers > 1 or self.reader != 'csv':
+            raise CommandError(
+                'A compressed archive can only be read with csv '
+                'by a single process')
+
+    def flush(self):
+        """
+        Empties the irs tables with TRUNCATE on PostgreSQL and MySQL and
+        a plain DELETE on SQLite, all in one transaction. Unlike
+        QuerySet.delete(), this never loads rows into Python to cascade
+        the deletion.
+
+        TRUNCATE commits implicitly on MySQL, so there the tables can't
+        be restored if the flush fails halfway.
+
+        The search index is emptied too, so it isn't kept up to date
+        while the tables are loaded.
+        """
         logger.info('Flushing database')
-        F8872.objects.all().delete()
-        Contribution.objects.all().delete()
-        Expenditure.objects.all().delete()
-        Committee.objects.all().delete()
+        start = time.monotonic()
+        tables = [m._meta.db_table for m in reversed(MODELS)]
+        sql_list = connection.ops.sql_flush(
+            no_style(),
+            tables,
+            reset_sequences=True)
+        connection.ops.execute_sql_flush(sql_list)
+        get_search_index().clear()
+        logger.info('Flushed database in {:.1f} seconds'.format(
+            time.monotonic() - start))
 
-        logger.info('Parsing archive')
-        self.build_mappings()
+    def load_full(self):
+        """
+        Loads the whole archive into empty tables.
+        """
+        # Indexes are rebuilt before amendments are resolved, since
+        # that looks filings up by committee and period
+        with deferred_indexes(self.report):
+            if self.url:
+                with self.report.stage('load') as stats:
+                    logger.info('Parsing archive')
+                    # Filings are fingerprinted as their rows go by
+                    self.fingerprints = {}
+                    rows = self.fingerprint_stream(
+                        read_stream(self.url, stats))
+                    self.load_archive(rows=rows)
+                    self.update_fingerprints()
+            else:
+                with self.report.stage('fingerprint') as stats:
+                    logger.info('Fingerprinting archive')
+                    self.fingerprints = self.fingerprint_archive()
+                    stats['bytes_read'] = os.stat(self.final_path).st_size
+                with self.report.stage('load') as stats:
+                    logger.info('Parsing archive')
+                    self.load_archive()
+                    stats['bytes_read'] = os.stat(self.final_path).st_size
+
+        with self.report.stage('amendments'):
+            logger.info('Resolving amendments')
+            self.resolve_amendments()
+
+    def load_staging(self):
+        """
+        Loads the whole archive into staging tables, checks that they
+        hold every row that was parsed, builds the summaries and search
+        index from them, and swaps them all with the live tables in one
+        transaction, so readers never see new rows with old summaries
+        or search results.
+        """
+        staging = StagingTables()
+        with self.report.stage('staging'):
+            staging.create()
+        try:
+            with staging.use():
+                self.load_full()
+            with self.report.stage('check'):
+                counts = staging.count()
+            expected = {
+                F8872: len(PARSED_FILING_IDS),
+                Contribution: self.counts['contributions'],
+                Expenditure: self.counts['expenditures'],
+            }
+            for model, count in expected.items():
+                if counts[model] != count:
+                    raise CommandError(
+                        'Expected {} rows in the staging table for {} '
+                        'but found {}'.format(
+                            count, model.__name__, counts[model]))
+            with staging.use():
+                self.update_summaries()
+                self.update_search(search_index=staging.search_index)
+        except BaseException:
+            staging.drop()
+            raise
+        with self.report.stage('swap'):
+            staging.swap()
+
+    def write_report(self, path, options):
+        """
+        Writes the report of this load as JSON.
+        """
+        errors = collections.Counter(CONVERSION_ERRORS)
+        for worker_errors in self.worker_errors.values():
+            errors.update(worker_errors)
+
+        self.report.info.update({
+            'command': 'loadIRS',
+            'archive': self.url or self.final_path,
+            'compression': self.compression,
+            'options': dict(
+                (key, options[key]) for key in (
+                    'test', 'incremental', 'workers', 'writers', 'reader',
+                    'batch_size', 'swap', 'profile')),
+            'rows': dict(self.counts),
+            'deferred_rows': self.deferred_rows,
+            'skipped_orphans': dict(ORPHANS),
+            'conversion_errors': dict(
+                (CELL_TYPE_NAMES[cell_type], count)
+                for cell_type, count in errors.items()),
+        })
+
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.report.write(path)
+
+    def log_summary(self):
+        """
+        Logs how well the conversion caches worked, adding up the
+        caches of any parsing processes.
+        """
+        totals = cache_stats()
+        for stats in self.worker_cache_stats.values():
+            for cell_type, (hits, misses) in stats.items():
+                total_hits, total_misses = totals.get(cell_type, (0, 0))
+                totals[cell_type] = (total_hits + hits, total_misses + misses)
 
+        for cell_type, (hits, misses) in sorted(totals.items()):
+            if hits + misses:
+                logger.info(
+                    'Conversion cache for {} fields: {} hits, {} misses '
+                    '({:.0%} hit rate)'.format(
+                        CELL_TYPE_NAMES[cell_type],
+                        hits,
+                        misses,
+                        hits / (hits + misses)))
+
+    def reset_state(self):
+        """
+        Clears the module-level buffers left over from a previous load.
+        """
+        global FILINGS
         global CONTRIBUTIONS
         global EXPENDITURES
 
-        with open(self.final_path, 'r', encoding='ISO-8859-1', newline='') as raw_file:
-            reader = csv.reader(raw_file, delimiter='|')
-
-            for row in reader:
-                # Use bulk_create to save contributions and expenditures
-                # 5000 at a time
-                if len(CONTRIBUTIONS) > 5000:
-                    Contribution.objects.bulk_create(CONTRIBUTIONS)
-                    CONTRIBUTIONS = []
-                if len(EXPENDITURES) > 5000:
-                    Expenditure.objects.bulk_create(EXPENDITURES)
-                    EXPENDITURES = []
-
-                try:
-                    form_type = row[0]
-                    if form_type == '2':
-                        RowParser(form_type, self.mappings['F8872'], row)
-                    elif form_type == 'A':
-                        RowParser(form_type, self.mappings['sa'], row)
-                    elif form_type == 'B':
-                        RowParser(form_type, self.mappings['sb'], row)
-                except IndexError:
-                    pass
-
-            # Save the remaining contributions and expenditures
-            Contribution.objects.bulk_create(CONTRIBUTIONS)
-            Expenditure.objects.bulk_create(EXPENDITURES)
-
-        logger.info('Resolving amendments')
-        for filing in F8872.objects.filter(amended_report_indicator=1):
-            previous_filings = F8872.objects.filter(
-                committee_id=filing.EIN,
-                begin_date=filing.begin_date,
-                end_date=filing.end_date,
-                form_id_number__lt=filing.form_id_number)
-
-            previous_filings.update(
-                is_amended=True,
-                amended_by_id=filing.form_id_number)
+        FILINGS = []
+        CONTRIBUTIONS = []
+        EXPENDITURES = []
+        PARSED_FILING_IDS.clear()
+        REPEATED_FILING_IDS.clear()
+        FILING_KEYS.clear()
+        COMMITTEE_KEYS.clear()
+        DEFERRED_ROWS.clear()
+        ORPHANS.clear()
+        CONVERSION_ERRORS.clear()
+        clear_caches()
+        self.worker_cache_stats = {}
+        self.worker_errors = {}
+        self.counts = collections.Counter()
+        self.deferred_rows = 0
+        self.committee_names = {}
+        self.stamped = {}
+        # Filings handed to the writer threads since they last caught up
+        self.queued_filing_ids = set()
+        self.threads = None
+
+    def load_keys(self):
+        """
+        Reads the keys of the filings and committees that are already
+        loaded, so they keep them when they're loaded again, even into
+        emptied or staging tables.
+        """
+        FILING_KEYS.load(F8872, 'form_id_number')
+        COMMITTEE_KEYS.load(Committee, 'EIN')
+
+    def reset_sequences(self):
+        """
+        Moves the sequences of the filing and committee keys past the
+        keys handed out by the loader, on databases that need it.
+        """
+        sql_list = connection.ops.sequence_reset_sql(
+            no_style(),
+            [Committee, F8872])
+        if sql_list:
+            with connection.cursor() as cursor:
+                for sql in sql_list:
+                    cursor.execute(sql)
+
+    def start_pool(self, only=None):
+        """
+        Starts the pool of worker processes that parse the archive.
+        """
+        # Forked processes inherit Django's settings
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            context = multiprocessing.get_context()
+
+        return context.Pool(
+            self.workers,
+            initializer=init_worker,
+            initargs=(
+                self.final_path,
+                self.mappings,
+                only,
+                self.reader))
+
+    def map_chunks(self, func, only=None, pool=None):
+        """
+        Splits the archive into byte ranges and runs `func` on each of
+        them in a pool of worker processes, yielding the results in
+        file order. Only a few chunks are parsed ahead of the one
+        being consumed, so memory use stays bounded. A `pool` that was
+        already started is used if it's given.
+        """
+        if pool is None:
+            with self.start_pool(only) as pool:
+                for result in self.map_chunks(func, only, pool):
+                    yield result
+            return
+
+        count = max(
+            self.workers * 4,
+            os.stat(self.final_path).st_size // CHUNK_SIZE)
+        byte_ranges = split_archive(self.final_path, count)
+
+        pending = collections.deque()
+        for byte_range in byte_ranges:
+            pending.append(pool.apply_async(func, (byte_range,)))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def parse_archive(self, only=None, rows=None, pool=None):
+        """
+        Yields the form type and cleaned values of every row in the
+        archive, or of the given raw rows, in file order.
+        """
+        if rows is not None:
+            for parsed in parse_rows(rows, self.converters, only):
+                yield parsed
+        elif self.workers > 1:
+            for pid, stats, errors, chunk in self.map_chunks(
+                    parse_chunk, only, pool):
+                self.worker_cache_stats[pid] = stats
+                self.worker_errors[pid] = errors
+                for parsed in chunk:
+                    yield parsed
+        else:
+            rows = read_rows(
+                self.final_path,
+                self.reader,
+                widths=get_widths(self.mappings),
+                only=only)
+            for parsed in parse_rows(rows, self.converters, only):
+                yield parsed
+
+    def fingerprint_archive(self):
+        """
+        Computes a fingerprint for every filing in the archive from
+        its form 8872 row, which includes the insert datetime, and
+        all of its schedule A and B rows.
+        """
+        if self.workers > 1:
+            hashes = {}
+            for chunk in self.map_chunks(fingerprint_chunk):
+                combine_fingerprints(hashes, chunk)
+        else:
+            hashes = fingerprint_rows(
+                read_rows(self.final_path, self.reader))
+        return hashes
+
+    def fingerprint_stream(self, rows):
+        """
+        Adds each row to the fingerprints of its filing as it is read.
+        """
+        for row in rows:
+            fingerprint_rows((row,), self.fingerprints)
+            yield row
+
+    def update_fingerprints(self):
+        """
+        Restamps the filings whose fingerprints changed after they were
+        saved. When an archive is streamed, a filing is stamped with the
+        rows read so far, and rows of it that come later in an archive
+        that isn't grouped by filing are only added up after that.
+        """
+        changed = [
+            F8872(
+                id=FILING_KEYS[form_id],
+                fingerprint=format_fingerprint(self.fingerprints[form_id]))
+            for form_id, value in self.stamped.items()
+            if self.fingerprints[form_id] != value]
+        if changed:
+            logger.info('Updating the fingerprints of {} filings'.format(
+                len(changed)))
+            F8872.objects.bulk_update(
+                changed, ['fingerprint'], batch_size=BATCH_SIZE)
+
+    def load_incremental(self):
+        """
+        Compares the fingerprint of every filing in the archive to the
+        one stored in the database and only deletes, replaces or inserts
+        the filings that changed. Each batch is written in its own
+        transaction, so the tables stay readable during the load.
+        """
+        with self.report.stage('fingerprint') as stats:
+            logger.info('Fingerprinting archive')
+            self.fingerprints = self.fingerprint_archive()
+            stats['bytes_read'] = os.stat(self.final_path).st_size
+
+            # Only filings that have a form 8872 row will be loaded
+            existing = dict(F8872.objects.values_list(
+                'form_id_number',
+                'fingerprint'))
+            changed = set(
+                form_id for form_id, fingerprint in self.fingerprints.items()
+                if existing.get(form_id) != format_fingerprint(fingerprint))
+            removed = set(existing) - set(self.fingerprints)
+            # Summaries of the committees and years of filings that
+            # are replaced or deleted have to be rebuilt
+            affected = self.get_periods((changed & set(existing)) | removed)
+            logger.info('{} new, {} changed and {} removed filings'.format(
+                len(changed - set(existing)),
+                len(changed & set(existing)),
+                len(removed)))
+
+        with self.report.stage('delete'):
+            logger.info('Removing deleted filings')
+            removed = list(removed)
+            for i in range(0, len(removed), BATCH_SIZE):
+                with transaction.atomic():
+                    self.delete_filings(removed[i:i + BATCH_SIZE])
+            Committee.objects.filter(filings__isnull=True).delete()
+
+        with self.report.stage('load') as stats:
+            logger.info('Parsing archive')
+            self.load_archive(only=changed, replace=set(existing))
+            stats['bytes_read'] = os.stat(self.final_path).st_size
+
+        with self.report.stage('amendments'):
+            logger.info('Resolving amendments')
+            with transaction.atomic():
+                amended = self.resolve_amendments()
+
+        # Along with those of the filings that were loaded or whose
+        # amendments changed
+        for form_ids in (changed, [f.form_id_number for f in amended]):
+            committees, years = self.get_periods(form_ids)
+            affected[0].update(committees)
+            affected[1].update(years)
+        self.update_summaries(*affected)
+        self.update_search(set(
+            FILING_KEYS[form_id] for form_id in changed.union(removed)
+            if form_id in FILING_KEYS))
+
+    def get_periods(self, form_ids):
+        """
+        Returns the committees and years of the given filings.
+        """
+        committees = set()
+        years = set()
+        form_ids = list(form_ids)
+        for i in range(0, len(form_ids), BATCH_SIZE):
+            for committee_id, end_date in F8872.objects.filter(
+                    form_id_number__in=form_ids[i:i + BATCH_SIZE]).values_list(
+                    'committee_id', 'end_date').order_by():
+                committees.add(committee_id)
+                years.add(end_date.year)
+        return committees, years
+
+    def update_summaries(self, committees=None, years=None):
+        """
+        Rebuilds the summary tables of the given committees and years,
+        or all of them.
+        """
+        if committees is not None and not committees and not years:
+            return
+        with self.report.stage('summaries'):
+            logger.info('Updating summaries')
+            refresh_summaries(committees, years)
+
+    def update_search(self, filing_ids=None, search_index=None):
+        """
+        Reindexes the rows of the filings with the given keys for
+        search, or indexes every row, in the given index or the live one.
+        """
+        if filing_ids is not None and not filing_ids:
+            return
+        with self.report.stage('search'):
+            logger.info('Updating search index')
+            search_index = search_index or get_search_index()
+            if filing_ids is None:
+                search_index.rebuild()
+            else:
+                search_index.update(filing_ids)
+
+    def delete_filings(self, form_ids):
+        """
+        Deletes the given filings along with their contributions
+        and expenditures.
+        """
+        filings = F8872.objects.filter(form_id_number__in=form_ids)
+        Contribution.objects.filter(filing__in=filings.values('pk')).delete()
+        Expenditure.objects.filter(filing__in=filings.values('pk')).delete()
+        filings.delete()
+
+    def load_archive(self, only=None, replace=None, rows=None):
+        """
+        Parses the archive, or the given raw rows, and saves them in
+        batches. If `only` is given, rows belonging to other filings are
+        skipped. Filings in `replace` have their existing rows deleted
+        before they're saved.
+        """
+        # The parsing processes are forked before the writer threads
+        # start, so they don't inherit connections that are in use
+        pool = None
+        if rows is None and self.workers > 1:
+            pool = self.start_pool(only)
+        with pool or contextlib.nullcontext(), \
+                self.start_writers() as self.threads:
+            for form_type, values in self.parse_archive(only, rows, pool):
+                # Only write a batch at the start of a new filing so
+                # that a filing and its rows are saved together
+                if form_type == '2' and (
+                        self.batch_size() >= self.max_batch_size):
+                    self.save_batch(replace)
+
+                RowParser(
+                    form_type,
+                    self.mappings[MAPPING_NAMES[form_type]],
+                    None,
+                    values,
+                    self.field_names[form_type])
+
+            # Save the remaining filings, contributions and expenditures
+            self.save_batch(replace)
+            self.save_deferred(replace)
+        self.threads = None
+        self.reset_sequences()
+
+    def save_deferred(self, replace=None):
+        """
+        Saves the contributions and expenditures that came before their
+        filing in the archive, now that all of it has been read, and
+        skips the ones whose filing never turned up.
+        """
+        if not DEFERRED_ROWS:
+            return
+        logger.info('Saving {} rows that came before their filing'.format(
+            len(DEFERRED_ROWS)))
+        self.deferred_rows += len(DEFERRED_ROWS)
+
+        # Their filings have to be saved first
+        if self.threads is not None:
+            self.threads.wait()
+            self.queued_filing_ids.clear()
+
+        for form_type, values in DEFERRED_ROWS:
+            fields = self.field_names[form_type]
+            if values[fields.index('form_id_number')] not in (
+                    PARSED_FILING_IDS):
+                ORPHANS[SCHEDULE_NAMES[form_type]] += 1
+                continue
+            if self.batch_size() >= self.max_batch_size:
+                self.save_batch(replace)
+            RowParser(
+                form_type,
+                self.mappings[MAPPING_NAMES[form_type]],
+                None,
+                values,
+                fields)
+        self.save_batch(replace)
+        DEFERRED_ROWS.clear()
+
+        if ORPHANS:
+            logger.info('Skipped {} contributions and {} expenditures '
+                        'without a filing'.format(
+                            ORPHANS['contributions'],
+                            ORPHANS['expenditures']))
+
+    def start_writers(self):
+        """
+        Starts the threads that save batches, if there are any.
+        """
+        if not self.writers:
+            return contextlib.nullcontext()
+        logger.debug('Saving batches in {} threads'.format(self.writers))
+        return WriterThreads(
+            self.write_batch,
+            self.writers,
+            initializer=self.init_writer)
+
+    def init_writer(self):
+        """
+        Sets up the connection of a thread that saves batches.
+        """
+        tune_connection()
+        if self.report is not None:
+            self.report.count_queries()
+
+    def batch_size(self):
+        return len(FILINGS) + len(CONTRIBUTIONS) + len(EXPENDITURES)
+
+    def save_batch(self, replace=None):
+        """
+        Saves the pending filings, contributions and expenditures, or
+        hands them to the writer threads.
+        """
+        global FILINGS
+        global CONTRIBUTIONS
+        global EXPENDITURES
+
+        names = {}
+        for filing in FILINGS:
+            if filing.form_id_number in self.fingerprints:
+                value = self.fingerprints[filing.form_id_number]
+                filing.fingerprint = format_fingerprint(value)
+                self.stamped[filing.form_id_number] = value
+            # Batches may be saved out of order, so the first filing
+            # for a committee is picked here
+            names[filing.EIN] = self.committee_names.setdefault(
+                filing.EIN, filing.organization_name)
+        self.counts['filings'] += len(FILINGS)
+        self.counts['contributions'] += len(CONTRIBUTIONS)
+        self.counts['expenditures'] += len(EXPENDITURES)
+
+        batch = (FILINGS, CONTRIBUTIONS, EXPENDITURES, replace, names)
+        if self.threads is None:
+            self.write_batch(*batch)
+        else:
+            form_ids = set(f.form_id_number for f in FILINGS)
+            # A filing that appeared before is replaced in file order,
+            # and rows whose filing is in an earlier batch wait for it
+            # to be committed, since their foreign keys are checked
+            # when their own batch commits
+            if form_ids & REPEATED_FILING_IDS or any(
+                    row.form_id_number in self.queued_filing_ids and
+                    row.form_id_number not in form_ids
+                    for row in itertools.chain(CONTRIBUTIONS, EXPENDITURES)):
+                self.threads.wait()
+                self.queued_filing_ids.clear()
+            self.threads.put(*batch)
+            self.queued_filing_ids.update(form_ids)
+
+        FILINGS = []
+        CONTRIBUTIONS = []
+        EXPENDITURES = []
+
+    def write_batch(self, filings, contributions, expenditures, replace=None,
+                    names=None):
+        """
+        Saves a batch in a single transaction. Filings in `replace`
+        have their existing contributions and expenditures deleted
+        first.
+        """
+        with transaction.atomic():
+            if replace:
+                replaced_ids = [
+                    f.pk for f in filings if f.form_id_number in replace]
+                Contribution.objects.filter(
+                    filing_id__in=replaced_ids).delete()
+                Expenditure.objects.filter(
+                    filing_id__in=replaced_ids).delete()
+
+            self.writer.write(filings, contributions, expenditures, names)
+
+    def resolve_amendments(self):
+        """
+        Marks filings that were superseded by a later amended filing
+        for the same committee and period. Each filing is marked as
+        amended by the earliest amendment filed after it.
+
+        Amendments are grouped by committee and period in memory, and
+        only the filings whose flags change are updated, in bulk. The
+        contributions and expenditures of those filings, and of the
+        filings loaded just now, are flagged to match. Returns the
+        filings that were updated.
+        """
+        amendments = collections.defaultdict(list)
+        amendment_keys = {}
+        for pk, form_id_number, EIN, begin_date, end_date in (
+                F8872.objects.filter(
+                    amended_report_indicator=1).order_by().values_list(
+                    'pk', 'form_id_number', 'EIN', 'begin_date',
+                    'end_date')):
+            amendments[(EIN, begin_date, end_date)].append(form_id_number)
+            amendment_keys[form_id_number] = pk
+        for form_ids in amendments.values():
+            form_ids.sort()
+
+        # Filings that should be amended, or were amended by a
+        # filing that has since changed
+        candidates = F8872.objects.filter(
+            Q(EIN__in=set(k[0] for k in amendments)) |
+            Q(is_amended=True)).order_by().only(
+            'form_id_number', 'EIN', 'begin_date', 'end_date',
+            'is_amended', 'amended_by_id')
+
+        changed = []
+        for filing in candidates.iterator():
+            form_ids = amendments.get(
+                (filing.EIN, filing.begin_date, filing.end_date), [])
+            i = bisect.bisect_right(form_ids, filing.form_id_number)
+            amended_by_id = (
+                amendment_keys[form_ids[i]] if i < len(form_ids) else None)
+            is_amended = amended_by_id is not None
+            if (filing.is_amended != is_amended or
+                    filing.amended_by_id != amended_by_id):
+                filing.is_amended = is_amended
+                filing.amended_by_id = amended_by_id
+                changed.append(filing)
+
+        F8872.objects.bulk_update(
+            changed,
+            ['is_amended', 'amended_by'],
+            batch_size=1000)
+        logger.debug('Updated {} amended filings'.format(len(changed)))
+
+        # Rows are saved as current, so only the ones of amended
+        # filings that were just loaded have to be flagged
+        changed_keys = set(f.pk for f in changed)
+        amended = set(
+            pk for pk, form_id_number in F8872.objects.filter(
+                is_amended=True).values_list('pk', 'form_id_number')
+            if form_id_number in PARSED_FILING_IDS or pk in changed_keys)
+        self.mark_current(amended, False)
+        self.mark_current([f.pk for f in changed if not f.is_amended], True)
+        return changed
+
+    def mark_current(self, filing_ids, is_current):
+        """
+        Sets whether the contributions and expenditures of the filings
+        with the given keys are current.
+        """
+        filing_ids = sorted(filing_ids)
+        count = 0
+        for i in range(0, len(filing_ids), BATCH_SIZE):
+            for model in (Contribution, Expenditure):
+                count += model.objects.filter(
+                    filing_id__in=filing_ids[i:i + BATCH_SIZE]).exclude(
+                    is_current=is_current).update(is_current=is_current)
+        logger.debug('Flagged {} rows as {}'.format(
+            count, 'current' if is_current else 'not current'))
 
     def build_mappings(self):
         """
         Uses CSV files of field names and positions for
         different filing types to load mappings into memory,
-        for use in parsing different types of rows.
+        for use in parsing different types of rows, and compiles
+        a converter for each of them.
         """
         self.mappings = {}
         for record_type in ('sa', 'sb', 'F8872'):
@@ -256,3 +1302,8 @@ class Command(IRSCommand):
                         row['field_type'])
 
             self.mappings[record_type] = mapping
+
+        self.converters = compile_mappings(self.mappings)
+        self.field_names = dict(
+            (form_type, get_field_names(self.mappings[name]))
+            for form_type, name in MAPPING_NAMES.items())
@@ -1,11 +1,98 @@
+import logging
+import requests
 from irs.management.commands import IRSCommand
+from irs.management.commands import downloadIRS
 from django.core.management import call_command
 
+logger = logging.getLogger(__name__)
+
 
 class Command(IRSCommand):
 
     help = "Download the latest IRS filings and load them into the database"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            dest='stream',
+            default=False,
+            help='Load the archive while it downloads, without writing '
+                 'it to disk',
+        )
+        parser.add_argument(
+            '--url',
+            dest='url',
+            default=self.url,
+            help='Where to download the archive from',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Download and load the archive even if it has not changed',
+        )
+
     def handle(self, *args, **options):
-        call_command('downloadIRS')
+        super(Command, self).handle(*args, **options)
+
+        if options['stream']:
+            self.load_stream(options['url'], options['force'])
+            return
+
+        download = downloadIRS.Command()
+        call_command(download, url=options['url'], force=options['force'])
+
+        # Skip the load if the archive we already loaded hasn't changed
+        if not download.changed and self.read_state().get('loaded'):
+            logger.info('Skipping load')
+            return
+
         call_command('loadIRS')
+        state = self.read_state()
+        state['loaded'] = True
+        self.write_state(state)
+
+    def load_stream(self, url, force=False):
+        """
+        Loads the archive while it downloads, unless it hasn't changed
+        since the last archive that was streamed. Nothing is saved to
+        disk to compare against, so a conditional HEAD request checks
+        the validators of the last streamed archive, which are only
+        recorded once it has loaded.
+        """
+        state = self.read_state()
+        streamed = state.get('stream') or {}
+        headers = {}
+        if not force:
+            if streamed.get('etag'):
+                headers['If-None-Match'] = streamed['etag']
+            if streamed.get('last_modified'):
+                headers['If-Modified-Since'] = streamed['last_modified']
+        r = requests.head(
+            url,
+            headers=headers,
+            allow_redirects=True,
+            timeout=60)
+        if r.status_code != 304:
+            r.raise_for_status()
+        validators = {
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+        }
+        # Servers that ignore conditional requests still send validators
+        unchanged = r.status_code == 304 or (
+            validators['etag'] and
+            validators['etag'] == streamed.get('etag'))
+        if unchanged and not force:
+            logger.info('The archive has not changed since the last load')
+            logger.info('Skipping load')
+            return
+
+        # Loaded into staging tables, so a download that fails partway
+        # leaves the live tables as they were
+        call_command('loadIRS', url=url, swap=True)
+        state = self.read_state()
+        state['stream'] = validators
+        self.write_state(state)
@@ -0,0 +1,137 @@
+# Generated by Django 5.1.15 on 2026-10-16 22:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Committee',
+            fields=[
+                ('EIN', models.CharField(max_length=9, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=70)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='F8872',
+            fields=[
+                ('record_type', models.CharField(max_length=1)),
+                ('form_type', models.IntegerField()),
+                ('form_id_number', models.CharField(max_length=38, primary_key=True, serialize=False)),
+                ('begin_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('initial_report_indicator', models.IntegerField(null=True)),
+                ('amended_report_indicator', models.IntegerField(null=True)),
+                ('final_report_indicator', models.IntegerField(null=True)),
+                ('change_of_address_indicator', models.IntegerField(null=True)),
+                ('organization_name', models.CharField(max_length=70)),
+                ('EIN', models.CharField(max_length=9)),
+                ('mailing_address_line_1', models.CharField(blank=True, max_length=50, null=True)),
+                ('mailing_address_line_2', models.CharField(blank=True, max_length=50, null=True)),
+                ('mailing_address_city', models.CharField(blank=True, max_length=50, null=True)),
+                ('mailing_address_state', models.CharField(blank=True, max_length=2, null=True)),
+                ('mailing_address_zip_code', models.CharField(blank=True, max_length=5, null=True)),
+                ('mailing_address_zip_ext', models.CharField(blank=True, max_length=4, null=True)),
+                ('email', models.CharField(blank=True, max_length=150, null=True)),
+                ('org_formation_date', models.DateField(null=True)),
+                ('custodian_name', models.CharField(blank=True, max_length=50, null=True)),
+                ('custodian_address_line_1', models.CharField(blank=True, max_length=50, null=True)),
+                ('custodian_address_line_2', models.CharField(blank=True, max_length=50, null=True)),
+                ('custodian_address_city', models.CharField(blank=True, max_length=50, null=True)),
+                ('custodian_address_state', models.CharField(blank=True, max_length=2, null=True)),
+                ('custodian_address_zip_code', models.CharField(blank=True, max_length=5, null=True)),
+                ('custodian_address_zip_ext', models.CharField(blank=True, max_length=4, null=True)),
+                ('contact_name', models.CharField(blank=True, max_length=50, null=True)),
+                ('contact_address_line_1', models.CharField(blank=True, max_length=50, null=True)),
+                ('contact_address_line_2', models.CharField(blank=True, max_length=50, null=True)),
+                ('contact_address_city', models.CharField(blank=True, max_length=50, null=True)),
+                ('contact_address_state', models.CharField(blank=True, max_length=2, null=True)),
+                ('contact_address_zip_code', models.CharField(blank=True, max_length=5, null=True)),
+                ('contact_address_zip_ext', models.CharField(blank=True, max_length=4, null=True)),
+                ('business_address_line_1', models.CharField(blank=True, max_length=50, null=True)),
+                ('business_address_line_2', models.CharField(blank=True, max_length=50, null=True)),
+                ('business_address_city', models.CharField(blank=True, max_length=50, null=True)),
+                ('business_address_state', models.CharField(blank=True, max_length=2, null=True)),
+                ('business_address_zip_code', models.CharField(blank=True, max_length=5, null=True)),
+                ('business_address_zip_ext', models.CharField(blank=True, max_length=4, null=True)),
+                ('quarter_indicator', models.IntegerField(null=True)),
+                ('monthly_report_month', models.IntegerField(null=True)),
+                ('pre_election_type', models.CharField(blank=True, max_length=10, null=True)),
+                ('election_date', models.DateField(null=True)),
+                ('election_state', models.CharField(blank=True, max_length=2, null=True)),
+                ('schedule_a_indicator', models.IntegerField(null=True)),
+                ('schedule_a_total', models.DecimalField(decimal_places=2, max_digits=17)),
+                ('schedule_b_indicator', models.IntegerField(null=True)),
+                ('schedule_b_total', models.DecimalField(decimal_places=2, max_digits=17)),
+                ('insert_datetime', models.DateTimeField()),
+                ('is_amended', models.BooleanField(default=False)),
+                ('amended_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='amends', to='irs.f8872')),
+                ('committee', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='filings', to='irs.committee')),
+            ],
+            options={
+                'ordering': ['-end_date', '-form_id_number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Expenditure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_type', models.CharField(max_length=1)),
+                ('form_id_number', models.CharField(max_length=38)),
+                ('schedule_b_id', models.CharField(max_length=38)),
+                ('organization_name', models.CharField(max_length=70)),
+                ('EIN', models.CharField(max_length=9)),
+                ('recipient_name', models.CharField(blank=True, max_length=70, null=True)),
+                ('recipient_address_line_1', models.CharField(blank=True, max_length=100, null=True)),
+                ('recipient_address_line_2', models.CharField(blank=True, max_length=100, null=True)),
+                ('recipient_address_city', models.CharField(blank=True, max_length=50, null=True)),
+                ('recipient_address_state', models.CharField(blank=True, max_length=2, null=True)),
+                ('recipient_address_zip_code', models.CharField(blank=True, max_length=5, null=True)),
+                ('recipient_address_zip_ext', models.CharField(blank=True, max_length=4, null=True)),
+                ('recipient_employer', models.CharField(blank=True, max_length=70, null=True)),
+                ('expenditure_amount', models.DecimalField(decimal_places=2, max_digits=17, null=True)),
+                ('recipient_occupation', models.CharField(blank=True, max_length=70, null=True)),
+                ('expenditure_date', models.DateField(null=True)),
+                ('expenditure_purpose', models.CharField(blank=True, max_length=512, null=True)),
+                ('committee', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='expenditures', to='irs.committee')),
+                ('filing', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='expenditures', to='irs.f8872')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Contribution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_type', models.CharField(max_length=1)),
+                ('form_id_number', models.CharField(max_length=38)),
+                ('schedule_a_id', models.CharField(max_length=38)),
+                ('organization_name', models.CharField(max_length=70)),
+                ('EIN', models.CharField(max_length=9)),
+                ('contributor_name', models.CharField(blank=True, max_length=70, null=True)),
+                ('contributor_address_line_1', models.CharField(blank=True, max_length=100, null=True)),
+                ('contributor_address_line_2', models.CharField(blank=True, max_length=100, null=True)),
+                ('contributor_address_city', models.CharField(blank=True, max_length=50, null=True)),
+                ('contributor_address_state', models.CharField(blank=True, max_length=2, null=True)),
+                ('contributor_address_zip_code', models.CharField(blank=True, max_length=5, null=True)),
+                ('contributor_address_zip_ext', models.CharField(blank=True, max_length=4, null=True)),
+                ('contributor_employer', models.CharField(blank=True, max_length=70, null=True)),
+                ('contribution_amount', models.DecimalField(decimal_places=2, max_digits=17, null=True)),
+                ('contributor_occupation', models.CharField(blank=True, max_length=70, null=True)),
+                ('agg_contribution_ytd', models.DecimalField(decimal_places=2, max_digits=17, null=True)),
+                ('contribution_date', models.DateField(null=True)),
+                ('entity_type', models.CharField(blank=True, max_length=20, null=True)),
+                ('contributor_first_name', models.CharField(blank=True, max_length=70, null=True)),
+                ('contributor_last_name', models.CharField(blank=True, max_length=70, null=True)),
+                ('contributor_middle_name', models.CharField(blank=True, max_length=70, null=True)),
+                ('contributor_corporation_name', models.CharField(blank=True, max_length=70, null=True)),
+                ('committee', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='irs.committee')),
+                ('filing', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='irs.f8872')),
+            ],
+        ),
+    ]
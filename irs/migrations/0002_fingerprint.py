@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-16 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('irs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='f8872',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.15 on 2026-10-16 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('irs', '0002_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['form_id_number'], name='irs_contrib_form_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['EIN'], name='irs_contrib_ein_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['contribution_date', 'id'], name='irs_contrib_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['contributor_address_state'], name='irs_contrib_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['committee', 'contribution_date'], name='irs_contrib_committee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['form_id_number'], name='irs_expend_form_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['EIN'], name='irs_expend_ein_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['expenditure_date', 'id'], name='irs_expend_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['recipient_address_state'], name='irs_expend_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['committee', 'expenditure_date'], name='irs_expend_committee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='f8872',
+            index=models.Index(fields=['-end_date', '-form_id_number'], name='irs_f8872_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='f8872',
+            index=models.Index(fields=['EIN', 'begin_date', 'end_date'], name='irs_f8872_period_idx'),
+        ),
+    ]
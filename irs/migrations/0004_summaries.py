@@ -0,0 +1,63 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('irs', '0003_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaceTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('state', models.CharField(blank=True, max_length=2, null=True)),
+                ('zip3', models.CharField(blank=True, max_length=3, null=True)),
+                ('contribution_total', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('contribution_count', models.IntegerField(default=0)),
+                ('expenditure_total', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('expenditure_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['year', 'state', 'zip3'],
+                'indexes': [models.Index(fields=['year', 'state', 'zip3'], name='irs_place_total_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CommitteeTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('filing_count', models.IntegerField(default=0)),
+                ('contribution_total', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('contribution_count', models.IntegerField(default=0)),
+                ('expenditure_total', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('expenditure_count', models.IntegerField(default=0)),
+                ('committee', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='totals', to='irs.committee')),
+            ],
+            options={
+                'ordering': ['committee', 'year'],
+                'constraints': [models.UniqueConstraint(fields=('committee', 'year'), name='irs_committee_total_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TopContributor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.IntegerField()),
+                ('contributor_name', models.CharField(max_length=70)),
+                ('contribution_total', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('contribution_count', models.IntegerField(default=0)),
+                ('committee', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='top_contributors', to='irs.committee')),
+            ],
+            options={
+                'ordering': ['committee', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('committee', 'rank'), name='irs_top_contributor_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+def mark_amended(apps, schema_editor):
+    """
+    Flags the rows of filings that were already amended.
+    """
+    for model_name in ('Contribution', 'Expenditure'):
+        model = apps.get_model('irs', model_name)
+        model.objects.filter(filing__is_amended=True).update(
+            is_current=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('irs', '0004_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contribution',
+            name='is_current',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='expenditure',
+            name='is_current',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(mark_amended, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['is_current', 'committee'], name='irs_contrib_current_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['is_current', 'committee'], name='irs_expend_current_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# The searched columns as of this migration
+SEARCH_FIELDS = {
+    'Committee': ('name',),
+    'Contribution': (
+        'contributor_name',
+        'contributor_employer',
+        'organization_name'),
+    'Expenditure': (
+        'recipient_name',
+        'recipient_employer',
+        'expenditure_purpose',
+        'organization_name'),
+}
+SEARCH_TABLES = {
+    'Committee': 'irs_committee_search',
+    'Contribution': 'irs_contribution_search',
+    'Expenditure': 'irs_expenditure_search',
+}
+SEARCH_INDEXES = {
+    'Committee': 'irs_committee_search_idx',
+    'Contribution': 'irs_contrib_search_idx',
+    'Expenditure': 'irs_expend_search_idx',
+}
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Builds the search index of the rows that are already loaded: FTS5
+    tables on SQLite and GIN indexes on PostgreSQL.
+    """
+    vendor = schema_editor.connection.vendor
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('irs', model_name)
+        if vendor == 'sqlite':
+            columns = ['key']
+            if model_name != 'Committee':
+                columns.append('filing_id')
+            columns.extend(fields)
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE {} USING fts5(key UNINDEXED, {}, '
+                "tokenize='unicode61 remove_diacritics 2')".format(
+                    SEARCH_TABLES[model_name], ', '.join(columns[1:])))
+            schema_editor.execute(
+                'INSERT INTO {} ({}) SELECT {}, {} FROM {}'.format(
+                    SEARCH_TABLES[model_name],
+                    ', '.join(columns),
+                    model._meta.pk.column,
+                    ', '.join(columns[1:]),
+                    model._meta.db_table))
+        elif vendor == 'postgresql':
+            from django.contrib.postgres.indexes import GinIndex
+            from django.contrib.postgres.search import SearchVector
+            schema_editor.add_index(model, GinIndex(
+                SearchVector(*fields, config='simple'),
+                name=SEARCH_INDEXES[model_name]))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for model_name in SEARCH_FIELDS:
+        if vendor == 'sqlite':
+            schema_editor.execute(
+                'DROP TABLE IF EXISTS {}'.format(SEARCH_TABLES[model_name]))
+        elif vendor == 'postgresql':
+            schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+                SEARCH_INDEXES[model_name]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('irs', '0005_current'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,239 @@
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+# The models whose tables are rebuilt, parents before children
+MODEL_NAMES = (
+    'Committee',
+    'F8872',
+    'Contribution',
+    'Expenditure',
+    'CommitteeTotal',
+    'TopContributor',
+)
+
+# The search index as of 0006_search
+SEARCH_FIELDS = {
+    'Committee': ('name',),
+    'Contribution': (
+        'contributor_name',
+        'contributor_employer',
+        'organization_name'),
+    'Expenditure': (
+        'recipient_name',
+        'recipient_employer',
+        'expenditure_purpose',
+        'organization_name'),
+}
+SEARCH_TABLES = {
+    'Committee': 'irs_committee_search',
+    'Contribution': 'irs_contribution_search',
+    'Expenditure': 'irs_expenditure_search',
+}
+SEARCH_INDEXES = {
+    'Committee': 'irs_committee_search_idx',
+    'Contribution': 'irs_contrib_search_idx',
+    'Expenditure': 'irs_expend_search_idx',
+}
+
+
+def drop_indexes(apps, schema_editor):
+    """
+    Drops the named indexes and constraints of the tables with text
+    keys, and the search index, so that the new tables can be built
+    with the same names alongside them.
+    """
+    for model_name in MODEL_NAMES:
+        model = apps.get_model('irs', model_name)
+        for index in model._meta.indexes:
+            schema_editor.remove_index(model, index)
+        for constraint in model._meta.constraints:
+            schema_editor.remove_constraint(model, constraint)
+    for model_name in SEARCH_FIELDS:
+        if schema_editor.connection.vendor == 'sqlite':
+            schema_editor.execute(
+                'DROP TABLE IF EXISTS {}'.format(SEARCH_TABLES[model_name]))
+        elif schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+                SEARCH_INDEXES[model_name]))
+
+
+def copy_rows(schema_editor, model, old_table, columns, joins=''):
+    """
+    Copies rows from the old table of a model into the new one. Columns
+    are given as (column, expression) pairs, where the expression reads
+    from the old table as "o".
+    """
+    qn = schema_editor.quote_name
+    schema_editor.execute('INSERT INTO {} ({}) SELECT {} FROM {} o {}'.format(
+        qn(model._meta.db_table),
+        ', '.join(qn(column) for column, expression in columns),
+        ', '.join(expression for column, expression in columns),
+        qn(old_table),
+        joins))
+
+
+def use_integer_keys(apps, schema_editor):
+    """
+    Builds new tables for committees and filings with integer keys
+    handed out in order of EIN and form id number, and for the tables
+    that refer to them, copies the rows across, swapping text keys for
+    integer ones, and puts the new tables in place of the old.
+    """
+    connection = schema_editor.connection
+    qn = schema_editor.quote_name
+    rebuilt = [apps.get_model('irs', name) for name in MODEL_NAMES]
+    Committee, F8872 = rebuilt[:2]
+    tables = {model: model._meta.db_table for model in rebuilt}
+
+    for model in rebuilt:
+        model._meta.db_table = tables[model] + '_new'
+    try:
+        for model in rebuilt:
+            schema_editor.create_model(model)
+
+        def plain(model, *skip):
+            return [
+                (f.column, 'o.' + qn(f.column))
+                for f in model._meta.concrete_fields
+                if f.name not in skip]
+
+        copy_rows(
+            schema_editor,
+            Committee,
+            tables[Committee],
+            plain(Committee, 'id'),
+            'ORDER BY o.{}'.format(qn('EIN')))
+        committee_join = 'LEFT JOIN {} c ON c.{} = o.{}'.format(
+            qn(Committee._meta.db_table), qn('EIN'), qn('committee_id'))
+        copy_rows(
+            schema_editor,
+            F8872,
+            tables[F8872],
+            plain(F8872, 'id', 'committee', 'amended_by') + [
+                ('committee_id', 'c.id')],
+            committee_join + ' ORDER BY o.{}'.format(qn('form_id_number')))
+
+        # Filings amended by filings, as new keys
+        keys = dict(F8872.objects.values_list('form_id_number', 'pk'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT {}, {} FROM {} WHERE {} IS NOT NULL'.format(
+                    qn('form_id_number'),
+                    qn('amended_by_id'),
+                    qn(tables[F8872]),
+                    qn('amended_by_id')))
+            amended = [
+                F8872(pk=keys[form_id], amended_by_id=keys.get(amended_by))
+                for form_id, amended_by in cursor.fetchall()]
+        F8872.objects.bulk_update(amended, ['amended_by'], batch_size=1000)
+
+        for model in rebuilt[2:4]:
+            copy_rows(
+                schema_editor,
+                model,
+                tables[model],
+                plain(model, 'filing', 'committee') + [
+                    ('filing_id', 'f.id'),
+                    ('committee_id', 'c.id')],
+                committee_join + ' LEFT JOIN {} f ON f.{} = o.{}'.format(
+                    qn(F8872._meta.db_table),
+                    qn('form_id_number'),
+                    qn('filing_id')))
+        for model in rebuilt[4:]:
+            copy_rows(
+                schema_editor,
+                model,
+                tables[model],
+                plain(model, 'committee') + [('committee_id', 'c.id')],
+                committee_join.replace('LEFT JOIN', 'JOIN'))
+
+        # Tables with pending foreign key checks can't be altered
+        if connection.vendor == 'postgresql':
+            schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        for model in reversed(rebuilt):
+            schema_editor.execute(
+                schema_editor.sql_delete_table % {'table': qn(tables[model])})
+        for model in rebuilt:
+            schema_editor.alter_db_table(
+                model, model._meta.db_table, tables[model])
+            model._meta.db_table = tables[model]
+        if connection.vendor == 'postgresql':
+            schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+    finally:
+        for model in rebuilt:
+            model._meta.db_table = tables[model]
+
+    # Ids were copied, so sequences start after the highest of them
+    for sql in connection.ops.sequence_reset_sql(no_style(), rebuilt):
+        schema_editor.execute(sql)
+
+    create_search_index(apps, schema_editor)
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Builds the search index again, now that contributions and
+    expenditures refer to their filings by integer keys.
+    """
+    vendor = schema_editor.connection.vendor
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('irs', model_name)
+        if vendor == 'sqlite':
+            columns = ['key']
+            if model_name != 'Committee':
+                columns.append('filing_id')
+            columns.extend(fields)
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE {} USING fts5(key UNINDEXED, {}, '
+                "tokenize='unicode61 remove_diacritics 2')".format(
+                    SEARCH_TABLES[model_name], ', '.join(columns[1:])))
+            schema_editor.execute(
+                'INSERT INTO {} ({}) SELECT {}, {} FROM {}'.format(
+                    SEARCH_TABLES[model_name],
+                    ', '.join(columns),
+                    model._meta.pk.column,
+                    ', '.join(columns[1:]),
+                    model._meta.db_table))
+        elif vendor == 'postgresql':
+            from django.contrib.postgres.indexes import GinIndex
+            from django.contrib.postgres.search import SearchVector
+            schema_editor.add_index(model, GinIndex(
+                SearchVector(*fields, config='simple'),
+                name=SEARCH_INDEXES[model_name]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('irs', '0006_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_indexes),
+        # Only the state changes here; the tables are built again below
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='committee',
+                name='EIN',
+                field=models.CharField(max_length=9, unique=True),
+            ),
+            migrations.AddField(
+                model_name='committee',
+                name='id',
+                field=models.AutoField(primary_key=True, serialize=False),
+                preserve_default=False,
+            ),
+            migrations.AlterField(
+                model_name='f8872',
+                name='form_id_number',
+                field=models.CharField(max_length=38, unique=True),
+            ),
+            migrations.AddField(
+                model_name='f8872',
+                name='id',
+                field=models.AutoField(primary_key=True, serialize=False),
+                preserve_default=False,
+            ),
+        ]),
+        migrations.RunPython(use_integer_keys),
+    ]
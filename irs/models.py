@@ -1,4 +1,27 @@
-from django.db import models
+from django.db import connections, models
+
+
+class SearchQuerySet(models.QuerySet):
+
+    def search(self, text):
+        """
+        Returns the rows where every word of `text` starts a word of
+        one of the searched names, using the full-text index that
+        loadIRS keeps up to date.
+        """
+        from irs.search import get_search_index
+        return get_search_index(connections[self.db]).search(self, text)
+
+
+class CurrentManager(models.Manager.from_queryset(SearchQuerySet)):
+    """
+    Only returns contributions or expenditures of filings that
+    haven't been amended, without joining them to their filings.
+    """
+
+    def get_queryset(self):
+        return super(CurrentManager, self).get_queryset().filter(
+            is_current=True)
 
 
 class Committee(models.Model):
@@ -7,11 +30,14 @@ class Committee(models.Model):
     the IRS under section 527 of the U.S. tax code.
     """
 
+    id = models.AutoField(primary_key=True)
     EIN = models.CharField(
-        primary_key=True,
-        max_length=9)
+        max_length=9,
+        unique=True)
     name = models.CharField(max_length=70)
 
+    objects = SearchQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -83,6 +109,8 @@ class Contribution(models.Model):
         on_delete=models.CASCADE,
         null=True,
         related_name='contributions')
+    # False if the filing was amended, kept up to date by loadIRS
+    is_current = models.BooleanField(default=True)
 
     # For probabilistic people parsing
     entity_type = models.CharField(
@@ -106,6 +134,33 @@ class Contribution(models.Model):
         null=True,
         blank=True)
 
+    objects = SearchQuerySet.as_manager()
+    current = CurrentManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['form_id_number'],
+                name='irs_contrib_form_id_idx'),
+            models.Index(
+                fields=['EIN'],
+                name='irs_contrib_ein_idx'),
+            # Date filters, the admin date hierarchy and paging by date
+            models.Index(
+                fields=['contribution_date', 'id'],
+                name='irs_contrib_date_idx'),
+            models.Index(
+                fields=['contributor_address_state'],
+                name='irs_contrib_state_idx'),
+            # A committee's contributions over time
+            models.Index(
+                fields=['committee', 'contribution_date'],
+                name='irs_contrib_committee_date_idx'),
+            models.Index(
+                fields=['is_current', 'committee'],
+                name='irs_contrib_current_idx'),
+        ]
+
     def __str__(self):
         return self.contributor_name or ''
 
@@ -177,6 +232,35 @@ class Expenditure(models.Model):
         on_delete=models.CASCADE,
         null=True,
         related_name='expenditures')
+    # False if the filing was amended, kept up to date by loadIRS
+    is_current = models.BooleanField(default=True)
+
+    objects = SearchQuerySet.as_manager()
+    current = CurrentManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['form_id_number'],
+                name='irs_expend_form_id_idx'),
+            models.Index(
+                fields=['EIN'],
+                name='irs_expend_ein_idx'),
+            # Date filters, the admin date hierarchy and paging by date
+            models.Index(
+                fields=['expenditure_date', 'id'],
+                name='irs_expend_date_idx'),
+            models.Index(
+                fields=['recipient_address_state'],
+                name='irs_expend_state_idx'),
+            # A committee's expenditures over time
+            models.Index(
+                fields=['committee', 'expenditure_date'],
+                name='irs_expend_committee_date_idx'),
+            models.Index(
+                fields=['is_current', 'committee'],
+                name='irs_expend_current_idx'),
+        ]
 
     def __str__(self):
         return self.recipient_name or ''
@@ -188,6 +272,7 @@ class F8872(models.Model):
     expenditures for a political committee.
     """
 
+    id = models.AutoField(primary_key=True)
     committee = models.ForeignKey(
         'Committee',
         on_delete=models.CASCADE,
@@ -196,8 +281,8 @@ class F8872(models.Model):
     record_type = models.CharField(max_length=1)
     form_type = models.IntegerField()
     form_id_number = models.CharField(
-        primary_key=True,
-        max_length=38)
+        max_length=38,
+        unique=True)
     begin_date = models.DateField(auto_now=False)
     end_date = models.DateField(auto_now=False)
     initial_report_indicator = models.IntegerField(null=True)
@@ -340,6 +425,13 @@ class F8872(models.Model):
         decimal_places=2)
     insert_datetime = models.DateTimeField(auto_now=False)
 
+    # Hash of the raw filing and schedule rows, used by incremental loads
+    # to tell which filings changed since the last load
+    fingerprint = models.CharField(
+        max_length=40,
+        null=True,
+        blank=True)
+
     is_amended = models.BooleanField(default=False)
     amended_by = models.ForeignKey(
         'self',
@@ -349,6 +441,128 @@ class F8872(models.Model):
 
     class Meta:
         ordering = ['-end_date', '-form_id_number']
+        indexes = [
+            # Lets the default ordering be read from an index
+            models.Index(
+                fields=['-end_date', '-form_id_number'],
+                name='irs_f8872_ordering_idx'),
+            # Filings for the same committee and period, which is
+            # how amendments are matched to the filings they amend
+            models.Index(
+                fields=['EIN', 'begin_date', 'end_date'],
+                name='irs_f8872_period_idx'),
+        ]
 
     def __str__(self):
         return self.form_id_number
+
+
+class CommitteeTotal(models.Model):
+    """
+    What a committee raised and spent in the filings for one year,
+    leaving out filings that were amended. Rebuilt by loadIRS from the
+    contributions and expenditures, so reports don't have to add them
+    up again.
+    """
+
+    # Summaries are rebuilt from the other tables rather than kept in
+    # step by the database, so they don't hold up flushes or swaps
+    committee = models.ForeignKey(
+        'Committee',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='totals')
+    # The year the reporting period of the filings ends in
+    year = models.IntegerField()
+    filing_count = models.IntegerField(default=0)
+    contribution_total = models.DecimalField(
+        max_digits=17,
+        decimal_places=2,
+        default=0)
+    contribution_count = models.IntegerField(default=0)
+    expenditure_total = models.DecimalField(
+        max_digits=17,
+        decimal_places=2,
+        default=0)
+    expenditure_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['committee', 'year']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['committee', 'year'],
+                name='irs_committee_total_unique'),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.committee_id, self.year)
+
+
+class PlaceTotal(models.Model):
+    """
+    Contributions from, and expenditures to, the addresses in a state
+    and the first three digits of a ZIP code in one year, leaving out
+    filings that were amended. Add them up by state for state totals.
+    """
+
+    year = models.IntegerField()
+    state = models.CharField(
+        max_length=2,
+        null=True,
+        blank=True)
+    zip3 = models.CharField(
+        max_length=3,
+        null=True,
+        blank=True)
+    contribution_total = models.DecimalField(
+        max_digits=17,
+        decimal_places=2,
+        default=0)
+    contribution_count = models.IntegerField(default=0)
+    expenditure_total = models.DecimalField(
+        max_digits=17,
+        decimal_places=2,
+        default=0)
+    expenditure_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['year', 'state', 'zip3']
+        indexes = [
+            models.Index(
+                fields=['year', 'state', 'zip3'],
+                name='irs_place_total_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {} {}'.format(self.year, self.state, self.zip3)
+
+
+class TopContributor(models.Model):
+    """
+    One of the contributors who gave a committee the most, by name,
+    leaving out filings that were amended.
+    """
+
+    committee = models.ForeignKey(
+        'Committee',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='top_contributors')
+    rank = models.IntegerField()
+    contributor_name = models.CharField(max_length=70)
+    contribution_total = models.DecimalField(
+        max_digits=17,
+        decimal_places=2,
+        default=0)
+    contribution_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['committee', 'rank']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['committee', 'rank'],
+                name='irs_top_contributor_unique'),
+        ]
+
+    def __str__(self):
+        return self.contributor_name
@@ -0,0 +1,74 @@
+import json
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Counts of up to this many rows are exact. Past it, they're estimated
+# where the database can, and otherwise stop here.
+COUNT_LIMIT = 10000
+
+
+def estimate_count(queryset):
+    """
+    Returns a rough number of rows in a queryset, read from the
+    database's statistics without counting them, or None if the
+    database can't estimate it.
+    """
+    connection = connections[queryset.db]
+    model = queryset.model
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [model._meta.db_table])
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT table_rows FROM information_schema.tables '
+                    'WHERE table_schema = DATABASE() AND table_name = %s',
+                    [model._meta.db_table])
+            elif connection.vendor == 'sqlite' and (
+                    model._meta.pk.get_internal_type() in (
+                        'AutoField', 'BigAutoField')):
+                # Ids are handed out in order from 1 after a flush, so
+                # the highest is close to the number of rows, and it's
+                # read from the end of the primary key
+                cursor.execute('SELECT MAX({}) FROM {}'.format(
+                    connection.ops.quote_name(model._meta.pk.column),
+                    connection.ops.quote_name(model._meta.db_table)))
+            else:
+                return None
+            row = cursor.fetchone()
+            # reltuples is -1 for tables that were never analyzed
+            if row is None or row[0] is None or row[0] < 0:
+                return None
+            return int(row[0])
+
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator for tables too big to count on every page. Counts of
+    more than COUNT_LIMIT rows are estimates, or stop at COUNT_LIMIT
+    where the database can't estimate them, so pages past it aren't
+    linked to.
+    """
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super(EstimatedCountPaginator, self).count
+        queryset = self.object_list.order_by()
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate > COUNT_LIMIT:
+            return estimate
+        # A subquery with a LIMIT, which stops scanning there
+        return queryset[:COUNT_LIMIT].count()
@@ -0,0 +1,134 @@
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from django.db import connection
+from django.utils import timezone
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss():
+    """
+    Returns the most memory, in bytes, that this process or any of its
+    finished child processes has used so far, or None if it can't be
+    measured here.
+    """
+    if resource is None:
+        return None
+    rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes and macOS bytes
+    if sys.platform != 'darwin':
+        rss *= 1024
+    return rss
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts queries and the time they take.
+    Rows sent with COPY don't go through it. It can be installed on the
+    connections of several threads at once.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.count += 1
+                self.seconds += seconds
+
+
+class LoadReport:
+    """
+    Collects what happened during a load: how long each stage took and
+    how many queries it ran, how many rows were read, saved or
+    skipped, and how much memory was used. Written out as JSON so
+    slow runs can be compared with earlier ones.
+    """
+
+    def __init__(self, started_at=None):
+        self.started_at = started_at or timezone.now()
+        self.stages = []
+        self.info = {}
+        # The query counter of the stage that's running
+        self.queries = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a stage of the load. Yields a dict that extra figures
+        for the stage, like the number of bytes it read, can be
+        added to.
+        """
+        stats = {'name': name}
+        queries = QueryCounter()
+        start = time.perf_counter()
+        self.queries = queries
+        try:
+            with connection.execute_wrapper(queries):
+                yield stats
+        finally:
+            self.queries = None
+            stats['seconds'] = round(time.perf_counter() - start, 3)
+            stats['queries'] = queries.count
+            stats['query_seconds'] = round(queries.seconds, 3)
+            stats['peak_rss'] = peak_rss()
+            self.stages.append(stats)
+            logger.info('{} took {:.1f} seconds and {} queries'.format(
+                name.capitalize(), stats['seconds'], queries.count))
+
+    def count_queries(self):
+        """
+        Counts the queries run on this thread's connection towards the
+        stage that's running, for the threads that save batches while
+        the main thread goes on parsing. Each thread has a connection
+        of its own, which the stages don't see otherwise.
+        """
+        connection.execute_wrappers.append(self.count_query)
+
+    def count_query(self, execute, sql, params, many, context):
+        queries = self.queries
+        if queries is None:
+            return execute(sql, params, many, context)
+        return queries(execute, sql, params, many, context)
+
+    def as_dict(self):
+        finished_at = timezone.now()
+        report = {
+            'started_at': self.started_at.isoformat(),
+            'finished_at': finished_at.isoformat(),
+            'seconds': round(
+                (finished_at - self.started_at).total_seconds(), 3),
+            'database': connection.vendor,
+            'bytes_read': sum(s.get('bytes_read', 0) for s in self.stages),
+            'queries': sum(s['queries'] for s in self.stages),
+            'query_seconds': round(
+                sum(s['query_seconds'] for s in self.stages), 3),
+            'peak_rss': peak_rss(),
+            'stages': self.stages,
+        }
+        report.update(self.info)
+        return report
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        logger.info('Wrote load report to {}'.format(path))
@@ -0,0 +1,295 @@
+import re
+import logging
+import operator
+import functools
+from django.db import connection as default_connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from irs.models import Committee, Contribution, Expenditure
+
+logger = logging.getLogger(__name__)
+
+# The columns of each model that are searched
+SEARCH_FIELDS = {
+    Committee: ('name',),
+    Contribution: (
+        'contributor_name',
+        'contributor_employer',
+        'organization_name'),
+    Expenditure: (
+        'recipient_name',
+        'recipient_employer',
+        'expenditure_purpose',
+        'organization_name'),
+}
+
+# The full-text table on SQLite and the index on PostgreSQL of each model
+SEARCH_TABLES = {
+    Committee: 'irs_committee_search',
+    Contribution: 'irs_contribution_search',
+    Expenditure: 'irs_expenditure_search',
+}
+SEARCH_INDEXES = {
+    Committee: 'irs_committee_search_idx',
+    Contribution: 'irs_contrib_search_idx',
+    Expenditure: 'irs_expend_search_idx',
+}
+
+# Names are indexed as they're spelled, without stemming
+SEARCH_CONFIG = 'simple'
+
+# Number of filings whose rows are reindexed per statement
+SEARCH_BATCH_SIZE = 500
+
+
+def get_words(text):
+    """
+    Splits a search into lowercase words, leaving out punctuation,
+    which the full-text syntax of each database would read as operators.
+    """
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+class SearchIndex:
+    """
+    Searches with icontains on databases without full-text search,
+    so that every word has to appear in one of the fields. Nothing
+    needs to be kept up to date, but no index can be used either.
+    """
+
+    def __init__(self, connection=None, suffix=''):
+        self.connection = connection or default_connection
+        # Added to the names of the tables or indexes of an index
+        # that's built for staging tables
+        self.suffix = suffix
+
+    def get_table(self, model):
+        return SEARCH_TABLES[model] + self.suffix
+
+    def get_index_name(self, model):
+        return SEARCH_INDEXES[model] + self.suffix
+
+    def clear(self):
+        """
+        Empties the index before a full load.
+        """
+
+    def rebuild(self):
+        """
+        Indexes every row after a full load.
+        """
+
+    def update(self, filing_ids):
+        """
+        Reindexes the rows of the filings with the given keys, which
+        have been loaded, replaced or deleted.
+        """
+
+    def drop(self):
+        """
+        Removes an index built for staging tables that won't be
+        swapped in.
+        """
+
+    def swap(self, editor):
+        """
+        Replaces the live index with one built for staging tables, in
+        the transaction that swaps them in, once the old tables have
+        been dropped.
+        """
+
+    def search(self, queryset, text):
+        """
+        Filters a queryset down to the rows where every word of `text`
+        starts a word in one of the searched fields.
+        """
+        fields = SEARCH_FIELDS[queryset.model]
+        for word in get_words(text):
+            queryset = queryset.filter(functools.reduce(operator.or_, (
+                Q(**{field + '__icontains': word}) for field in fields)))
+        return queryset
+
+
+class SQLiteSearchIndex(SearchIndex):
+    """
+    Keeps an FTS5 table next to each searched table, holding a copy of
+    its searched fields, the key of each row and, for contributions and
+    expenditures, the filing it belongs to, so the rows of a filing can
+    be found and reindexed when it changes.
+    """
+
+    def get_columns(self, model):
+        columns = ['key']
+        if model is not Committee:
+            columns.append('filing_id')
+        return columns + list(SEARCH_FIELDS[model])
+
+    def create(self, cursor, model):
+        cursor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5('
+            'key UNINDEXED, {}, '
+            "tokenize='unicode61 remove_diacritics 2')".format(
+                self.get_table(model),
+                ', '.join(self.get_columns(model)[1:])))
+
+    def fill(self, cursor, model, where='', params=()):
+        """
+        Copies the searched fields of the rows of a model into its
+        FTS5 table.
+        """
+        columns = self.get_columns(model)
+        cursor.execute(
+            'INSERT INTO {} ({}) SELECT {}, {} FROM {} {}'.format(
+                self.get_table(model),
+                ', '.join(columns),
+                model._meta.pk.column,
+                ', '.join(columns[1:]),
+                model._meta.db_table,
+                where),
+            params)
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            for model in SEARCH_FIELDS:
+                cursor.execute(
+                    'DROP TABLE IF EXISTS {}'.format(self.get_table(model)))
+                self.create(cursor, model)
+
+    def rebuild(self):
+        # In one transaction, so searches never come up empty
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                for model in SEARCH_FIELDS:
+                    cursor.execute(
+                        'DROP TABLE IF EXISTS {}'.format(
+                            self.get_table(model)))
+                    self.create(cursor, model)
+                    self.fill(cursor, model)
+                    # Merges the index into one b-tree, which makes
+                    # queries faster
+                    cursor.execute(
+                        "INSERT INTO {0} ({0}) VALUES ('optimize')".format(
+                            self.get_table(model)))
+
+    def update(self, filing_ids):
+        filing_ids = sorted(filing_ids)
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                for model in (Contribution, Expenditure):
+                    self.create(cursor, model)
+                    for i in range(0, len(filing_ids), SEARCH_BATCH_SIZE):
+                        chunk = filing_ids[i:i + SEARCH_BATCH_SIZE]
+                        # filing_id is indexed, so the rows of a filing
+                        # are found by matching it
+                        cursor.execute(
+                            'DELETE FROM {0} WHERE rowid IN ('
+                            'SELECT rowid FROM {0} WHERE {0} MATCH %s)'.format(
+                                self.get_table(model)),
+                            ['filing_id : ({})'.format(' OR '.join(
+                                '"{}"'.format(f) for f in chunk))])
+                        self.fill(
+                            cursor,
+                            model,
+                            'WHERE filing_id IN ({})'.format(
+                                ', '.join(['%s'] * len(chunk))),
+                            chunk)
+                # Committees are few, and their names change with
+                # their filings
+                cursor.execute(
+                    'DROP TABLE IF EXISTS {}'.format(
+                        self.get_table(Committee)))
+                self.create(cursor, Committee)
+                self.fill(cursor, Committee)
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            for model in SEARCH_FIELDS:
+                cursor.execute(
+                    'DROP TABLE IF EXISTS {}'.format(self.get_table(model)))
+
+    def swap(self, editor):
+        for model in SEARCH_FIELDS:
+            editor.execute('DROP TABLE IF EXISTS {}'.format(
+                SEARCH_TABLES[model]))
+            editor.execute('ALTER TABLE {} RENAME TO {}'.format(
+                self.get_table(model), SEARCH_TABLES[model]))
+
+    def search(self, queryset, text):
+        words = get_words(text)
+        if not words:
+            return queryset
+        model = queryset.model
+        query = '{{{}}} : ({})'.format(
+            ' '.join(SEARCH_FIELDS[model]),
+            ' AND '.join('"{}"*'.format(w) for w in words))
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT key FROM {0} WHERE {0} MATCH %s'.format(
+                self.get_table(model)),
+            [query]))
+
+
+class PostgresSearchIndex(SearchIndex):
+    """
+    Keeps a GIN index on the tsvector of the searched fields of each
+    table. PostgreSQL keeps it up to date as rows change, so it only
+    has to be dropped for a full load and built again after.
+    """
+
+    def get_vector(self, model):
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector(*SEARCH_FIELDS[model], config=SEARCH_CONFIG)
+
+    def get_index(self, model):
+        from django.contrib.postgres.indexes import GinIndex
+        return GinIndex(self.get_vector(model), name=self.get_index_name(model))
+
+    def clear(self):
+        with self.connection.schema_editor() as editor:
+            for model in SEARCH_FIELDS:
+                editor.remove_index(model, self.get_index(model))
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            existing = set()
+            for model in SEARCH_FIELDS:
+                existing.update(self.connection.introspection.get_constraints(
+                    cursor, model._meta.db_table))
+        with self.connection.schema_editor() as editor:
+            for model in SEARCH_FIELDS:
+                if self.get_index_name(model) not in existing:
+                    editor.add_index(model, self.get_index(model))
+
+    def swap(self, editor):
+        # The old indexes were dropped along with the old tables
+        live = PostgresSearchIndex(self.connection)
+        for model in SEARCH_FIELDS:
+            editor.rename_index(
+                model, self.get_index(model), live.get_index(model))
+
+    def search(self, queryset, text):
+        from django.contrib.postgres.search import SearchQuery
+        words = get_words(text)
+        if not words:
+            return queryset
+        # The same expression as the index, so that it's used
+        query = SearchQuery(
+            ' & '.join('{}:*'.format(w) for w in words),
+            config=SEARCH_CONFIG,
+            search_type='raw')
+        return queryset.alias(
+            search_vector=self.get_vector(queryset.model)).filter(
+            search_vector=query)
+
+
+def get_search_index(connection=None, suffix=''):
+    """
+    Returns the kind of search index used by the given database,
+    or the default one. With a `suffix`, the index is kept apart from
+    the live one, for staging tables.
+    """
+    connection = connection or default_connection
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchIndex(connection, suffix)
+    if connection.vendor == 'postgresql':
+        return PostgresSearchIndex(connection, suffix)
+    return SearchIndex(connection, suffix)
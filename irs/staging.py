@@ -0,0 +1,152 @@
+import uuid
+import logging
+from contextlib import contextmanager
+from django.db import connection
+from irs.models import (
+    F8872, Contribution, Expenditure, Committee, CommitteeTotal, PlaceTotal,
+    TopContributor)
+from irs.search import get_search_index
+
+logger = logging.getLogger(__name__)
+
+# The irs models, in an order where each only refers to those before it
+MODELS = (Committee, F8872, Contribution, Expenditure)
+
+# The summaries of the irs tables, which are rebuilt in staging tables
+# of their own, so they're swapped in along with the rows they add up
+SUMMARY_MODELS = (CommitteeTotal, PlaceTotal, TopContributor)
+STAGED_MODELS = MODELS + SUMMARY_MODELS
+
+
+class StagingTables:
+    """
+    Shadow copies of the irs tables that a load can be written to while
+    the live tables keep serving readers, and then swapped in at once.
+    """
+
+    def __init__(self):
+        # A suffix unique to this load, so the names of the tables and of
+        # the indexes and constraints generated from them never clash
+        # with those left behind by a previous load
+        token = uuid.uuid4().hex[0:8]
+        self.live_tables = dict(
+            (m, m._meta.db_table) for m in STAGED_MODELS)
+        self.staging_tables = dict(
+            (m, '{}_new_{}'.format(t, token))
+            for m, t in self.live_tables.items())
+        self.old_tables = dict(
+            (m, '{}_old_{}'.format(t, token))
+            for m, t in self.live_tables.items())
+        # Index names have to be unique across the whole database on
+        # some backends, so the staging tables get their own
+        self.indexes = [
+            (m, i) for m in STAGED_MODELS for i in m._meta.indexes]
+        self.live_indexes = [i.name for m, i in self.indexes]
+        self.staging_indexes = [
+            '{}_{}'.format(n, token) for n in self.live_indexes]
+        # The search index is built from the staging tables too
+        self.search_index = get_search_index(suffix='_new_' + token)
+
+    def set_tables(self, tables, index_names):
+        for (model, index), name in zip(self.indexes, index_names):
+            index.name = name
+        for model in STAGED_MODELS:
+            model._meta.db_table = tables[model]
+            # Columns cache the name of their table
+            for field in model._meta.concrete_fields:
+                field.__dict__.pop('cached_col', None)
+
+    @contextmanager
+    def use(self):
+        """
+        Points the irs models at the staging tables, so that everything
+        the loader does inside this block happens there.
+        """
+        self.set_tables(self.staging_tables, self.staging_indexes)
+        try:
+            yield
+        finally:
+            self.set_tables(self.live_tables, self.live_indexes)
+
+    def create(self):
+        """
+        Creates empty staging tables with the same columns, indexes and
+        constraints as the live ones.
+        """
+        logger.info('Creating staging tables')
+        with self.use(), connection.schema_editor() as editor:
+            for model in STAGED_MODELS:
+                editor.create_model(model)
+
+    def drop(self):
+        logger.info('Dropping staging tables')
+        with self.use(), connection.schema_editor() as editor:
+            for model in reversed(STAGED_MODELS):
+                editor.delete_model(model)
+        self.search_index.drop()
+
+    def count(self):
+        """
+        Returns the number of rows in each staging table.
+        """
+        with self.use():
+            return dict((m, m.objects.count()) for m in MODELS)
+
+    def swap(self):
+        """
+        Replaces the live tables and search index with the staging
+        ones in a single transaction, then drops the old tables.
+        """
+        logger.info('Swapping in staging tables')
+        quote_name = connection.ops.quote_name
+        if connection.vendor == 'mysql':
+            # DDL isn't transactional on MySQL, but a single RENAME
+            # TABLE statement is atomic
+            renames = [
+                (self.live_tables[m], self.old_tables[m])
+                for m in STAGED_MODELS
+            ] + [
+                (self.staging_tables[m], self.live_tables[m])
+                for m in STAGED_MODELS
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute('RENAME TABLE {}'.format(', '.join(
+                    '{} TO {}'.format(quote_name(a), quote_name(b))
+                    for a, b in renames)))
+            with connection.schema_editor() as editor:
+                for model in reversed(STAGED_MODELS):
+                    editor.execute(editor.sql_delete_table % {
+                        'table': quote_name(self.old_tables[model])})
+                self.search_index.swap(editor)
+            self.rename_indexes()
+            return
+
+        with connection.schema_editor(atomic=True) as editor:
+            for model in STAGED_MODELS:
+                editor.alter_db_table(
+                    model,
+                    self.live_tables[model],
+                    self.old_tables[model])
+            for model in STAGED_MODELS:
+                editor.alter_db_table(
+                    model,
+                    self.staging_tables[model],
+                    self.live_tables[model])
+            for model in reversed(STAGED_MODELS):
+                editor.execute(editor.sql_delete_table % {
+                    'table': quote_name(self.old_tables[model])})
+            self.search_index.swap(editor)
+            self.rename_indexes(editor)
+
+    def rename_indexes(self, editor=None):
+        """
+        Gives the indexes of the swapped in tables their usual names,
+        which are free again now that the old tables are gone.
+        """
+        if editor is None:
+            with connection.schema_editor() as editor:
+                return self.rename_indexes(editor)
+        for (model, index), name in zip(self.indexes, self.staging_indexes):
+            staging_index = index.clone()
+            staging_index.name = name
+            editor.rename_index(model, staging_index, index)
@@ -0,0 +1,159 @@
+import logging
+import collections
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractYear, Substr
+from irs.models import (
+    F8872, Contribution, Expenditure, CommitteeTotal, PlaceTotal,
+    TopContributor)
+
+logger = logging.getLogger(__name__)
+
+# Number of contributors kept for each committee
+TOP_CONTRIBUTORS = 25
+
+# Number of committees or years whose summaries are rebuilt per query
+SUMMARY_BATCH_SIZE = 500
+
+
+def chunks(values):
+    values = sorted(values)
+    for i in range(0, len(values), SUMMARY_BATCH_SIZE):
+        yield values[i:i + SUMMARY_BATCH_SIZE]
+
+
+def build_committee_totals(committees=None):
+    """
+    Returns CommitteeTotal objects for the given committees,
+    or for all of them.
+    """
+    filings = F8872.objects.filter(is_amended=False)
+    contributions = Contribution.current.all()
+    expenditures = Expenditure.current.all()
+    if committees is not None:
+        filings = filings.filter(committee_id__in=committees)
+        contributions = contributions.filter(committee_id__in=committees)
+        expenditures = expenditures.filter(committee_id__in=committees)
+
+    totals = collections.defaultdict(dict)
+    for committee_id, year, count in filings.values_list(
+            'committee_id', ExtractYear('end_date')).annotate(
+            count=Count('form_id_number')).order_by():
+        totals[(committee_id, year)]['filing_count'] = count
+    for prefix, queryset, amount in (
+            ('contribution', contributions, 'contribution_amount'),
+            ('expenditure', expenditures, 'expenditure_amount')):
+        rows = queryset.values(
+            'committee_id', year=ExtractYear('filing__end_date')).annotate(
+            total=Sum(amount), count=Count('id')).order_by()
+        for row in rows:
+            key = (row['committee_id'], row['year'])
+            totals[key][prefix + '_total'] = row['total'] or 0
+            totals[key][prefix + '_count'] = row['count']
+
+    return [
+        CommitteeTotal(committee_id=committee_id, year=year, **values)
+        for (committee_id, year), values in totals.items()
+        if committee_id is not None]
+
+
+def build_place_totals(years=None):
+    """
+    Returns PlaceTotal objects for the given years, or for all of them.
+    """
+    totals = collections.defaultdict(dict)
+    for prefix, queryset, person, amount in (
+            ('contribution', Contribution.current, 'contributor',
+             'contribution_amount'),
+            ('expenditure', Expenditure.current, 'recipient',
+             'expenditure_amount')):
+        queryset = queryset.all()
+        if years is not None:
+            queryset = queryset.filter(filing__end_date__year__in=years)
+        rows = queryset.values(
+            year=ExtractYear('filing__end_date'),
+            state=F(person + '_address_state'),
+            zip3=Substr(person + '_address_zip_code', 1, 3)).annotate(
+            total=Sum(amount), count=Count('id')).order_by()
+        for row in rows:
+            key = (row['year'], row['state'], row['zip3'] or None)
+            totals[key][prefix + '_total'] = row['total'] or 0
+            totals[key][prefix + '_count'] = row['count']
+
+    return [
+        PlaceTotal(year=year, state=state, zip3=zip3, **values)
+        for (year, state, zip3), values in totals.items()]
+
+
+def build_top_contributors(committees=None):
+    """
+    Returns TopContributor objects for the given committees,
+    or for all of them.
+    """
+    contributions = Contribution.current.exclude(
+        contributor_name=None).exclude(committee=None)
+    if committees is not None:
+        contributions = contributions.filter(committee_id__in=committees)
+    # Grouped rows come back ordered by committee and total, so the
+    # first few of each committee are its top contributors
+    rows = contributions.values('committee_id', 'contributor_name').annotate(
+        total=Sum('contribution_amount'),
+        count=Count('id')).order_by(
+        'committee_id',
+        F('total').desc(nulls_last=True),
+        'contributor_name')
+
+    top = []
+    committee_id = None
+    for row in rows.iterator():
+        if row['committee_id'] != committee_id:
+            committee_id = row['committee_id']
+            rank = 0
+        rank += 1
+        if rank <= TOP_CONTRIBUTORS:
+            top.append(TopContributor(
+                committee_id=committee_id,
+                rank=rank,
+                contributor_name=row['contributor_name'],
+                contribution_total=row['total'] or 0,
+                contribution_count=row['count']))
+    return top
+
+
+def refresh_summaries(committees=None, years=None):
+    """
+    Rebuilds the summaries of the given committees and years from the
+    contributions and expenditures, in one transaction, so readers
+    never see them half done. With no committees or years, every
+    summary is rebuilt.
+    """
+    with transaction.atomic():
+        if committees is None:
+            CommitteeTotal.objects.all().delete()
+            TopContributor.objects.all().delete()
+            CommitteeTotal.objects.bulk_create(
+                build_committee_totals(), batch_size=1000)
+            TopContributor.objects.bulk_create(
+                build_top_contributors(), batch_size=1000)
+        else:
+            for chunk in chunks(committees):
+                CommitteeTotal.objects.filter(committee_id__in=chunk).delete()
+                TopContributor.objects.filter(committee_id__in=chunk).delete()
+                CommitteeTotal.objects.bulk_create(
+                    build_committee_totals(chunk), batch_size=1000)
+                TopContributor.objects.bulk_create(
+                    build_top_contributors(chunk), batch_size=1000)
+
+        if years is None:
+            PlaceTotal.objects.all().delete()
+            PlaceTotal.objects.bulk_create(
+                build_place_totals(), batch_size=1000)
+        else:
+            for chunk in chunks(years):
+                PlaceTotal.objects.filter(year__in=chunk).delete()
+                PlaceTotal.objects.bulk_create(
+                    build_place_totals(chunk), batch_size=1000)
+
+    logger.debug('Rebuilt summaries of {} committees and {} years'.format(
+        'all' if committees is None else len(committees),
+        'all' if years is None else len(years)))
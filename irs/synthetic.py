@@ -0,0 +1,203 @@
+import random
+import collections
+from datetime import date, datetime, timedelta
+from irs.archive import ENCODING
+
+# Words that names, addresses and purposes are made of. Some of them
+# can't be encoded as ASCII, like names in the real archive.
+WORDS = [
+    'AMERICAN', 'ASSOCIATION', 'CITIZENS', 'COMMITTEE', 'FUND', 'PAC',
+    'PEOPLE', 'FUTURE', 'ACTION', 'COUNCIL', 'LOCAL', 'UNION', 'VOTERS',
+    'JOHN', 'MARY', 'SMITH', 'JOHNSON', 'GARCÍA', 'MUÑOZ', 'FRANÇOIS',
+    'JOSÉ', 'ZOË', 'MÜLLER', 'CONSULTING', 'PRINTING', 'MEDIA', 'GROUP',
+]
+
+STREETS = ['MAIN ST', 'OAK AVE', 'PENNSYLVANIA AVE NW', 'K ST NW', 'ELM ST']
+
+STATES = [
+    'AL', 'AK', 'AZ', 'CA', 'CO', 'CT', 'DC', 'FL', 'GA', 'IL', 'IN',
+    'IA', 'MD', 'MA', 'MI', 'MN', 'MO', 'NJ', 'NY', 'NC', 'OH', 'OK',
+    'PA', 'TX', 'VA', 'WA', 'WI',
+]
+
+PURPOSES = ['OCCUPANCY', 'CONSULTING', 'PRINTING', 'SALARY', 'TRAVEL']
+
+
+class SyntheticArchive:
+    """
+    Writes a made up archive in the format of the IRS's FullDataFile,
+    with the columns laid out by the mappings loadIRS reads. Filings
+    have schedule A and B rows, some are amended later in the file,
+    and cells hold N/A markers and non-ASCII characters like the real
+    archive does. The same seed always gives the same archive.
+    """
+
+    def __init__(self, mappings, seed=0, amendment_rate=0.05,
+                 rows_per_filing=100):
+        self.mappings = mappings
+        self.random = random.Random(seed)
+        self.amendment_rate = amendment_rate
+        self.rows_per_filing = rows_per_filing
+        self.next_id = 1000000
+        self.periods = []
+
+    def word(self):
+        return self.random.choice(WORDS)
+
+    def name(self, words=3):
+        return ' '.join(self.word() for i in range(words))
+
+    def date_between(self, begin, end):
+        days = (end - begin).days
+        return begin + timedelta(days=self.random.randint(0, days))
+
+    def new_id(self):
+        self.next_id += 1
+        return str(self.next_id)
+
+    def cell(self, field_name, field_type, values):
+        """
+        Returns the raw text of a cell, from `values` if it's there and
+        made up from its name and type otherwise.
+        """
+        if field_name in values:
+            return values[field_name]
+        if field_name.endswith('_state'):
+            return self.random.choice(STATES)
+        if field_name.endswith('_zip_code'):
+            return '{:05d}'.format(self.random.randint(1000, 99999))
+        if field_name.endswith('_zip_ext'):
+            if self.random.random() < 0.5:
+                return ''
+            return '{:04d}'.format(self.random.randint(1, 9999))
+        if field_name.endswith('_line_1'):
+            return '{} {}'.format(
+                self.random.randint(1, 9999), self.random.choice(STREETS))
+        if field_name.endswith('_line_2'):
+            if self.random.random() < 0.7:
+                return ''
+            return 'SUITE {}'.format(self.random.randint(1, 999))
+        if field_name.endswith(('_employer', '_occupation')):
+            if self.random.random() < 0.6:
+                return self.random.choice(['N/A', 'NOT APPLICABLE', ''])
+            return self.word()
+        if field_type == 'D':
+            return self.date_between(
+                date(2000, 1, 1), date(2024, 12, 31)).strftime('%Y%m%d')
+        if field_type in ('I', 'N'):
+            return '0'
+        if self.random.random() < 0.2:
+            return ''
+        return self.name(self.random.randint(1, 3))
+
+    def row(self, mapping, values):
+        """
+        Lays out the cells of a row in the positions of a mapping.
+        """
+        cells = []
+        for i in range(len(mapping)):
+            field_name, field_type = mapping[str(i)]
+            cells.append(self.cell(field_name, field_type, values))
+        # Rows in the archive end with a delimiter
+        return '|'.join(cells) + '|'
+
+    def committee(self):
+        """
+        Returns an EIN, a name and a reporting period for a filing,
+        which repeat those of an earlier filing if it is an amendment.
+        """
+        if self.periods and self.random.random() < self.amendment_rate:
+            return self.random.choice(self.periods), True
+        year = self.random.randint(2000, 2024)
+        quarter = self.random.randint(0, 3)
+        begin = date(year, quarter * 3 + 1, 1)
+        end = date(year + (quarter == 3), (quarter * 3 + 3) % 12 + 1, 1)
+        end -= timedelta(days=1)
+        period = (
+            '{:09d}'.format(self.random.randint(10000000, 999999999)),
+            self.name(),
+            begin,
+            end)
+        self.periods.append(period)
+        return period, False
+
+    def filing(self):
+        """
+        Returns the rows of a filing: its form 8872 row followed by
+        its schedule A and B rows.
+        """
+        (ein, organization_name, begin, end), amended = self.committee()
+        form_id = self.new_id()
+        common = {
+            'form_id_number': form_id,
+            'organization_name': organization_name,
+            'EIN': ein,
+        }
+
+        schedules = []
+        totals = {'A': 0, 'B': 0}
+        count = self.random.randint(0, self.rows_per_filing * 2)
+        for i in range(count):
+            form_type = self.random.choice('AB')
+            amount = self.random.randint(1, 100000)
+            totals[form_type] += amount
+            values = dict(common, record_type=form_type)
+            day = self.date_between(begin, end).strftime('%Y%m%d')
+            if form_type == 'A':
+                values.update(
+                    schedule_a_id=self.new_id(),
+                    contributor_name=self.name(),
+                    contribution_amount=str(amount),
+                    agg_contribution_ytd=str(amount),
+                    contribution_date=day)
+                mapping = self.mappings['sa']
+            else:
+                values.update(
+                    schedule_b_id=self.new_id(),
+                    recipient_name=self.name(),
+                    expenditure_amount=str(amount),
+                    expenditure_date=day,
+                    expenditure_purpose=self.random.choice(PURPOSES))
+                mapping = self.mappings['sb']
+            schedules.append((form_type, self.row(mapping, values)))
+
+        inserted = datetime.combine(end, datetime.min.time()) + timedelta(
+            days=self.random.randint(1, 60),
+            seconds=self.random.randint(0, 86399))
+        values = dict(
+            common,
+            record_type='2',
+            form_type='8872',
+            begin_date=begin.strftime('%Y%m%d'),
+            end_date=end.strftime('%Y%m%d'),
+            initial_report_indicator='0' if amended else '1',
+            amended_report_indicator='1' if amended else '0',
+            final_report_indicator='0',
+            change_of_address_indicator='0',
+            email='info@example.org',
+            quarter_indicator=str(end.month // 3),
+            monthly_report_month='',
+            pre_election_type='',
+            election_date='',
+            schedule_a_indicator='0',
+            schedule_a_total=str(totals['A']),
+            schedule_b_indicator='0',
+            schedule_b_total=str(totals['B']),
+            insert_datetime=inserted.strftime('%Y-%m-%d %H:%M:%S'))
+        return [('2', self.row(self.mappings['F8872'], values))] + schedules
+
+    def write(self, f, rows):
+        """
+        Writes an archive of about `rows` rows to a binary file, and
+        returns the number of rows of each form type in it.
+        """
+        counts = collections.Counter()
+        f.write(b'H|20150830|0027|F|\n')
+        while sum(counts.values()) < rows:
+            for form_type, line in self.filing():
+                f.write(line.encode(ENCODING))
+                f.write(b'\n')
+                counts[form_type] += 1
+        f.write('F|20150830|0053|{}|\n'.format(
+            sum(counts.values())).encode(ENCODING))
+        return counts
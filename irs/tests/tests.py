@@ -1,10 +1,69 @@
+import gc
+import io
+import os
+import csv
+import gzip
+import json
+import shutil
+import pstats
+import zipfile
+import tempfile
+import threading
+import time
+import functools
+from http.server import (
+    ThreadingHTTPServer, SimpleHTTPRequestHandler, BaseHTTPRequestHandler)
 from decimal import Decimal
 from datetime import date
-from django.test import TestCase
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.db.migrations.loader import MigrationLoader
 from django.core.management import call_command
-from django.db.models import Sum, Count, Q
+from django.db.models import F, Max, Sum, Count, Q
 from django.utils import timezone
-from irs.models import F8872, Contribution, Expenditure, Committee
+from irs.archive import (
+    split_archive, unzip_stream, iter_stream_lines, open_archive,
+    read_archive, read_archive_mmap, zstd)
+from irs.models import (
+    F8872, Contribution, Expenditure, Committee, CommitteeTotal, PlaceTotal,
+    TopContributor)
+from irs.pagination import EstimatedCountPaginator, estimate_count
+from irs.search import (
+    SEARCH_FIELDS, SearchIndex, get_search_index, get_words)
+from irs.staging import StagingTables
+from irs.summaries import refresh_summaries
+from irs.deferred import DeferredRows
+from irs.indexes import deferred_indexes, build_indexes
+from irs.keys import KeyMap
+from irs.synthetic import SyntheticArchive
+from irs.tuning import tune_connection
+from irs.management.commands.loadIRS import (
+    Command as LoadCommand, CONVERSION_ERRORS, DEFERRED_ROWS, ORPHANS,
+    cache_stats, clear_caches, clean_integer)
+from irs.writers import (
+    ORMWriter, CopyWriter, ParsedRow, WriterThreads, copy_value, get_writer)
+
+# The commands write their reports and state under BASE_DIR/data, so
+# the tests point it at a temporary directory
+DATA_OVERRIDE = None
+
+
+def setUpModule():
+    global DATA_OVERRIDE
+    DATA_OVERRIDE = override_settings(BASE_DIR=tempfile.mkdtemp())
+    DATA_OVERRIDE.enable()
+
+
+def tearDownModule():
+    from django.conf import settings
+    base_dir = settings.BASE_DIR
+    DATA_OVERRIDE.disable()
+    shutil.rmtree(base_dir)
 
 
 class IRSFilingsTest(TestCase):
@@ -23,6 +82,15 @@ class IRSFilingsTest(TestCase):
         self.assertEqual(Expenditure.objects.count(), 5068)
         self.assertEqual(Committee.objects.count(), 49)
 
+    def test_flush(self):
+        """Check that the flush empties every table without selecting rows."""
+        with CaptureQueriesContext(connection) as queries:
+            LoadCommand().flush()
+        self.assertFalse([
+            q for q in queries if q['sql'].upper().startswith('SELECT')])
+        for model in (F8872, Contribution, Expenditure, Committee):
+            self.assertFalse(model.objects.exists())
+
     def test_committee(self):
         """Check if committees are associated with their filings correctly."""
         committee = Committee.objects.get(EIN='751954937')
@@ -53,6 +121,1864 @@ class IRSFilingsTest(TestCase):
             '9637689')
 
 
+class IncrementalLoadTest(TestCase):
+    """Test incremental loading of IRS filings data."""
+
+    def setUp(self):
+        """Load the test data file incrementally into an empty database."""
+        call_command('loadIRS', test=True, incremental=True)
+
+    def test_initial_load(self):
+        """Check that an incremental load into an empty database loads everything."""
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        self.assertEqual(Committee.objects.count(), 49)
+        self.assertFalse(F8872.objects.filter(fingerprint=None).exists())
+        self.assertTrue(
+            F8872.objects.get(form_id_number='9637644').is_amended)
+        self.assertEqual(
+            Contribution.current.count(),
+            Contribution.objects.filter(filing__is_amended=False).count())
+        self.assertFalse(Contribution.current.filter(
+            form_id_number='9637644').exists())
+
+    def test_unchanged_filings_are_kept(self):
+        """Check that a second load leaves unchanged filings alone."""
+        ids = set(Contribution.objects.values_list('id', flat=True))
+        call_command('loadIRS', test=True, incremental=True)
+        self.assertEqual(
+            set(Contribution.objects.values_list('id', flat=True)),
+            ids)
+
+    def test_changed_filings_are_replaced(self):
+        """Check that filings whose fingerprint changed are reloaded."""
+        F8872.objects.filter(form_id_number='9637673').update(
+            fingerprint='stale')
+        Contribution.objects.filter(form_id_number='9637673').update(
+            contribution_amount=0)
+        other_ids = set(Contribution.objects.exclude(
+            form_id_number='9637673').values_list('id', flat=True))
+
+        call_command('loadIRS', test=True, incremental=True)
+
+        filing = F8872.objects.get(form_id_number='9637673')
+        total = filing.contributions.aggregate(
+            total=Sum('contribution_amount'))['total']
+        self.assertEqual(total, filing.schedule_a_total)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(set(Contribution.objects.exclude(
+            form_id_number='9637673').values_list('id', flat=True)), other_ids)
+
+    def test_removed_filings_are_deleted(self):
+        """Check that filings missing from the archive are deleted."""
+        committee = Committee.objects.create(EIN='000000001', name='Gone')
+        F8872.objects.create(
+            committee=committee,
+            record_type='2',
+            form_type=8872,
+            form_id_number='GONE001',
+            begin_date=date(2015, 1, 1),
+            end_date=date(2015, 6, 30),
+            organization_name='Gone',
+            EIN='000000001',
+            schedule_a_total=Decimal('0.00'),
+            schedule_b_total=Decimal('0.00'),
+            insert_datetime=timezone.now())
+
+        call_command('loadIRS', test=True, incremental=True)
+
+        self.assertFalse(F8872.objects.filter(form_id_number='GONE001').exists())
+        self.assertFalse(Committee.objects.filter(EIN='000000001').exists())
+
+
+class AmendmentTests(TestCase):
+    """Test resolving amended filings."""
+
+    def setUp(self):
+        self.committee = Committee.objects.create(
+            EIN='123456789',
+            name='Test Committee')
+        for form_id_number, amended in (('100', 0), ('101', 1), ('102', 1)):
+            self.create_filing(form_id_number, amended)
+        # A filing for a different period isn't affected
+        self.create_filing('099', 0, end_date=date(2024, 6, 30))
+
+    def create_filing(self, form_id_number, amended, end_date=date(2024, 3, 31)):
+        return F8872.objects.create(
+            committee=self.committee,
+            record_type='2',
+            form_type=8872,
+            form_id_number=form_id_number,
+            begin_date=date(2024, 1, 1),
+            end_date=end_date,
+            amended_report_indicator=amended,
+            organization_name='Test Committee',
+            EIN='123456789',
+            schedule_a_total=Decimal('0.00'),
+            schedule_b_total=Decimal('0.00'),
+            insert_datetime=timezone.now())
+
+    def amended_by(self):
+        return dict(F8872.objects.values_list(
+            'form_id_number', 'amended_by__form_id_number'))
+
+    def test_chain_of_amendments(self):
+        """Check that each filing is amended by the next amendment."""
+        with self.assertNumQueries(6):
+            LoadCommand().resolve_amendments()
+        self.assertEqual(self.amended_by(), {
+            '099': None, '100': '101', '101': '102', '102': None})
+        self.assertEqual(
+            set(F8872.objects.filter(is_amended=True).values_list(
+                'form_id_number', flat=True)),
+            set(['100', '101']))
+
+    def test_stale_amendments_are_reset(self):
+        """Check that flags left by a removed amendment are cleared."""
+        LoadCommand().resolve_amendments()
+        F8872.objects.filter(form_id_number='102').delete()
+        LoadCommand().resolve_amendments()
+        self.assertEqual(self.amended_by(), {
+            '099': None, '100': '101', '101': None})
+        self.assertFalse(
+            F8872.objects.get(form_id_number='101').is_amended)
+
+    def test_unchanged_filings_are_not_updated(self):
+        """Check that a second pass doesn't write anything."""
+        LoadCommand().resolve_amendments()
+        with self.assertNumQueries(3):
+            LoadCommand().resolve_amendments()
+
+    def test_current_rows(self):
+        """Check that rows of amended filings are flagged as not current."""
+        for form_id_number in ('100', '101', '102'):
+            Contribution.objects.create(
+                record_type='A',
+                form_id_number=form_id_number,
+                schedule_a_id='A' + form_id_number,
+                organization_name='Test Committee',
+                EIN='123456789',
+                filing=F8872.objects.get(form_id_number=form_id_number),
+                committee=self.committee)
+            Expenditure.objects.create(
+                record_type='B',
+                form_id_number=form_id_number,
+                schedule_b_id='B' + form_id_number,
+                organization_name='Test Committee',
+                EIN='123456789',
+                filing=F8872.objects.get(form_id_number=form_id_number),
+                committee=self.committee)
+        LoadCommand().resolve_amendments()
+        self.assertEqual(
+            set(Contribution.current.values_list('form_id_number', flat=True)),
+            set(['102']))
+        self.assertEqual(
+            set(Expenditure.current.values_list('form_id_number', flat=True)),
+            set(['102']))
+        self.assertEqual(Contribution.objects.count(), 3)
+
+        # Without its amendment, a filing's rows are current again
+        F8872.objects.filter(form_id_number='102').delete()
+        LoadCommand().resolve_amendments()
+        self.assertEqual(
+            set(Contribution.current.values_list('form_id_number', flat=True)),
+            set(['101']))
+
+
+class StagingLoadTest(TransactionTestCase):
+    """Test loading into staging tables that are swapped in at the end."""
+
+    def setUp(self):
+        """Put a filing in the live tables that isn't in the archive."""
+        committee = Committee.objects.create(EIN='000000001', name='Live')
+        F8872.objects.create(
+            committee=committee,
+            record_type='2',
+            form_type=8872,
+            form_id_number='LIVE001',
+            begin_date=date(2015, 1, 1),
+            end_date=date(2015, 6, 30),
+            organization_name='Live',
+            EIN='000000001',
+            schedule_a_total=Decimal('0.00'),
+            schedule_b_total=Decimal('0.00'),
+            insert_datetime=timezone.now())
+
+    def assertNoStagingTables(self):
+        self.assertEqual(F8872._meta.db_table, 'irs_f8872')
+        self.assertEqual(
+            [i.name for i in F8872._meta.indexes],
+            ['irs_f8872_ordering_idx', 'irs_f8872_period_idx'])
+        tables = connection.introspection.table_names()
+        self.assertFalse([t for t in tables if '_new_' in t or '_old_' in t])
+        # The swapped in tables have the usual index names
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, 'irs_contribution')
+        for index in Contribution._meta.indexes:
+            self.assertIn(index.name, constraints)
+
+    def test_swap(self):
+        """Check that the live tables are replaced by the loaded ones."""
+        call_command('loadIRS', test=True, swap=True)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        self.assertEqual(Committee.objects.count(), 49)
+        self.assertFalse(F8872.objects.filter(form_id_number='LIVE001').exists())
+        self.assertEqual(
+            F8872.objects.get(form_id_number='9637644').amended_by,
+            F8872.objects.get(form_id_number='9637689'))
+        self.assertEqual(
+            Contribution.objects.filter(form_id_number='9637673').count(),
+            F8872.objects.get(form_id_number='9637673').contributions.count())
+        self.assertNoStagingTables()
+
+        # The swapped in tables can be swapped out again
+        call_command('loadIRS', test=True, swap=True)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertNoStagingTables()
+
+    def after_swap(self, check):
+        """
+        Runs `check` as soon as the staging tables have been swapped in,
+        which is what readers see next.
+        """
+        swap = StagingTables.swap
+
+        def swap_and_check(staging):
+            swap(staging)
+            check()
+        return mock.patch.object(StagingTables, 'swap', swap_and_check)
+
+    def test_search_swapped_in(self):
+        """Check that the search index matches the rows it's swapped in with."""
+        call_command('loadIRS', test=True)
+        # The live index no longer has these contributions
+        Contribution.objects.filter(
+            contributor_name__icontains='buena vista').delete()
+        get_search_index().rebuild()
+
+        def check():
+            for text in ('buena vista', 'local 803'):
+                self.assertEqual(
+                    set(Contribution.objects.search(text).values_list(
+                        'pk', flat=True)),
+                    set(SearchIndex().search(
+                        Contribution.objects.all(), text).values_list(
+                        'pk', flat=True)))
+            self.assertTrue(Contribution.objects.search('buena vista'))
+        with self.after_swap(check):
+            call_command('loadIRS', test=True, swap=True)
+        self.assertNoStagingTables()
+
+    def test_summaries_swapped_in(self):
+        """Check that the summaries match the rows they're swapped in with."""
+        call_command('loadIRS', test=True, swap=True)
+        F8872.objects.update(is_amended=True)
+        refresh_summaries()
+        self.assertFalse(CommitteeTotal.objects.exclude(filing_count=0))
+
+        def check():
+            self.assertEqual(
+                CommitteeTotal.objects.aggregate(n=Sum('filing_count'))['n'],
+                F8872.objects.filter(is_amended=False).count())
+            self.assertEqual(
+                PlaceTotal.objects.aggregate(
+                    n=Sum('contribution_count'))['n'],
+                Contribution.current.count())
+            self.assertTrue(TopContributor.objects.exists())
+        with self.after_swap(check):
+            call_command('loadIRS', test=True, swap=True)
+        self.assertNoStagingTables()
+
+    def test_failed_check_keeps_live_tables(self):
+        """Check that the live tables are untouched if the row counts are off."""
+        counts = {F8872: 0, Contribution: 0, Expenditure: 0, Committee: 0}
+        with mock.patch.object(StagingTables, 'count', return_value=counts):
+            with self.assertRaises(CommandError):
+                call_command('loadIRS', test=True, swap=True)
+        self.assertEqual(F8872.objects.count(), 1)
+        self.assertTrue(F8872.objects.filter(form_id_number='LIVE001').exists())
+        self.assertNoStagingTables()
+
+
+class IndexTests(TransactionTestCase):
+    """Test dropping indexes during a load and building them again."""
+
+    def get_index_names(self, model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        return set(n for n, c in constraints.items() if c['index'])
+
+    def test_deferred_indexes(self):
+        """Check that indexes are dropped inside the block and rebuilt after it."""
+        names = set(i.name for i in Contribution._meta.indexes)
+        self.assertLessEqual(names, self.get_index_names(Contribution))
+        with deferred_indexes():
+            self.assertFalse(names & self.get_index_names(Contribution))
+        self.assertLessEqual(names, self.get_index_names(Contribution))
+
+    def test_rebuilt_after_error(self):
+        """Check that indexes are rebuilt when the load fails."""
+        names = set(i.name for i in F8872._meta.indexes)
+        with self.assertRaises(ValueError):
+            with deferred_indexes():
+                raise ValueError
+        self.assertLessEqual(names, self.get_index_names(F8872))
+
+    def test_full_load(self):
+        """Check that a full load leaves every index in place."""
+        with mock.patch('irs.indexes.build_indexes',
+                        wraps=build_indexes) as build:
+            call_command('loadIRS', test=True)
+        self.assertEqual(len(build.call_args[0][0]), 14)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        for model in (F8872, Contribution, Expenditure):
+            self.assertLessEqual(
+                set(i.name for i in model._meta.indexes),
+                self.get_index_names(model))
+
+    def test_initial_migration(self):
+        """Check that the initial migration matches tables created before the app had migrations."""
+        loader = MigrationLoader(connection)
+        state = loader.project_state(('irs', '0001_initial'))
+        self.assertNotIn('fingerprint', state.models['irs', 'f8872'].fields)
+        state = loader.project_state(('irs', '0002_fingerprint'))
+        self.assertIn('fingerprint', state.models['irs', 'f8872'].fields)
+
+
+class SyntheticArchiveTests(TestCase):
+    """Test the synthetic archive used for benchmarks."""
+
+    def generate(self, rows, **kwargs):
+        command = LoadCommand()
+        command.build_mappings()
+        f = io.BytesIO()
+        counts = SyntheticArchive(command.mappings, **kwargs).write(f, rows)
+        return f.getvalue(), counts
+
+    def test_archive(self):
+        """Check that the archive has the layout and quirks of the real one."""
+        data, counts = self.generate(2000, amendment_rate=0.2)
+        lines = data.decode('ISO-8859-1').splitlines()
+        self.assertTrue(lines[0].startswith('H|'))
+        self.assertTrue(lines[-1].startswith('F|'))
+        self.assertGreaterEqual(sum(counts.values()), 2000)
+        self.assertEqual(len(lines), sum(counts.values()) + 2)
+        # Same number of cells as the test data file
+        filings = [l.split('|') for l in lines if l.startswith('2|')]
+        self.assertEqual(len(filings), counts['2'])
+        self.assertEqual(set(len(f) for f in filings), {50})
+        self.assertIn('1', [f[6] for f in filings])
+        self.assertIn('|N/A|', data.decode('ISO-8859-1'))
+        self.assertRegex(data, rb'[\x80-\xff]')
+
+    def test_seed(self):
+        """Check that the same seed always gives the same archive."""
+        self.assertEqual(self.generate(500)[0], self.generate(500)[0])
+        self.assertNotEqual(self.generate(500)[0], self.generate(500, seed=1)[0])
+
+
+class BenchmarkTests(TransactionTestCase):
+    """Test the benchmark command."""
+
+    def test_benchmark(self):
+        """Check that every stage is measured and the live tables are left alone."""
+        out = io.StringIO()
+        call_command('benchmarkIRS', rows=3000, stdout=out)
+        stages = [line.split()[0] for line in out.getvalue().splitlines()[2:]]
+        self.assertEqual(
+            stages, ['parse', 'fingerprint', 'load', 'insert', 'amendments'])
+        self.assertFalse(F8872.objects.exists())
+        self.assertEqual(F8872._meta.db_table, 'irs_f8872')
+
+
+class MmapReaderTests(TestCase):
+    """Test reading the archive from a memory map."""
+
+    def write(self, data):
+        f = tempfile.NamedTemporaryFile(delete=False)
+        f.write(data)
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_same_rows_as_csv(self):
+        """Check that quoting, embedded newlines and blank lines are read like csv does."""
+        path = self.write(
+            b'H|20150830|0027|F|\n'
+            b'2|8872|1|a|b|\n'
+            b'A|1|x|"quoted|pipe"|y|\n'
+            b'B|1|"multi\nline"|z|\r\n'
+            b'A|1|he said "hi"|q|\n'
+            b'\n'
+            b'A|1|"a""b"c|\n'
+            b'A|1|\xe9\xff|\r\n'
+            b'F|1|')
+        rows = list(read_archive(path))
+        self.assertEqual(rows[3], ['B', '1', 'multi\nline', 'z', ''])
+        # Blocks of one byte make every line a block of its own
+        for block_size in (1, 16, 1024):
+            self.assertEqual(
+                list(read_archive_mmap(path, block_size=block_size)), rows)
+
+    def test_stray_carriage_returns(self):
+        """Check that carriage returns outside quotes end rows, as in text mode."""
+        path = self.write(
+            b'H|20150830|0027|F|\n'
+            b'2|8872|1|a|b|\n'
+            b'A|1|x\ry|z|\n'
+            b'A|1|"x\ry"|z\r\r|\n'
+            b'B|1|"x|y"|z\rA|1|q|\r\n'
+            b'F|1|')
+        with open(path, encoding='ISO-8859-1', newline='') as text:
+            expected = list(csv.reader(text, delimiter='|'))
+        rows = list(read_archive(path))
+        self.assertEqual(rows, expected)
+        self.assertIn(['A', '1', 'x'], rows)
+        self.assertIn(['A', '1', 'x\ry', 'z'], rows)
+        for block_size in (1, 16, 1024):
+            self.assertEqual(
+                list(read_archive_mmap(path, block_size=block_size)), rows)
+
+    def test_byte_ranges(self):
+        """Check that byte ranges are read like csv does."""
+        path = os.path.join(os.path.dirname(__file__), 'TestDataFile.txt')
+        for start, end in split_archive(path, 5):
+            self.assertEqual(
+                list(read_archive_mmap(path, start, end, block_size=4096)),
+                list(read_archive(path, start, end)))
+
+    def test_widths_and_only(self):
+        """Check that unmapped rows, columns and filings are left out."""
+        path = self.write(
+            b'H|20150830|0027|F|\n'
+            b'2|8872|1|a|b|\n'
+            b'A|1|"x"|y|z|\n'
+            b'A|2|x|y|z|\n'
+            b'B|2|x|y|z|\n')
+        widths = {'2': 3, 'A': 3, 'B': 4}
+        self.assertEqual(list(read_archive_mmap(path, widths=widths)), [
+            ['2', '8872', '1'],
+            ['A', '1', 'x'],
+            ['A', '2', 'x'],
+            ['B', '2', 'x', 'y']])
+        self.assertEqual(
+            list(read_archive_mmap(path, widths=widths, only={'1'})),
+            [['2', '8872', '1'], ['A', '1', 'x']])
+
+    def test_load(self):
+        """Check that the mmap reader loads the same data, serially or in parallel."""
+        call_command('loadIRS', test=True)
+        fingerprints = dict(F8872.objects.values_list(
+            'form_id_number', 'fingerprint'))
+        for workers in (1, 2):
+            call_command('loadIRS', test=True, reader='mmap', workers=workers)
+            self.assertEqual(Contribution.objects.count(), 5911)
+            self.assertEqual(Expenditure.objects.count(), 5068)
+            self.assertEqual(dict(F8872.objects.values_list(
+                'form_id_number', 'fingerprint')), fingerprints)
+
+
+class DeferredRowsTests(TestCase):
+    """Test saving schedule rows that come before their filing."""
+
+    def load(self, rows):
+        command = LoadCommand()
+        command.build_mappings()
+        command.reset_state()
+        command.writer = get_writer()
+        command.fingerprints = {}
+        command.load_archive(rows=rows)
+        return command
+
+    def test_rows_before_filing(self):
+        """Check that rows are saved when their filing comes later in the archive."""
+        path = os.path.join(os.path.dirname(__file__), 'TestDataFile.txt')
+        rows = list(read_archive(path))
+        # Move every filing after all of the schedule rows
+        rows.sort(key=lambda row: row[0] == '2')
+        orphan = next(row for row in rows if row[0] == 'A')[:]
+        orphan[1] = 'MISSING'
+        rows.append(orphan)
+
+        with mock.patch.object(DEFERRED_ROWS, 'buffer_size', 1000):
+            command = self.load(rows)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        self.assertEqual(command.deferred_rows, 5911 + 5068 + 1)
+        self.assertEqual(ORPHANS, {'contributions': 1})
+        self.assertEqual(len(DEFERRED_ROWS), 0)
+
+    def test_spill(self):
+        """Check that rows past the buffer size are written to disk and read back in order."""
+        deferred = DeferredRows(buffer_size=3)
+        self.addCleanup(deferred.clear)
+        for i in range(10):
+            deferred.append(('A', {'form_id_number': str(i)}))
+        self.assertEqual(len(deferred.rows), 1)
+        self.assertEqual(len(deferred), 10)
+        self.assertEqual(
+            [row['form_id_number'] for form_type, row in deferred],
+            [str(i) for i in range(10)])
+
+
+class ParallelLoadTest(TestCase):
+    """Test parsing the archive in several processes."""
+
+    def test_split_archive(self):
+        """Check that the archive is split into byte ranges on line boundaries."""
+        path = os.path.join(os.path.dirname(__file__), 'TestDataFile.txt')
+        byte_ranges = split_archive(path, 8)
+        self.assertEqual(len(byte_ranges), 8)
+        self.assertEqual(byte_ranges[0][0], 0)
+        self.assertEqual(byte_ranges[-1][1], os.stat(path).st_size)
+        with open(path, 'rb') as raw_file:
+            for (start, end), (next_start, _) in zip(byte_ranges, byte_ranges[1:]):
+                self.assertEqual(end, next_start)
+                raw_file.seek(next_start - 1)
+                self.assertEqual(raw_file.read(1), b'\n')
+
+    def test_split_quoted_lines(self):
+        """Check that byte ranges never start inside a quoted field that spans lines."""
+        f = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+        self.addCleanup(os.remove, f.name)
+        with f:
+            for i in range(600):
+                if i % 3:
+                    f.write('A|{}|plain|{}|\n'.format(i, 'x' * (i % 7)).encode())
+                else:
+                    # Lines inside the quotes look like rows of their own
+                    f.write('B|{}|"first\nA|{}|inside\n"|end|\n'.format(
+                        i, i).encode())
+        rows = list(read_archive(f.name))
+        self.assertEqual(len(rows), 600)
+        for count in (50, 300):
+            byte_ranges = split_archive(f.name, count)
+            self.assertGreater(len(byte_ranges), count // 2)
+            self.assertEqual(
+                [row for start, end in byte_ranges
+                 for row in read_archive(f.name, start, end)],
+                rows)
+            self.assertEqual(
+                [row for start, end in byte_ranges
+                 for row in read_archive_mmap(
+                     f.name, start, end, block_size=64)],
+                rows)
+        # A range that ends inside a quoted field reads its row to the end
+        self.assertEqual(
+            list(read_archive(f.name, 0, 5)), rows[:1])
+        self.assertEqual(
+            list(read_archive_mmap(f.name, 0, 5)), rows[:1])
+
+    def test_stray_carriage_return(self):
+        """Check that a carriage return in an unquoted field ends the row, as in text mode."""
+        path = os.path.join(os.path.dirname(__file__), 'TestDataFile.txt')
+        with open(path, 'rb') as f:
+            data = f.read()
+        first = data.index(b'\nA|') + 1
+        newline = data.index(b'\n', first)
+        f = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+        self.addCleanup(os.remove, f.name)
+        with f:
+            f.write(data[:newline] + b'\rX' + data[newline:])
+
+        with open(f.name, encoding='ISO-8859-1', newline='') as text:
+            expected = list(csv.reader(text, delimiter='|'))
+        rows = list(read_archive(f.name))
+        self.assertEqual(rows, expected)
+        self.assertIn(['X'], rows)
+        self.assertEqual(
+            [row for start, end in split_archive(f.name, 8)
+             for row in read_archive(f.name, start, end)],
+            rows)
+
+        call_command('loadIRS', path=f.name)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+
+    def test_parallel_load(self):
+        """Check that a parallel load gives the same result as a serial one."""
+        call_command('loadIRS', test=True, workers=2)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        self.assertEqual(Committee.objects.count(), 49)
+        self.assertTrue(
+            F8872.objects.get(form_id_number='9637644').is_amended)
+
+        # Fingerprints don't depend on how the archive was split
+        fingerprints = dict(F8872.objects.values_list(
+            'form_id_number', 'fingerprint'))
+        call_command('loadIRS', test=True)
+        self.assertEqual(dict(F8872.objects.values_list(
+            'form_id_number', 'fingerprint')), fingerprints)
+
+
+class ReportTests(TestCase):
+    """Test the report written at the end of a load."""
+
+    def setUp(self):
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        self.path = os.path.join(report_dir, 'report.json')
+
+    def test_report(self):
+        """Check that the report has every stage and row count."""
+        call_command('loadIRS', test=True, report=self.path)
+        with open(self.path) as f:
+            report = json.load(f)
+        self.assertEqual(
+            [s['name'] for s in report['stages']],
+            ['flush', 'fingerprint', 'load', 'amendments', 'summaries',
+             'search'])
+        self.assertEqual(report['rows'], {
+            'filings': 65, 'contributions': 5911, 'expenditures': 5068})
+        self.assertEqual(
+            report['bytes_read'],
+            2 * os.stat(report['archive']).st_size)
+        self.assertGreater(report['queries'], 0)
+        self.assertGreater(report['stages'][2]['queries'], 0)
+        self.assertEqual(report['skipped_orphans'], {})
+        self.assertNotIn('error', report)
+
+    def test_profile(self):
+        """Check that --profile saves stats next to the report."""
+        call_command('loadIRS', test=True, report=self.path, profile=True)
+        stats = pstats.Stats(self.path.replace('.json', '.prof'))
+        self.assertTrue(stats.total_calls)
+
+    def test_failed_load(self):
+        """Check that a report is written when the load fails."""
+        with mock.patch.object(
+                LoadCommand, 'resolve_amendments', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                call_command('loadIRS', test=True, report=self.path)
+        with open(self.path) as f:
+            report = json.load(f)
+        self.assertEqual(report['error'], 'ValueError()')
+        self.assertEqual(report['stages'][-1]['name'], 'amendments')
+
+    def test_conversion_errors(self):
+        """Check that cells that can't be converted are counted, but empty ones aren't."""
+        CONVERSION_ERRORS.clear()
+        self.assertIsNone(clean_integer('X'))
+        self.assertIsNone(clean_integer(''))
+        self.assertEqual(CONVERSION_ERRORS, {'I': 1})
+
+
+class ConverterTests(TestCase):
+    """Test the converters compiled from the field mappings."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        command = LoadCommand()
+        command.build_mappings()
+        cls.converters = command.converters
+
+    def test_contribution_row(self):
+        """Check that a schedule A row is converted to a tuple of cleaned values."""
+        row = ['A', '9637632', '4580276', 'Republican Governors Association',
+               '113655877', '1-800 CONTACTS, INC.', '66 E WADSWORTH PARK DR.',
+               '', 'DRAPER', 'UT', '84020', '', 'N/A', '5000', 'N/A', '5000',
+               '20150630', '']
+        values = self.converters['A'](row)
+        self.assertIsInstance(values, tuple)
+        self.assertEqual(len(values), 17)
+        self.assertEqual(values[3], 'REPUBLICAN GOVERNORS ASSOCIATION')
+        self.assertIsNone(values[7])
+        self.assertIsNone(values[12])
+        self.assertEqual(values[13], Decimal('5000'))
+        self.assertEqual(values[16].date(), date(2015, 6, 30))
+        self.assertIsNotNone(values[16].tzinfo)
+
+    def test_bad_values(self):
+        """Check that values that can't be converted become None."""
+        row = ['2', '8872', '9637632', '2015013', '2015XX01', 'X', '0']
+        values = self.converters['2'](row)
+        self.assertEqual(values[3], timezone.make_aware(
+            timezone.datetime(2015, 1, 3)))
+        self.assertIsNone(values[4])
+        self.assertIsNone(values[5])
+        self.assertEqual(values[6], 0)
+
+    def test_non_ascii(self):
+        """Check that non-ASCII characters are dropped and text is truncated."""
+        row = ['B', '1', '2', 'Caf\xe9 ' + 'x' * 60]
+        values = self.converters['B'](row)
+        self.assertEqual(values[3], ('CAF ' + 'X' * 60)[0:50])
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StreamingLoadTest(TransactionTestCase):
+    """Test loading an archive while it downloads."""
+
+    def setUp(self):
+        """Serve a zipped copy of the test data file over HTTP."""
+        self.data_path = os.path.join(
+            os.path.dirname(__file__), 'TestDataFile.txt')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.zip_path = os.path.join(self.tmp_dir.name, 'fullData')
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as zipped:
+            zipped.write(
+                self.data_path,
+                'var/IRS/data/scripts/pofd/download/FullDataFile.txt')
+
+        handler = functools.partial(
+            QuietHTTPRequestHandler,
+            directory=self.tmp_dir.name)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{}/fullData'.format(self.server.server_port)
+
+    def chunks(self, data, size):
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+
+    def test_unzip_stream(self):
+        """Check that a zip archive is decompressed from small chunks."""
+        with open(self.zip_path, 'rb') as f:
+            zipped = f.read()
+        with open(self.data_path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(b''.join(unzip_stream(self.chunks(zipped, 7))), data)
+
+    def test_unzip_stream_stored(self):
+        """Check that uncompressed zip archives can be streamed too."""
+        stored_path = os.path.join(self.tmp_dir.name, 'stored.zip')
+        with zipfile.ZipFile(stored_path, 'w', zipfile.ZIP_STORED) as zipped:
+            zipped.writestr('FullDataFile.txt', b'H|20150830|0027|F|\n')
+        with open(stored_path, 'rb') as f:
+            chunks = self.chunks(f.read(), 5)
+        self.assertEqual(
+            b''.join(unzip_stream(chunks)), b'H|20150830|0027|F|\n')
+
+    def test_stray_carriage_return(self):
+        """Check that a streamed row ends at a carriage return outside quotes."""
+        with open(self.data_path, 'rb') as f:
+            data = f.read()
+        first = data.index(b'\nA|') + 1
+        newline = data.index(b'\n', first)
+        data = data[:newline] + b'\rX' + data[newline:]
+        expected = list(csv.reader(
+            io.TextIOWrapper(io.BytesIO(data), 'ISO-8859-1', newline=''),
+            delimiter='|'))
+        self.assertEqual(list(csv.reader(
+            iter_stream_lines(self.chunks(data, 7)), delimiter='|')), expected)
+
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as zipped:
+            zipped.writestr(
+                'var/IRS/data/scripts/pofd/download/FullDataFile.txt', data)
+        call_command('loadIRS', url=self.url)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+
+    def test_update_stream(self):
+        """Check that a streamed archive loads the same data as a file."""
+        call_command('updateIRS', stream=True, url=self.url)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        self.assertEqual(Committee.objects.count(), 49)
+        self.assertTrue(
+            F8872.objects.get(form_id_number='9637644').is_amended)
+
+        # Streamed filings get the same fingerprints as loaded files
+        fingerprints = dict(F8872.objects.values_list(
+            'form_id_number', 'fingerprint'))
+        call_command('loadIRS', test=True)
+        self.assertEqual(dict(F8872.objects.values_list(
+            'form_id_number', 'fingerprint')), fingerprints)
+
+
+    def test_ungrouped_stream(self):
+        """Check that rows streamed after their filing was saved are fingerprinted."""
+        with open(self.data_path) as f:
+            lines = f.readlines()
+        # Rows that span lines stay with the record they start
+        records = []
+        for line in lines:
+            if line[:2] in ('H|', '2|', 'A|', 'B|', 'F|') or not records:
+                records.append(line)
+            else:
+                records[-1] += line
+        footer = next(
+            i for i, record in enumerate(records) if record.startswith('F|'))
+
+        # Move the last schedule row of each filing to the end, after
+        # the batch with its filing has been saved
+        moved = []
+        for i in range(1, footer):
+            if records[i][:2] in ('A|', 'B|') and records[i + 1][:2] in (
+                    '2|', 'F|'):
+                moved.append(records[i])
+                records[i] = ''
+        self.assertGreater(len(moved), 10)
+        records[footer:footer] = moved
+
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as zipped:
+            zipped.writestr(
+                'var/IRS/data/scripts/pofd/download/FullDataFile.txt',
+                ''.join(records))
+        call_command('loadIRS', url=self.url, batch_size=1)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        fingerprints = dict(F8872.objects.values_list(
+            'form_id_number', 'fingerprint'))
+
+        call_command('loadIRS', test=True)
+        self.assertEqual(dict(F8872.objects.values_list(
+            'form_id_number', 'fingerprint')), fingerprints)
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves an archive with an ETag, conditional requests and ranges. The
+    first response is cut off after `drop_after` bytes if it is set.
+    """
+    archive = b''
+    etag = '"v1"'
+    drop_after = None
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.requests.append(dict(self.headers, method='HEAD'))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', str(len(self.archive)))
+        self.end_headers()
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        if (self.headers.get('Range') and
+                self.headers.get('If-Range', self.etag) == self.etag):
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(self.archive) - 1, len(self.archive)))
+        else:
+            self.send_response(200)
+        body = self.archive[start:]
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if self.drop_after:
+            body = body[0:self.drop_after]
+            type(self).drop_after = None
+        self.wfile.write(body)
+
+
+class DownloadTest(TransactionTestCase):
+    """Test conditional and resumable downloads of the archive."""
+
+    def setUp(self):
+        """Serve a zipped copy of the test data file over HTTP."""
+        self.data_path = os.path.join(
+            os.path.dirname(__file__), 'TestDataFile.txt')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        zip_path = os.path.join(self.tmp_dir.name, 'fullData.zip')
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipped:
+            zipped.write(
+                self.data_path,
+                'var/IRS/data/scripts/pofd/download/FullDataFile.txt')
+        with open(zip_path, 'rb') as f:
+            archive = f.read()
+
+        self.handler = type('Handler', (ArchiveRequestHandler,), {
+            'archive': archive,
+            'requests': []})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{}/fullData'.format(self.server.server_port)
+
+        settings_override = override_settings(BASE_DIR=self.tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.final_path = os.path.join(
+            self.tmp_dir.name, 'data', 'FullDataFile.txt')
+        self.archive_dir = os.path.join(self.tmp_dir.name, 'data', 'archives')
+
+    def assertDownloaded(self, path):
+        with open_archive(path) as f, open(self.data_path, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_conditional_download(self):
+        """Check that an unchanged archive isn't downloaded again."""
+        call_command('downloadIRS', url=self.url)
+        path = os.path.join(
+            self.archive_dir,
+            'fullData-{:%Y%m%d}.zip'.format(timezone.now()))
+        self.assertDownloaded(path)
+        self.assertFalse(os.path.exists(self.final_path))
+
+        call_command('downloadIRS', url=self.url)
+        self.assertEqual(len(self.handler.requests), 2)
+        self.assertEqual(self.handler.requests[1].get('If-None-Match'), '"v1"')
+
+        # A new version of the archive is downloaded
+        self.handler.etag = '"v2"'
+        call_command('downloadIRS', url=self.url)
+        self.assertEqual(len(self.handler.requests), 3)
+        self.assertDownloaded(path)
+
+    def test_resumed_download(self):
+        """Check that an interrupted download picks up where it left off."""
+        # The download is written in chunks of 30720 bytes, so the
+        # first three chunks are kept
+        self.handler.drop_after = 100000
+        call_command('downloadIRS', url=self.url)
+        self.assertEqual(len(self.handler.requests), 2)
+        self.assertEqual(self.handler.requests[1].get('Range'), 'bytes=92160-')
+        self.assertEqual(self.handler.requests[1].get('If-Range'), '"v1"')
+        self.assertDownloaded(os.path.join(
+            self.archive_dir,
+            'fullData-{:%Y%m%d}.zip'.format(timezone.now())))
+
+    def test_extract(self):
+        """Check that --extract also saves the data file, which is then loaded."""
+        call_command('downloadIRS', url=self.url, extract=True)
+        with open(self.final_path, 'rb') as f, open(self.data_path, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+        with open(os.path.join(self.tmp_dir.name, 'data', 'archive.json')) as f:
+            self.assertEqual(json.load(f)['path'], self.final_path)
+
+    def test_old_archives_are_removed(self):
+        """Check that only the latest few dated archives are kept."""
+        os.makedirs(self.archive_dir)
+        for day in ('20260101', '20260108', '20260115'):
+            path = os.path.join(self.archive_dir, 'fullData-{}.zip'.format(day))
+            with open(path, 'wb') as f:
+                f.write(self.handler.archive)
+        call_command('downloadIRS', url=self.url, keep=2)
+        self.assertEqual(sorted(os.listdir(self.archive_dir)), [
+            'fullData-20260115.zip',
+            'fullData-{:%Y%m%d}.zip'.format(timezone.now())])
+
+    def test_update_skips_unchanged_archive(self):
+        """Check that an unchanged archive isn't loaded again."""
+        call_command('updateIRS', url=self.url)
+        self.assertEqual(F8872.objects.count(), 65)
+        F8872.objects.filter(form_id_number='9637673').delete()
+
+        call_command('updateIRS', url=self.url)
+        self.assertEqual(F8872.objects.count(), 64)
+
+        call_command('updateIRS', url=self.url, force=True)
+        self.assertEqual(F8872.objects.count(), 65)
+
+    def test_stream_skips_unchanged_archive(self):
+        """Check that a streamed update checks whether the archive changed first."""
+        call_command('updateIRS', url=self.url, stream=True)
+        self.assertEqual(F8872.objects.count(), 65)
+        F8872.objects.filter(form_id_number='9637673').delete()
+
+        call_command('updateIRS', url=self.url, stream=True)
+        self.assertEqual(F8872.objects.count(), 64)
+        self.assertEqual(
+            [(r['method'], r.get('If-None-Match'))
+             for r in self.handler.requests if 'method' in r],
+            [('HEAD', None), ('HEAD', '"v1"')])
+
+        call_command('updateIRS', url=self.url, stream=True, force=True)
+        self.assertEqual(F8872.objects.count(), 65)
+
+        # A new version of the archive is loaded
+        F8872.objects.filter(form_id_number='9637673').delete()
+        self.handler.etag = '"v2"'
+        call_command('updateIRS', url=self.url, stream=True)
+        self.assertEqual(F8872.objects.count(), 65)
+
+    def test_stream_keeps_tables_when_download_fails(self):
+        """Check that a streamed update that's cut off leaves the live tables alone."""
+        call_command('updateIRS', url=self.url, stream=True)
+        self.handler.etag = '"v2"'
+        self.handler.drop_after = 100000
+        with self.assertRaises(Exception):
+            call_command('updateIRS', url=self.url, stream=True)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+
+        # It's loaded on the next run
+        call_command('updateIRS', url=self.url, stream=True)
+        self.assertEqual(len([
+            r for r in self.handler.requests if 'method' not in r]), 3)
+
+
+class CompressedArchiveTests(TestCase):
+    """Test loading archives that are still compressed."""
+
+    def setUp(self):
+        self.data_path = os.path.join(
+            os.path.dirname(__file__), 'TestDataFile.txt')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        with open(self.data_path, 'rb') as f:
+            self.data = f.read()
+
+    def assertLoaded(self):
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        self.assertEqual(
+            F8872.objects.exclude(fingerprint=None).count(), 65)
+
+    def test_zip(self):
+        """Check that a zip archive from the IRS is loaded without extracting it."""
+        path = os.path.join(self.tmp_dir.name, 'fullData.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipped:
+            zipped.write(
+                self.data_path,
+                'var/IRS/data/scripts/pofd/download/FullDataFile.txt')
+        call_command('loadIRS', path=path)
+        self.assertLoaded()
+
+    def test_gzip(self):
+        """Check that a gzip archive is loaded, in full and incrementally."""
+        path = os.path.join(self.tmp_dir.name, 'FullDataFile.txt.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write(self.data)
+        call_command('loadIRS', path=path)
+        self.assertLoaded()
+        call_command('loadIRS', path=path, incremental=True)
+        self.assertLoaded()
+
+    def test_zstd(self):
+        """Check that a zstd archive is loaded."""
+        if zstd is None:
+            self.skipTest('zstd is not installed')
+        path = os.path.join(self.tmp_dir.name, 'FullDataFile.txt.zst')
+        with zstd.open(path, 'wb') as f:
+            f.write(self.data)
+        call_command('loadIRS', path=path)
+        self.assertLoaded()
+
+    def test_split_reads_are_refused(self):
+        """Check that a compressed archive can't be split between processes or memory-mapped."""
+        path = os.path.join(self.tmp_dir.name, 'FullDataFile.txt.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write(self.data)
+        with self.assertRaises(CommandError):
+            call_command('loadIRS', path=path, workers=2)
+        with self.assertRaises(CommandError):
+            call_command('loadIRS', path=path, reader='mmap')
+
+
+class ConversionCacheTests(TestCase):
+    """Test the cache of converted cell values."""
+
+    def test_repeated_values_are_shared(self):
+        """Check that repeated raw values are converted once and share one object."""
+        command = LoadCommand()
+        command.build_mappings()
+        clear_caches()
+        row = ['A', '1', '2', 'Republican Governors Association', '113655877',
+               'x', '', '', 'Washington', 'DC', '20006', '', '', '5000', '',
+               '5000', '20150630']
+        first = command.converters['A'](row)
+        second = command.converters['A'](list(row))
+        self.assertEqual(first, second)
+        self.assertIs(first[3], second[3])
+        self.assertIs(first[16], second[16])
+
+        stats = cache_stats()
+        self.assertEqual(stats['D'], (1, 1))
+        self.assertEqual(stats['N'], (3, 1))
+        self.assertGreater(stats['C'][0], 0)
+
+    def test_load_summary(self):
+        """Check that the load logs cache hits and misses."""
+        with self.assertLogs('irs.management.commands.loadIRS') as logs:
+            call_command('loadIRS', test=True)
+        self.assertTrue(any(
+            'Conversion cache for date fields' in line for line in logs.output))
+
+
+class WriterTests(TestCase):
+    """Test the database writers used by the loader."""
+
+    def test_fallback_writer(self):
+        """Check that the ORM writer is used on databases other than PostgreSQL."""
+        self.assertIsInstance(get_writer(), ORMWriter)
+        self.assertNotIsInstance(get_writer(), CopyWriter)
+
+    def make_filing(self, form_id_number, EIN, organization_name):
+        return F8872(
+            record_type='2',
+            form_type=8872,
+            form_id_number=form_id_number,
+            begin_date=date(2024, 1, 1),
+            end_date=date(2024, 3, 31),
+            organization_name=organization_name,
+            EIN=EIN,
+            schedule_a_total=Decimal('0.00'),
+            schedule_b_total=Decimal('0.00'),
+            insert_datetime=timezone.now())
+
+    def test_batched_committees(self):
+        """Check that the first filing for a new committee gives it its name."""
+        Committee.objects.create(EIN='222222222', name='Existing Name')
+        ORMWriter().write([
+            self.make_filing('W001', '111111111', 'First Name'),
+            self.make_filing('W002', '111111111', 'Second Name'),
+            self.make_filing('W003', '222222222', 'New Name'),
+        ], [], [])
+        self.assertEqual(
+            Committee.objects.get(EIN='111111111').name, 'First Name')
+        self.assertEqual(
+            Committee.objects.get(EIN='222222222').name, 'Existing Name')
+        self.assertEqual(
+            F8872.objects.get(form_id_number='W002').committee.EIN,
+            '111111111')
+
+    def test_committees_in_order(self):
+        """Check that new committees are inserted in order of EIN, whatever order their filings come in."""
+        with CaptureQueriesContext(connection) as queries:
+            ORMWriter().save_committees([
+                self.make_filing('W001', '333333333', 'Third'),
+                self.make_filing('W002', '111111111', 'First'),
+                self.make_filing('W003', '222222222', 'Second'),
+            ])
+        sql = next(
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('INSERT'))
+        self.assertLess(sql.index('111111111'), sql.index('222222222'))
+        self.assertLess(sql.index('222222222'), sql.index('333333333'))
+
+    def test_batched_filings_replace_existing(self):
+        """Check that filings that already exist are replaced."""
+        ORMWriter().write(
+            [self.make_filing('W001', '111111111', 'Old Name')], [], [])
+        F8872.objects.filter(form_id_number='W001').update(is_amended=True)
+        ORMWriter().write(
+            [self.make_filing('W001', '111111111', 'New Name')], [], [])
+        filing = F8872.objects.get(form_id_number='W001')
+        self.assertEqual(filing.organization_name, 'New Name')
+        self.assertFalse(filing.is_amended)
+        self.assertEqual(F8872.objects.count(), 1)
+
+    def test_repeated_filing_keeps_rows(self):
+        """Check that a filing saved again in a later batch keeps the rows saved with it, on every backend."""
+        writer = get_writer()
+        filing = self.make_filing('W001', '111111111', 'Old Name')
+        filing.id = 1
+        contribution = ParsedRow(
+            ('record_type', 'form_id_number', 'schedule_a_id',
+             'organization_name', 'EIN'),
+            ('A', 'W001', 'A001', 'Old Name', '111111111'),
+            'W001',
+            filing_id=1)
+        with transaction.atomic():
+            writer.write([filing], [contribution], [])
+        filing = self.make_filing('W001', '111111111', 'New Name')
+        filing.id = 1
+        with transaction.atomic():
+            writer.write([filing], [], [])
+        self.assertEqual(
+            F8872.objects.get(form_id_number='W001').organization_name,
+            'New Name')
+        self.assertEqual(Contribution.objects.filter(filing_id=1).count(), 1)
+
+    def test_repeated_filing_in_archive(self):
+        """Check that a filing row repeated later in the archive doesn't lose its rows."""
+        path = os.path.join(os.path.dirname(__file__), 'TestDataFile.txt')
+        rows = list(read_archive(path))
+        rows.append(next(row for row in rows if row[0] == '2')[:])
+        command = LoadCommand()
+        command.build_mappings()
+        command.reset_state()
+        command.writer = get_writer()
+        command.fingerprints = {}
+        command.max_batch_size = 100
+        command.load_archive(rows=rows)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+
+    def test_copy_value(self):
+        """Check that values are escaped for the COPY text format."""
+        self.assertEqual(copy_value(None), '\\N')
+        self.assertEqual(copy_value(True), 't')
+        self.assertEqual(copy_value(False), 'f')
+        self.assertEqual(copy_value(Decimal('10.50')), '10.50')
+        self.assertEqual(copy_value(date(2015, 6, 30)), '2015-06-30')
+        self.assertEqual(copy_value('A\tB\nC\\D'), 'A\\tB\\nC\\\\D')
+
+    def test_copy_fields(self):
+        """Check that COPY leaves auto-incrementing keys to the database."""
+        writer = CopyWriter()
+        columns = [f.column for f in writer.get_fields(Contribution)]
+        self.assertNotIn('id', columns)
+        self.assertIn('filing_id', columns)
+        columns = [f.column for f in writer.get_fields(F8872)]
+        self.assertIn('form_id_number', columns)
+        self.assertNotIn('id', columns)
+        # Unless the loader has handed out keys already
+        columns = [f.column for f in writer.get_fields(F8872, [F8872(id=1)])]
+        self.assertIn('id', columns)
+
+
+    def test_copy_rows(self):
+        """Check that COPY is fed the parsed values, the keys of their filing and committee, and defaults for the rest."""
+        command = LoadCommand()
+        command.build_mappings()
+        fields = command.field_names['A']
+        values = ('A', 'W001', 'A001', 'Name\tWith Tab', '111111111')
+        writer = CopyWriter()
+        with mock.patch.object(CopyWriter, 'send') as send:
+            writer.copy_rows(Contribution, [ParsedRow(
+                fields, values, 'W001', filing_id=3, committee_id=4)])
+        table, columns, buf = send.call_args[0]
+        self.assertEqual(table, Contribution._meta.db_table)
+        columns = [f.attname for f in columns]
+        self.assertEqual(columns[:len(fields)], list(fields))
+        self.assertNotIn('id', columns)
+        line = dict(zip(columns, buf.getvalue().rstrip('\n').split('\t')))
+        self.assertEqual(line['organization_name'], 'Name\\tWith Tab')
+        # Fields missing from a short row are null, like the ORM leaves them
+        self.assertEqual(line['contribution_amount'], '\\N')
+        self.assertEqual(line['filing_id'], '3')
+        self.assertEqual(line['committee_id'], '4')
+        self.assertEqual(line['is_current'], 't')
+        self.assertEqual(len(line), len(writer.get_fields(Contribution)))
+
+
+class KeyTests(TestCase):
+    """Test the integer keys of committees and filings."""
+
+    def test_key_map(self):
+        """Check that keys are read from the database and new ones follow on."""
+        Committee.objects.create(id=7, EIN='111111111', name='Existing')
+        keys = KeyMap()
+        keys.load(Committee, 'EIN')
+        self.assertEqual(keys['111111111'], 7)
+        self.assertEqual(keys['222222222'], 8)
+        self.assertEqual(keys['222222222'], 8)
+        self.assertEqual(len(keys), 2)
+        self.assertIsNone(keys.get('333333333'))
+
+    def test_keys_are_kept(self):
+        """Check that reloading the archive keeps the keys and rows point at their filing and committee."""
+        call_command('loadIRS', test=True)
+        filings = dict(F8872.objects.values_list('form_id_number', 'pk'))
+        committees = dict(Committee.objects.values_list('EIN', 'pk'))
+        self.assertEqual(
+            sorted(committees.values()), list(range(1, len(committees) + 1)))
+
+        call_command('loadIRS', test=True)
+        self.assertEqual(
+            dict(F8872.objects.values_list('form_id_number', 'pk')), filings)
+        self.assertEqual(
+            dict(Committee.objects.values_list('EIN', 'pk')), committees)
+        for model in (Contribution, Expenditure):
+            self.assertFalse(model.objects.exclude(
+                filing__form_id_number=F('form_id_number')).exists())
+            self.assertFalse(model.objects.exclude(
+                committee__EIN=F('EIN')).exists())
+
+
+class WriterThreadTests(TransactionTestCase):
+    """Test saving batches in threads while the archive is parsed."""
+
+    def setUp(self):
+        # The connections of finished writer threads to the in-memory
+        # test database are only closed once they're garbage collected,
+        # and closing one while a query on the shared cache is running
+        # deadlocks SQLite, so they're collected between tests instead
+        gc.disable()
+        self.addCleanup(gc.collect)
+        self.addCleanup(gc.enable)
+
+    def test_threaded_load(self):
+        """Check that a load with a writer thread saves the same data."""
+        call_command('loadIRS', test=True, writers=1)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+        self.assertEqual(Committee.objects.count(), 49)
+        self.assertEqual(
+            Committee.objects.get(EIN='751954937').name,
+            'GARDERE WYNNE SEWELL L L P CAMPAIGN FUND')
+        self.assertTrue(
+            F8872.objects.get(form_id_number='9637644').is_amended)
+
+    def test_report(self):
+        """Check that the queries run by writer threads are counted in the load stage."""
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        counts = []
+        for writers in (0, 1):
+            path = os.path.join(report_dir, '{}.json'.format(writers))
+            call_command('loadIRS', test=True, writers=writers, report=path)
+            with open(path) as f:
+                stages = json.load(f)['stages']
+            counts.append(next(
+                s['queries'] for s in stages if s['name'] == 'load'))
+        self.assertGreaterEqual(counts[1], counts[0])
+
+    def test_error(self):
+        """Check that an error in a writer thread stops the load."""
+        with mock.patch.object(
+                LoadCommand, 'write_batch', side_effect=ValueError('failed')):
+            with self.assertRaisesMessage(ValueError, 'failed'):
+                call_command('loadIRS', test=True, writers=1)
+
+    def test_rows_wait_for_their_filing(self):
+        """Check that rows in a later batch than their filing are saved after it's committed."""
+        path = os.path.join(os.path.dirname(__file__), 'TestDataFile.txt')
+        rows = list(read_archive(path))
+        # Move the last schedule row of each filing to the end
+        moved = [
+            row for row, next_row in zip(rows, rows[1:])
+            if row[:1] in (['A'], ['B']) and next_row[:1] in (['2'], ['F'])]
+        self.assertGreater(len(moved), 10)
+        rows = [row for row in rows if row not in moved]
+        footer = next(i for i, row in enumerate(rows) if row[:1] == ['F'])
+        rows[footer:footer] = moved
+
+        committed = set()
+        early = []
+
+        def write_batch(filings, contributions, expenditures, replace=None,
+                        names=None):
+            form_ids = set(f.form_id_number for f in filings)
+            early.extend(
+                row.form_id_number for row in contributions + expenditures
+                if row.form_id_number not in form_ids | committed)
+            # Slow enough that the writers fall behind the parser
+            time.sleep(0.05)
+            committed.update(form_ids)
+
+        command = LoadCommand()
+        command.build_mappings()
+        command.reset_state()
+        command.writer = get_writer()
+        command.fingerprints = {}
+        command.writers = 3
+        command.max_batch_size = 1
+        with mock.patch.object(command, 'write_batch', write_batch):
+            command.load_archive(rows=rows)
+        self.assertEqual(len(committed), 65)
+        self.assertEqual(early, [])
+
+    def test_pool_started_before_writers(self):
+        """Check that the parsing processes are forked before the writer threads start."""
+        started = []
+        start_pool = LoadCommand.start_pool
+        start_writers = LoadCommand.start_writers
+
+        def record(name, method):
+            def wrapper(command, *args, **kwargs):
+                started.append(name)
+                return method(command, *args, **kwargs)
+            return wrapper
+
+        with mock.patch.object(
+                LoadCommand, 'start_pool', record('pool', start_pool)), \
+                mock.patch.object(
+                    LoadCommand, 'start_writers',
+                    record('writers', start_writers)):
+            call_command('loadIRS', test=True, workers=2, writers=1)
+        # The fingerprints are computed in a pool of their own first
+        self.assertEqual(started, ['pool', 'pool', 'writers'])
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+        self.assertEqual(Expenditure.objects.count(), 5068)
+
+    def test_back_pressure(self):
+        """Check that the queue of batches is bounded."""
+        release = threading.Event()
+        saved = []
+
+        def save(batch):
+            release.wait()
+            saved.append(batch)
+
+        threads = WriterThreads(save, threads=1, maxsize=2)
+        # One batch is taken by the thread and two wait in the queue
+        for i in range(3):
+            threads.put(i)
+        put = threading.Thread(target=threads.put, args=(3,))
+        put.start()
+        put.join(0.5)
+        self.assertTrue(put.is_alive())
+        release.set()
+        put.join()
+        with threads:
+            pass
+        self.assertEqual(saved, [0, 1, 2, 3])
+
+    def test_errors_are_raised_in_caller(self):
+        """Check that the first error is raised again and later batches are dropped."""
+        saved = []
+
+        def save(batch):
+            if batch == 1:
+                raise ValueError(batch)
+            saved.append(batch)
+
+        with self.assertRaises(ValueError):
+            with WriterThreads(save) as threads:
+                for i in range(100):
+                    threads.put(i)
+        self.assertEqual(saved[0], 0)
+        self.assertNotIn(99, saved)
+
+
+class TuningTests(TransactionTestCase):
+    """Test tuning the database connection for a load."""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA {}'.format(name))
+            return cursor.fetchone()[0]
+
+    def test_tuned_during_load(self):
+        """Check that SQLite is tuned while batches are written and put back after."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Only SQLite is tuned')
+        max_query_params = connection.features.max_query_params
+        synchronous = self.pragma('synchronous')
+        seen = []
+        write_batch = LoadCommand.write_batch
+
+        def check(command, *args, **kwargs):
+            seen.append((
+                connection.features.max_query_params,
+                self.pragma('synchronous')))
+            return write_batch(command, *args, **kwargs)
+
+        with mock.patch.object(LoadCommand, 'write_batch', check):
+            call_command('loadIRS', test=True, batch_size=1000)
+        self.assertGreater(len(seen), 1)
+        for params, sync in seen:
+            self.assertGreater(params, 999)
+            self.assertEqual(sync, 0)
+        self.assertEqual(
+            connection.features.max_query_params, max_query_params)
+        self.assertEqual(self.pragma('synchronous'), synchronous)
+        self.assertEqual(F8872.objects.count(), 65)
+        self.assertEqual(Contribution.objects.count(), 5911)
+
+    def test_batch_size(self):
+        """Check that smaller batches are saved in more transactions."""
+        batches = []
+        write_batch = LoadCommand.write_batch
+
+        def count(command, filings, *args, **kwargs):
+            batches.append(len(filings))
+            return write_batch(command, filings, *args, **kwargs)
+
+        with mock.patch.object(LoadCommand, 'write_batch', count):
+            call_command('loadIRS', test=True, batch_size=1)
+        self.assertEqual(sum(batches), 65)
+        self.assertGreater(len(batches), 60)
+
+    def test_not_tuned_in_transaction(self):
+        """Check that the connection is left alone inside a transaction."""
+        with transaction.atomic():
+            self.assertIsNone(tune_connection())
+
+
+class SummaryTests(TestCase):
+    """Test the summary tables rebuilt by loadIRS."""
+
+    def setUp(self):
+        call_command('loadIRS', test=True)
+
+    def assertSummariesMatch(self):
+        contributions = Contribution.objects.filter(filing__is_amended=False)
+        expected = dict(
+            ((row['committee_id'], row['filing__end_date__year']),
+             (row['total'], row['count']))
+            for row in contributions.values(
+                'committee_id', 'filing__end_date__year').annotate(
+                total=Sum('contribution_amount'), count=Count('id')))
+        totals = dict(
+            ((t.committee_id, t.year),
+             (t.contribution_total, t.contribution_count))
+            for t in CommitteeTotal.objects.filter(contribution_count__gt=0))
+        self.assertEqual(totals, expected)
+
+        places = PlaceTotal.objects.aggregate(
+            contributions=Sum('contribution_total'),
+            expenditures=Sum('expenditure_total'))
+        self.assertEqual(
+            places['contributions'],
+            contributions.aggregate(total=Sum('contribution_amount'))['total'])
+        self.assertEqual(
+            places['expenditures'],
+            Expenditure.objects.filter(filing__is_amended=False).aggregate(
+                total=Sum('expenditure_amount'))['total'])
+
+        top = contributions.exclude(contributor_name=None).values(
+            'committee_id', 'contributor_name').annotate(
+            total=Sum('contribution_amount')).order_by(
+            '-total', 'contributor_name').first()
+        self.assertEqual(
+            TopContributor.objects.filter(
+                committee_id=top['committee_id'], rank=1).get().contributor_name,
+            top['contributor_name'])
+
+    def test_full_load(self):
+        """Check that the summaries add up to the contributions and expenditures of current filings."""
+        self.assertEqual(CommitteeTotal.objects.filter(
+            committee__EIN='751954937').aggregate(
+            count=Sum('filing_count'))['count'],
+            F8872.objects.filter(
+                EIN='751954937', is_amended=False).count())
+        self.assertSummariesMatch()
+
+    def test_incremental_load(self):
+        """Check that an incremental load only rebuilds the summaries of committees that changed."""
+        F8872.objects.filter(form_id_number='9637673').update(
+            fingerprint='stale')
+        committee_id = F8872.objects.get(form_id_number='9637673').committee_id
+        Contribution.objects.filter(form_id_number='9637673').update(
+            contribution_amount=0)
+        others = set(CommitteeTotal.objects.exclude(
+            committee_id=committee_id).values_list('id', flat=True))
+
+        call_command('loadIRS', test=True, incremental=True)
+
+        self.assertSummariesMatch()
+        self.assertEqual(set(CommitteeTotal.objects.exclude(
+            committee_id=committee_id).values_list('id', flat=True)), others)
+
+    def test_unchanged_incremental_load(self):
+        """Check that the summaries are left alone when nothing changed."""
+        ids = set(CommitteeTotal.objects.values_list('id', flat=True))
+        call_command('loadIRS', test=True, incremental=True)
+        self.assertEqual(
+            set(CommitteeTotal.objects.values_list('id', flat=True)), ids)
+
+
+class SearchTests(TestCase):
+    """Test the full-text search index kept by loadIRS."""
+
+    def setUp(self):
+        call_command('loadIRS', test=True)
+
+    def assertSearchMatches(self, queryset, text):
+        """Check that a search finds the rows where every word starts a word of a searched field."""
+        model = queryset.model
+        words = get_words(text)
+        expected = set(
+            row['pk'] for row in queryset.values('pk', *SEARCH_FIELDS[model])
+            if all(any(
+                w.startswith(word)
+                for field in SEARCH_FIELDS[model]
+                for w in get_words(row[field] or '')) for word in words))
+        self.assertTrue(expected)
+        self.assertEqual(
+            set(queryset.search(text).values_list('pk', flat=True)),
+            expected)
+
+    def test_search(self):
+        """Check that contributors, employers, recipients, purposes and committees can be searched."""
+        self.assertSearchMatches(Contribution.objects.all(), 'buena vis')
+        self.assertSearchMatches(Contribution.objects.all(), 'Local 803')
+        self.assertSearchMatches(Contribution.current.all(), 'plumbers')
+        self.assertSearchMatches(Expenditure.objects.all(), 'consult')
+        self.assertSearchMatches(
+            Committee.objects.all(),
+            Committee.objects.get(EIN='912134686').name.split()[0])
+        self.assertEqual(
+            Contribution.objects.search('').count(),
+            Contribution.objects.count())
+
+    def test_fallback(self):
+        """Check that databases without full-text search fall back to icontains."""
+        self.assertEqual(
+            set(SearchIndex().search(
+                Contribution.objects.all(), 'buena vista')),
+            set(Contribution.objects.filter(
+                contributor_name__icontains='buena').filter(
+                contributor_name__icontains='vista')))
+
+    def test_incremental_load(self):
+        """Check that an incremental load reindexes the rows of filings that changed."""
+        F8872.objects.filter(form_id_number='9637673').update(
+            fingerprint='stale')
+        Contribution.objects.filter(form_id_number='9637673').update(
+            contributor_name='Stale Name')
+        self.assertFalse(Contribution.objects.search('stale').exists())
+
+        call_command('loadIRS', test=True, incremental=True)
+
+        self.assertSearchMatches(Contribution.objects.all(), 'buena vista')
+        self.assertFalse(Contribution.objects.search('stale').exists())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM irs_contribution_search')
+            self.assertEqual(
+                cursor.fetchone()[0], Contribution.objects.count())
+
+
+class PaginationTests(TestCase):
+    """Test the paginator the admin uses for big tables."""
+
+    def setUp(self):
+        call_command('loadIRS', test=True)
+
+    def test_estimate_count(self):
+        """Check that the size of a whole table is estimated, and that of a filtered one isn't on SQLite."""
+        highest = Contribution.objects.aggregate(highest=Max('id'))['highest']
+        self.assertEqual(estimate_count(Contribution.objects.all()), highest)
+        self.assertGreaterEqual(highest, Contribution.objects.count())
+        self.assertIsNone(estimate_count(
+            Contribution.objects.filter(contributor_address_state='CA')))
+
+    def test_paginator(self):
+        """Check that big counts are estimated or stop at the limit, and small ones are exact."""
+        state = Contribution.objects.values('contributor_address_state').annotate(
+            count=Count('id')).filter(count__lt=100).order_by('-count')[0]
+        highest = Contribution.objects.aggregate(highest=Max('id'))['highest']
+        with mock.patch('irs.pagination.COUNT_LIMIT', 100):
+            paginator = EstimatedCountPaginator(
+                Contribution.objects.order_by('id'), 50)
+            with self.assertNumQueries(1):
+                self.assertEqual(paginator.count, highest)
+            paginator = EstimatedCountPaginator(
+                Contribution.objects.filter(is_current=True), 50)
+            self.assertEqual(paginator.count, 100)
+            self.assertEqual(paginator.num_pages, 2)
+            paginator = EstimatedCountPaginator(
+                Contribution.objects.filter(
+                    contributor_address_state=state[
+                        'contributor_address_state']), 50)
+            self.assertEqual(paginator.count, state['count'])
+            self.assertEqual(
+                EstimatedCountPaginator(list(range(150)), 50).count, 150)
+
+
+@override_settings(ROOT_URLCONF='irs.urls')
+class ExportTests(TestCase):
+    """Test streaming contributions and expenditures a page at a time."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('loadIRS', test=True)
+        # Rows without a date come last
+        Contribution.objects.filter(
+            id__in=Contribution.objects.order_by('id').values('id')[:5]).update(
+            contribution_date=None)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_pages(self):
+        """Check that following the cursors exports every row once, in order."""
+        url = '/contributions.csv?limit=1000'
+        rows = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+            page = list(csv.DictReader(io.StringIO(self.read(response))))
+            self.assertLessEqual(len(page), 1000)
+            rows.extend(page)
+            pages += 1
+            url = response.get('Link', '').partition('>')[0][1:]
+        self.assertEqual(pages, 6)
+        self.assertEqual(len(rows), Contribution.objects.count())
+        self.assertEqual(
+            [int(row['id']) for row in rows],
+            list(Contribution.objects.order_by(
+                F('contribution_date').asc(nulls_last=True), 'id').values_list(
+                'id', flat=True)))
+
+    def test_small_pages(self):
+        """Check that small pages are found by their keys rather than an OFFSET."""
+        undated = Contribution.objects.filter(contribution_date=None)
+        EIN = undated.values_list('EIN', flat=True).first()
+        expected = list(Contribution.objects.filter(EIN=EIN).order_by(
+            F('contribution_date').asc(nulls_last=True), 'id').values_list(
+            'id', flat=True))
+        self.assertGreater(len(expected), 20)
+        self.assertIn(undated.filter(EIN=EIN).first().id, expected[-5:])
+
+        url = '/contributions.ndjson?committee={}&limit=3'.format(EIN)
+        rows = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url)
+                page = [json.loads(line)
+                        for line in self.read(response).splitlines()]
+                self.assertLessEqual(len(page), 3)
+                rows.extend(page)
+                url = response.get('Link', '').partition('>')[0][1:]
+        self.assertEqual([row['id'] for row in rows], expected)
+        self.assertFalse(any(
+            'OFFSET' in q['sql'] for q in queries.captured_queries))
+
+    def test_ndjson(self):
+        """Check that filtered rows are exported as JSON lines."""
+        response = self.client.get('/expenditures.ndjson', {
+            'committee': '113655877', 'current': '1', 'since': '2015-01-01'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertNotIn('Link', response)
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(rows), Expenditure.current.filter(
+            EIN='113655877',
+            expenditure_date__gte=date(2015, 1, 1)).count())
+        self.assertTrue(rows)
+        self.assertEqual(rows[0]['EIN'], '113655877')
+        self.assertEqual(
+            rows[0]['committee_id'],
+            Committee.objects.get(EIN='113655877').pk)
+
+    def test_bad_parameters(self):
+        """Check that bad cursors, dates and limits are refused."""
+        for params in ({'after': 'x'}, {'since': '2015-13-01'}, {'limit': '0'}):
+            response = self.client.get('/contributions.csv', params)
+            self.assertEqual(response.status_code, 400)
+
+    async def test_asgi(self):
+        """Check that rows are streamed asynchronously under ASGI."""
+        response = await self.async_client.get(
+            '/contributions.ndjson', {'limit': '10'})
+        self.assertTrue(response.is_async)
+        lines = b''.join([
+            chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertIn('after=', response['Link'])
+
+
+@override_settings(ROOT_URLCONF='irs.tests.urls')
+class AdminTests(TestCase):
+    """Test the changelists of contributions and expenditures in the admin."""
+    url = '/admin/irs/contribution/'
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('loadIRS', test=True)
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.user)
+
+    def get(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in queries.captured_queries]
+
+    def get_choices(self, response):
+        return dict(
+            (spec.field_path, list(spec.lookup_choices))
+            for spec in response.context['cl'].filter_specs
+            if hasattr(spec, 'lookup_choices'))
+
+    def test_cached_choices(self):
+        """Check that the date hierarchy and the choices of filters are read once."""
+        response, queries = self.get()
+        self.assertTrue([sql for sql in queries if 'DISTINCT' in sql])
+        choices = self.get_choices(response)
+        self.assertEqual(choices['entity_type'], list(
+            Contribution.objects.values_list(
+                'entity_type', flat=True).distinct().order_by('entity_type')))
+
+        # The session, the user, the estimated count and the page
+        with self.assertNumQueries(5):
+            response, queries = self.get()
+        self.assertFalse([sql for sql in queries if 'DISTINCT' in sql])
+        self.assertEqual(self.get_choices(response), choices)
+        self.assertContains(response, 'contribution_date__year=2015')
+
+    def test_state_choices(self):
+        """Check that the choices of states are read from the place totals."""
+        response, queries = self.get()
+        self.assertEqual(
+            self.get_choices(response)['contributor_address_state'],
+            list(PlaceTotal.objects.filter(contribution_count__gt=0).values_list(
+                'state', flat=True).distinct().order_by('state')))
+        self.assertFalse([
+            sql for sql in queries
+            if 'DISTINCT' in sql and 'irs_contribution' in sql and
+            'contributor_address_state' in sql])
+
+        # Before the totals are built, the table is read
+        PlaceTotal.objects.all().delete()
+        cache.clear()
+        response, queries = self.get()
+        self.assertEqual(
+            self.get_choices(response)['contributor_address_state'],
+            list(Contribution.objects.values_list(
+                'contributor_address_state', flat=True).distinct().order_by(
+                'contributor_address_state')))
+
+    def test_search(self):
+        """Check that the search box uses the full-text index or an exact lookup."""
+        response, queries = self.get({'q': 'buena vista'})
+        self.assertEqual(
+            response.context['cl'].result_count,
+            Contribution.objects.search('buena vista').count())
+        self.assertTrue(response.context['cl'].result_count)
+        self.assertFalse([sql for sql in queries if 'LIKE' in sql])
+
+        response, queries = self.get({'q': '9637673'})
+        self.assertEqual(
+            response.context['cl'].result_count,
+            Contribution.objects.filter(form_id_number='9637673').count())
+        self.assertFalse([sql for sql in queries if 'LIKE' in sql])
+
+    def test_only_list_columns(self):
+        """Check that the rows of a page are read with only the listed columns."""
+        response, queries = self.get()
+        cl = response.context['cl']
+        self.assertFalse([
+            sql for sql in queries if 'contributor_address_line_1' in sql])
+        self.assertIn(
+            'contributor_address_line_1',
+            cl.result_list[0].get_deferred_fields())
+        with self.assertNumQueries(0):
+            for row in cl.result_list:
+                (row.contributor_name, row.contribution_amount,
+                 row.contribution_date, row.organization_name,
+                 row.contributor_address_state)
+
+        self.url = '/admin/irs/expenditure/'
+        response, queries = self.get()
+        self.assertFalse([
+            sql for sql in queries if 'recipient_address_line_1' in sql])
+        self.assertTrue(response.context['cl'].result_list)
+
+
 class ModelTests(TestCase):
     """Test model methods and properties."""
 
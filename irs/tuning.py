@@ -0,0 +1,85 @@
+import sqlite3
+import logging
+from contextlib import contextmanager
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Pragmas that speed up a bulk load on SQLite. With synchronous off,
+# a crash of the machine during the load can corrupt the database,
+# which is then reloaded anyway.
+SQLITE_LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    # Negative sizes are in KiB, so this is 64 MiB
+    'cache_size': -65536,
+    'temp_store': 'MEMORY',
+}
+
+# Statements with many more parameters than this take longer for
+# Django to build than they save
+MAX_QUERY_PARAMS = 8192
+
+
+def get_variable_limit():
+    """
+    Returns the most parameters SQLite takes in a single statement on
+    the current connection. Django assumes the old default of 999,
+    but builds of SQLite since 3.32 allow 32766 or more.
+    """
+    connection.ensure_connection()
+    try:
+        return connection.connection.getlimit(
+            sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    except AttributeError:
+        # Python before 3.11
+        return connection.features.max_query_params
+
+
+def set_pragmas(pragmas):
+    """
+    Sets pragmas on the current connection, returning their old values.
+    """
+    old_values = {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {}'.format(name))
+            old_values[name] = cursor.fetchone()[0]
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+    return old_values
+
+
+def tune_connection():
+    """
+    Sets up the current connection for a bulk load: on SQLite, applies
+    the load pragmas and lets bulk inserts use as many parameters as
+    SQLite allows, so that far fewer INSERT statements are needed.
+    Returns what's needed to undo it, or None if there's nothing to do.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # Most pragmas can't be changed inside a transaction
+        return None
+    max_query_params = connection.features.max_query_params
+    connection.features.max_query_params = max(
+        max_query_params, min(get_variable_limit(), MAX_QUERY_PARAMS))
+    return max_query_params, set_pragmas(SQLITE_LOAD_PRAGMAS)
+
+
+@contextmanager
+def tuned_for_load():
+    """
+    Tunes the connection for the duration of a load and puts it back
+    the way it was at the end.
+    """
+    undo = tune_connection()
+    if undo is None:
+        yield
+        return
+
+    max_query_params, pragmas = undo
+    logger.debug('Tuned SQLite for the load, was {}'.format(pragmas))
+    try:
+        yield
+    finally:
+        connection.features.max_query_params = max_query_params
+        set_pragmas(pragmas)
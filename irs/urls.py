@@ -0,0 +1,23 @@
+from django.urls import path
+from irs import views
+
+app_name = 'irs'
+
+urlpatterns = [
+    path(
+        'contributions.csv',
+        views.ContributionExportView.as_view(format='csv'),
+        name='contributions-csv'),
+    path(
+        'contributions.ndjson',
+        views.ContributionExportView.as_view(format='ndjson'),
+        name='contributions-ndjson'),
+    path(
+        'expenditures.csv',
+        views.ExpenditureExportView.as_view(format='csv'),
+        name='expenditures-csv'),
+    path(
+        'expenditures.ndjson',
+        views.ExpenditureExportView.as_view(format='ndjson'),
+        name='expenditures-ndjson'),
+]
@@ -0,0 +1,219 @@
+import csv
+from datetime import date
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Max, Q
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.views import View
+from irs.models import Contribution, Expenditure
+
+# Number of rows in a page of an export, unless a limit is asked for
+PAGE_SIZE = 50000
+
+# Most rows that can be asked for in one page
+MAX_PAGE_SIZE = 1000000
+
+# Number of rows fetched from the database at a time
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """
+    A file-like object that hands back what's written to it, so csv
+    can format rows one at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def parse_cursor(value):
+    """
+    Parses a cursor of the form "date,id", where the date is empty for
+    rows without one, into a date or None and an id.
+    """
+    day, sep, pk = value.partition(',')
+    if not sep:
+        raise ValueError('Cursors look like 2015-06-30,12345')
+    return (date.fromisoformat(day) if day else None), int(pk)
+
+
+def format_cursor(day, pk):
+    return '{},{}'.format(day.isoformat() if day else '', pk)
+
+
+class ExportView(View):
+    """
+    Streams the rows of a model as CSV or newline-delimited JSON, a
+    page at a time. Pages are ordered by date and id, with rows that
+    have no date last, and the next one starts after the cursor given
+    in the Link header of the last. Rows are read from the database in
+    chunks and written out as they come, so memory use doesn't depend
+    on the size of the page.
+
+    Takes these query parameters, all optional:
+
+        committee: the EIN of a committee
+        filing: a form id number
+        state: a two-letter state of the contributor or recipient
+        since, until: the first and last dates, like 2015-06-30
+        current: "1" to leave out rows of amended filings
+        after: the cursor to start after
+        limit: the number of rows in the page
+    """
+    model = None
+    date_field = None
+    state_field = None
+    format = 'csv'
+
+    def get_fields(self):
+        return [f.attname for f in self.model._meta.concrete_fields]
+
+    def get_queryset(self, params):
+        queryset = self.model.objects.all()
+        if params.get('current') == '1':
+            queryset = self.model.current.all()
+        if params.get('committee'):
+            queryset = queryset.filter(EIN=params['committee'])
+        if params.get('filing'):
+            queryset = queryset.filter(form_id_number=params['filing'])
+        if params.get('state'):
+            queryset = queryset.filter(
+                **{self.state_field: params['state'].upper()})
+        if params.get('since'):
+            queryset = queryset.filter(**{
+                self.date_field + '__gte':
+                    date.fromisoformat(params['since'])})
+        if params.get('until'):
+            queryset = queryset.filter(**{
+                self.date_field + '__lte':
+                    date.fromisoformat(params['until'])})
+        if params.get('after'):
+            queryset = queryset.filter(self.after(
+                *parse_cursor(params['after'])))
+        return queryset.order_by(
+            F(self.date_field).asc(nulls_last=True), 'id')
+
+    def after(self, day, pk):
+        """
+        Returns a filter for the rows that come after a cursor.
+        """
+        if day is None:
+            return Q(**{self.date_field + '__isnull': True, 'id__gt': pk})
+        return (
+            Q(**{self.date_field: day, 'id__gt': pk}) |
+            Q(**{self.date_field + '__gt': day}) |
+            Q(**{self.date_field + '__isnull': True}))
+
+    def next_cursor(self, queryset, limit):
+        """
+        Returns the cursor of the last row of the page, or None if
+        there are no rows after it. The aggregates run over the page's
+        dates and ids, bounded by the limit, so the rows before the
+        page's last one are never skipped over with an OFFSET.
+        """
+        page = queryset.values(self.date_field, 'id')[:limit]
+        undated = Q(**{self.date_field + '__isnull': True})
+        summary = page.aggregate(
+            rows=Count('id'),
+            day=Max(self.date_field),
+            undated=Count('id', filter=undated))
+        if summary['rows'] < limit:
+            return None
+
+        # Rows without a date come last, and rows with the same date
+        # by id
+        day = None if summary['undated'] else summary['day']
+        pk = page.aggregate(pk=Max('id', filter=(
+            undated if day is None else Q(**{self.date_field: day}))))['pk']
+        if not queryset.filter(self.after(day, pk)).exists():
+            return None
+        return format_cursor(day, pk)
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', PAGE_SIZE))
+            if not 0 < limit <= MAX_PAGE_SIZE:
+                raise ValueError(
+                    'The limit must be between 1 and {}'.format(
+                        MAX_PAGE_SIZE))
+            queryset = self.get_queryset(request.GET)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        cursor = self.next_cursor(queryset, limit)
+
+        # values() rather than values_list(), which would run the
+        # query straight away in aiterator()
+        rows = queryset.values(*self.get_fields())[:limit]
+        if isinstance(request, ASGIRequest):
+            # A plain iterator would be read into memory in full
+            lines = self.alines(rows)
+        else:
+            lines = self.lines(rows)
+
+        response = StreamingHttpResponse(
+            lines,
+            content_type=CONTENT_TYPES[self.format])
+        if self.format == 'csv':
+            response['Content-Disposition'] = (
+                'attachment; filename="{}.csv"'.format(
+                    self.model._meta.verbose_name_plural))
+        if cursor:
+            params = request.GET.copy()
+            params['after'] = cursor
+            response['X-Next-Cursor'] = cursor
+            response['Link'] = '<{}?{}>; rel="next"'.format(
+                request.build_absolute_uri(request.path),
+                params.urlencode())
+        return response
+
+    def format_rows(self):
+        """
+        Returns a function that formats a row as a line, and the
+        header line, if there is one.
+        """
+        fields = self.get_fields()
+        if self.format == 'csv':
+            writer = csv.writer(Echo())
+
+            def format_row(row):
+                return writer.writerow([row[f] for f in fields])
+            return format_row, writer.writerow(fields)
+
+        encoder = DjangoJSONEncoder()
+
+        def format_row(row):
+            return encoder.encode(row) + '\n'
+        return format_row, None
+
+    def lines(self, rows):
+        format_row, header = self.format_rows()
+        if header:
+            yield header
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield format_row(row)
+
+    async def alines(self, rows):
+        format_row, header = self.format_rows()
+        if header:
+            yield header
+        async for row in rows.aiterator(chunk_size=CHUNK_SIZE):
+            yield format_row(row)
+
+
+class ContributionExportView(ExportView):
+    model = Contribution
+    date_field = 'contribution_date'
+    state_field = 'contributor_address_state'
+
+
+class ExpenditureExportView(ExportView):
+    model = Expenditure
+    date_field = 'expenditure_date'
+    state_field = 'recipient_address_state'
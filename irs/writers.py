@@ -0,0 +1,361 @@
+import io
+import queue
+import threading
+from django.db import connection
+from irs.models import F8872, Contribution, Expenditure, Committee
+
+# Number of rows sent to the database in each INSERT statement
+BATCH_SIZE = 1000
+
+
+class ParsedRow:
+    """
+    A contribution or expenditure as the converters cleaned it: its
+    values in mapping order, the names of the fields they go in, and
+    the keys the loader gave its filing and committee. COPY sends the
+    values as they are, so model instances are only built for the ORM.
+    """
+
+    __slots__ = (
+        'fields', 'values', 'form_id_number', 'filing_id', 'committee_id')
+
+    def __init__(self, fields, values, form_id_number, filing_id=None,
+                 committee_id=None):
+        self.fields = fields
+        self.values = values
+        self.form_id_number = form_id_number
+        self.filing_id = filing_id
+        self.committee_id = committee_id
+
+    def as_object(self, model):
+        """
+        Builds an instance of the model, which gives the fields the
+        row doesn't have their defaults.
+        """
+        obj = model(**dict(zip(self.fields, self.values)))
+        obj.filing_id = self.filing_id
+        obj.committee_id = self.committee_id
+        return obj
+
+
+class ORMWriter:
+    """
+    Saves batches of parsed filings, contributions and expenditures
+    through the Django ORM. Works on any database backend.
+    """
+
+    def save_committees(self, filings, names=None):
+        """
+        Attaches a committee to each filing, creating any committees
+        that don't exist yet. New committees are named from `names`,
+        which maps EINs to names, or else by the first filing seen
+        for them, and take the key the loader gave the filing's
+        committee, if it gave one.
+        """
+        names = names or {}
+        committees = {}
+        for filing in filings:
+            if filing.EIN not in committees:
+                committees[filing.EIN] = Committee(
+                    id=filing.committee_id,
+                    EIN=filing.EIN,
+                    name=names.get(filing.EIN, filing.organization_name))
+        # Committees that already exist keep their name. They're
+        # inserted in order of EIN, so that threads inserting the same
+        # new committees take their locks in the same order and can't
+        # deadlock
+        Committee.objects.bulk_create(
+            [committees[EIN] for EIN in sorted(committees)],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True)
+
+        # Filings without a committee key are looked up by EIN
+        missing = set(f.EIN for f in filings if f.committee_id is None)
+        if missing:
+            keys = dict(Committee.objects.filter(
+                EIN__in=missing).values_list('EIN', 'pk'))
+            for filing in filings:
+                if filing.committee_id is None:
+                    filing.committee_id = keys[filing.EIN]
+
+    def save_filings(self, filings):
+        """
+        Inserts filings, replacing any that already exist.
+        """
+        F8872.objects.bulk_create(
+            filings,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['form_id_number'],
+            update_fields=[
+                f.name for f in F8872._meta.concrete_fields
+                if not f.primary_key])
+
+    def save_contributions(self, contributions):
+        Contribution.objects.bulk_create(
+            [row.as_object(Contribution) for row in contributions])
+
+    def save_expenditures(self, expenditures):
+        Expenditure.objects.bulk_create(
+            [row.as_object(Expenditure) for row in expenditures])
+
+    def write(self, filings, contributions, expenditures, names=None):
+        """
+        Saves a batch of F8872 instances and ParsedRows of
+        contributions and expenditures. Should be called inside a
+        transaction.
+        """
+        self.save_committees(filings, names)
+        # If a filing appears more than once, the last one wins
+        filings = list(dict(
+            (f.form_id_number, f) for f in filings).values())
+        self.save_filings(filings)
+        self.save_contributions(contributions)
+        self.save_expenditures(expenditures)
+
+
+def copy_value(value):
+    """
+    Formats a value for PostgreSQL's COPY text format.
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    return str(value).replace(
+        '\\', '\\\\').replace(
+        '\t', '\\t').replace(
+        '\n', '\\n').replace(
+        '\r', '\\r')
+
+
+class CopyWriter(ORMWriter):
+    """
+    Saves batches with PostgreSQL's COPY ... FROM STDIN, which is much
+    faster than multi-row INSERT statements for large loads.
+    Committees are few, so they're still inserted with ON CONFLICT DO
+    NOTHING, which is safe when several threads are writing.
+    """
+
+    def get_fields(self, model, objs=None):
+        """
+        Returns the concrete fields of a model that are written by COPY,
+        leaving out auto-incrementing primary keys so that the
+        database assigns them, unless the loader already has.
+        """
+        has_keys = bool(objs) and objs[0].pk is not None
+        return [
+            f for f in model._meta.concrete_fields
+            if has_keys or not (f.primary_key and f.get_internal_type() in (
+                'AutoField', 'BigAutoField', 'SmallAutoField'))]
+
+    def get_default(self, field):
+        """
+        Returns the default of a field, formatted for COPY.
+        """
+        return copy_value(
+            field.get_db_prep_save(field.get_default(), connection))
+
+    def send(self, table, fields, buf):
+        """
+        Runs COPY ... FROM STDIN into the given columns of a table,
+        reading the rows from a buffer.
+        """
+        buf.seek(0)
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            connection.ops.quote_name(table),
+            ', '.join(connection.ops.quote_name(f.column) for f in fields))
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, 'copy_expert'):
+                # psycopg2
+                raw_cursor.copy_expert(sql, buf)
+            else:
+                # psycopg 3
+                with raw_cursor.copy(sql) as copy:
+                    copy.write(buf.getvalue())
+
+    def copy(self, model, objs, table=None):
+        """
+        Streams a list of model instances into the model's table, or
+        into another table with the same columns.
+        """
+        if not objs:
+            return
+        fields = self.get_fields(model, objs)
+        buf = io.StringIO()
+        for obj in objs:
+            buf.write('\t'.join(
+                copy_value(f.get_db_prep_save(
+                    getattr(obj, f.attname), connection))
+                for f in fields))
+            buf.write('\n')
+        self.send(table or model._meta.db_table, fields, buf)
+
+    def copy_rows(self, model, rows):
+        """
+        Streams ParsedRows into the model's table straight from the
+        values the converters produced, followed by the keys of their
+        filing and committee. Fields that aren't in the archive, or
+        are missing from a short row, get their defaults.
+        """
+        if not rows:
+            return
+        opts = model._meta
+        # Every row of a model is cleaned with the same mapping
+        mapped = [opts.get_field(name) for name in rows[0].fields]
+        keys = [opts.get_field('filing'), opts.get_field('committee')]
+        others = [
+            f for f in self.get_fields(model)
+            if f not in mapped and f not in keys]
+        padding = [self.get_default(f) for f in mapped]
+        defaults = [self.get_default(f) for f in others]
+        width = len(mapped)
+
+        buf = io.StringIO()
+        for row in rows:
+            values = [copy_value(value) for value in row.values]
+            if len(values) < width:
+                values.extend(padding[len(values):])
+            values.append(copy_value(row.filing_id))
+            values.append(copy_value(row.committee_id))
+            values.extend(defaults)
+            buf.write('\t'.join(values))
+            buf.write('\n')
+        self.send(opts.db_table, mapped + keys + others, buf)
+
+    def save_filings(self, filings):
+        """
+        Copies filings into a temporary table and upserts them from
+        there, since COPY can't update rows. Filings that already exist
+        are updated in place, like the ORM writer does, so the rows
+        already saved for them are kept.
+        """
+        if not filings:
+            return
+        qn = connection.ops.quote_name
+        table = qn(F8872._meta.db_table)
+        temp_table = qn(F8872._meta.db_table + '_copy')
+        columns = [qn(f.column) for f in self.get_fields(F8872, filings)]
+        updated = [
+            qn(f.column) for f in F8872._meta.concrete_fields
+            if not f.primary_key]
+        with connection.cursor() as cursor:
+            # Only the copied columns, without constraints
+            cursor.execute(
+                'CREATE TEMPORARY TABLE {} ON COMMIT DROP AS '
+                'SELECT {} FROM {} WITH NO DATA'.format(
+                    temp_table, ', '.join(columns), table))
+            self.copy(F8872, filings, F8872._meta.db_table + '_copy')
+            cursor.execute(
+                'INSERT INTO {0} ({1}) SELECT {1} FROM {2} '
+                'ON CONFLICT ({3}) DO UPDATE SET {4}'.format(
+                    table,
+                    ', '.join(columns),
+                    temp_table,
+                    qn('form_id_number'),
+                    ', '.join(
+                        '{0} = EXCLUDED.{0}'.format(c) for c in updated)))
+            cursor.execute('DROP TABLE {}'.format(temp_table))
+
+    def save_contributions(self, contributions):
+        self.copy_rows(Contribution, contributions)
+
+    def save_expenditures(self, expenditures):
+        self.copy_rows(Expenditure, expenditures)
+
+
+def get_writer():
+    """
+    Returns the fastest writer available for the default database.
+    """
+    if connection.vendor == 'postgresql':
+        return CopyWriter()
+    return ORMWriter()
+
+
+class WriterThreads:
+    """
+    Saves batches in background threads while the caller goes on
+    parsing. Each thread has its own database connection. Batches wait
+    in a bounded queue, so parsing blocks when the writers fall behind,
+    and the first error raised by `save` in a thread is raised again
+    in the caller. If `initializer` is given, each thread calls it
+    before it saves anything.
+    """
+
+    def __init__(self, save, threads=1, maxsize=None, initializer=None):
+        self.save = save
+        self.initializer = initializer
+        self.queue = queue.Queue(maxsize or threads * 2)
+        self.error = None
+        self.cancelled = False
+        self.threads = [
+            threading.Thread(target=self.run, daemon=True)
+            for i in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def run(self):
+        try:
+            if self.initializer is not None:
+                try:
+                    self.initializer()
+                except BaseException as e:
+                    self.error = e
+            while True:
+                batch = self.queue.get()
+                try:
+                    if batch is None:
+                        return
+                    # After an error the rest of the batches are dropped
+                    if self.error is None and not self.cancelled:
+                        self.save(*batch)
+                except BaseException as e:
+                    if self.error is None:
+                        self.error = e
+                finally:
+                    self.queue.task_done()
+        finally:
+            connection.close()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def put(self, *batch):
+        """
+        Queues a batch to be saved, waiting for room in the queue.
+        """
+        while True:
+            self.raise_error()
+            try:
+                self.queue.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def wait(self):
+        """
+        Waits until every queued batch has been saved.
+        """
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.cancelled = True
+        self.close()
+        if exc_type is None:
+            self.raise_error()
@@ -26,7 +26,30 @@ class TestCommand(Command):
                     'ENGINE': 'django.db.backends.sqlite3'
                 }
             },
-            INSTALLED_APPS=('irs',),
+            INSTALLED_APPS=(
+                'django.contrib.admin',
+                'django.contrib.auth',
+                'django.contrib.contenttypes',
+                'django.contrib.sessions',
+                'django.contrib.messages',
+                'irs',
+            ),
+            MIDDLEWARE=(
+                'django.contrib.sessions.middleware.SessionMiddleware',
+                'django.contrib.auth.middleware.AuthenticationMiddleware',
+                'django.contrib.messages.middleware.MessageMiddleware',
+            ),
+            TEMPLATES=[{
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'APP_DIRS': True,
+                'OPTIONS': {
+                    'context_processors': (
+                        'django.template.context_processors.request',
+                        'django.contrib.auth.context_processors.auth',
+                        'django.contrib.messages.context_processors.messages',
+                    ),
+                },
+            }],
             USE_TZ=True,
             SECRET_KEY='test-secret-key-for-testing-only',
             DEFAULT_AUTO_FIELD='django.db.models.BigAutoField',
@@ -70,6 +93,7 @@ setup(
     extras_require={
         'postgres': ['psycopg2-binary>=2.9.9'],
         'mysql': ['mysqlclient>=2.2.0'],
+        'zstd': ['zstandard>=0.22.0'],
         'test': ['coverage>=7.4.0', 'agate>=1.9.0', 'subsample>=0.1.0'],
     },
     cmdclass={